@@ -0,0 +1,123 @@
+"""
+JWKS cache for verifying Cognito access tokens
+
+Fetching the user pool JWKS and rebuilding the RSA key from its JWK on every decode adds an HTTP round trip to every
+authenticated request. The cache holds the parsed public keys by kid and refetches the JWKS when it is older than the
+TTL. A kid that is not cached triggers one refresh, since Cognito may have rotated its keys, but refreshes for unknown
+kids are rate limited by a cooldown so tokens with made up kids cannot turn every request into a fetch.
+
+Refreshes are single flight: concurrent misses wait on one fetch instead of each fetching. If a refresh fails the
+keys already cached keep being served, so a Cognito outage does not fail tokens signed with known keys. A failed
+refresh is not retried until the cooldown has passed, so lookups during an outage serve the stale keys instead of each
+waiting on a fetch that is likely to fail again.
+
+Resource
+--------
+- https://docs.aws.amazon.com/cognito/latest/developerguide/amazon-cognito-user-pools-using-tokens-verifying-a-jwt.html
+
+Author: Tom Aston
+"""
+
+import json
+import time
+from threading import Lock
+from typing import Any, Callable
+
+import jwt.algorithms
+
+
+class JwksCache:
+    """
+    Parsed JWKS public keys by kid with TTL and single flight refresh
+    """
+
+    def __init__(
+        self,
+        fetch_keys: Callable[[], list[dict[str, Any]]],
+        ttl_seconds: float,
+        refresh_cooldown_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """initialise the cache
+
+        Args:
+            fetch_keys (Callable[[], list[dict[str, Any]]]): fetches the keys of the JWKS
+            ttl_seconds (float): seconds the fetched keys are used before they are refetched
+            refresh_cooldown_seconds (float): minimum seconds between refreshes for an unknown kid or after a failed refresh
+            clock (Callable[[], float]): monotonic clock, replaceable in tests
+        """
+        self._fetch_keys = fetch_keys
+        self.ttl_seconds = ttl_seconds
+        self.refresh_cooldown_seconds = refresh_cooldown_seconds
+        self._clock = clock
+        self._keys: dict[str, Any] = {}
+        self._fetched_at: float | None = None
+        self._failed_at: float | None = None
+        self._refreshes = 0
+        self._refresh_lock = Lock()
+
+    def get_key(self, kid: str) -> Any | None:
+        """get the public key for a kid, refreshing the JWKS if it has expired or the kid is unknown
+
+        Args:
+            kid (str): key id from the token header
+
+        Raises:
+            Exception: raised if a refresh fails, or failed within the cooldown, and the kid is not cached
+
+        Returns:
+            Any | None: public key, None if the JWKS has no key with the kid
+        """
+        keys, fetched_at, refreshes = self._keys, self._fetched_at, self._refreshes
+        now = self._clock()
+
+        if fetched_at is not None and now - fetched_at < self.ttl_seconds:
+            if kid in keys:
+                return keys[kid]
+            if now - fetched_at < self.refresh_cooldown_seconds:
+                return None
+
+        try:
+            self._refresh(refreshes)
+        except Exception:
+            if kid in self._keys:
+                return self._keys[kid]
+            raise
+
+        return self._keys.get(kid)
+
+    def clear(self) -> None:
+        """drop the cached keys so the next lookup fetches the JWKS"""
+        with self._refresh_lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._failed_at = None
+            self._refreshes += 1
+
+    def _refresh(self, seen_refreshes: int) -> None:
+        """fetch and parse the JWKS unless another thread refreshed it since seen_refreshes was read
+
+        Args:
+            seen_refreshes (int): refresh count when the caller found the cache stale
+
+        Raises:
+            RuntimeError: raised if the last refresh failed within the cooldown
+            Exception: raised if fetching or parsing the JWKS fails
+        """
+        with self._refresh_lock:
+            if self._refreshes != seen_refreshes and self._fetched_at is not None:
+                return
+            if self._failed_at is not None and self._clock() - self._failed_at < self.refresh_cooldown_seconds:
+                raise RuntimeError("JWKS refresh failed recently, not retrying until the cooldown has passed")
+
+            try:
+                keys = {key["kid"]: jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key)) for key in self._fetch_keys()}
+            except Exception:
+                self._failed_at = self._clock()
+                raise
+
+            # swap in the new keys in one assignment so readers never see a partial set
+            self._keys = keys
+            self._fetched_at = self._clock()
+            self._failed_at = None
+            self._refreshes += 1
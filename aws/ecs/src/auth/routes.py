@@ -9,7 +9,7 @@ Author: Tom Aston
 from fastapi import APIRouter, Depends
 
 from .model import Token, User
-from .service import AuthService, oauth2_scheme
+from .service import AuthService, get_current_claims, oauth2_scheme
 
 auth_router = APIRouter()
 
@@ -82,13 +82,13 @@ def reset_password(user: User) -> dict[str, str]:
 
 
 @auth_router.get("/current_user", response_model=str)
-def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
+async def get_current_user(claims: dict = Depends(get_current_claims)) -> str:
     """route to get the current user
 
     Args:
-        token (str, optional): JWT token. Defaults to Depends(oauth2_scheme).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
 
     Returns:
         str: username
     """
-    return auth_service.get_current_user(token)
+    return auth_service.get_current_user(claims)
@@ -5,17 +5,24 @@ The authentication service module provides the functionality to sign up, sign in
 and log out a user from the Cognito user pool. The purpose of the module is to provide the business logic for the
 authentication routes.
 
+get_current_claims is the auth dependency of the protected routes. It validates the bearer token and injects its
+claims, serving tokens verified before from the verified token cache on the event loop and verifying new tokens on the
+threadpool, as a first verification may fetch the JWKS.
+
 Author: Tom Aston
 """
 
 import boto3
+import jwt
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from mypy_boto3_cognito_idp import CognitoIdentityProviderClient
 from src.config import config_manager
-from src.errors import NotAuthorisedException, ServerException, UserAlreadyExistsException
+from src.errors import InvalidTokenException, NotAuthorisedException, ServerException, UserAlreadyExistsException
 
 from .model import Token, User
-from .utils import decode_jwt, get_secret_hash
+from .utils import decode_jwt, get_cached_claims, get_secret_hash, verified_token_cache
 
 COGNITO_CLIENT_ID = config_manager.COGNITO_USER_POOL_CLIENT_ID
 COGNITO_REGION = config_manager.COGNITO_USER_POOL_REGION
@@ -25,6 +32,34 @@ COGNITO_CLIENT_SECRET = config_manager.COGNITO_CLIENT_SECRET
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+async def get_current_claims(token: str = Depends(oauth2_scheme)) -> dict:
+    """auth dependency validating the bearer token and injecting its claims
+    FastAPI caches dependencies per request, so the token is validated once however many dependants use it
+
+    Args:
+        token (str, optional): JWT token. Defaults to Depends(oauth2_scheme).
+
+    Raises:
+        InvalidTokenException: raised when the token is malformed, has no kid, is signed with an unknown key, expired or
+            revoked
+        AccessTokenException: raised when the token is not an access token
+        ServiceUnavailableException: raised when the JWKS cannot be fetched to verify the token
+        ServerException: raised when there is an internal server error
+
+    Returns:
+        dict: verified access token claims
+    """
+    claims = get_cached_claims(token)
+    if claims is not None:
+        return claims
+
+    try:
+        return await run_in_threadpool(decode_jwt, token)
+    except (ValueError, KeyError, jwt.InvalidTokenError):
+        # unknown kid or a token that is not a JWT at all
+        raise InvalidTokenException()
+
+
 class AuthService:
     """Authentication service class
 
@@ -129,6 +164,7 @@ class AuthService:
 
     def logout(self, token: str) -> dict[str, str]:
         """log out a user from the Cognito user pool
+        the user's tokens are revoked in the verified token cache so they stop being accepted by this worker
 
         Args:
             token (str, optional): JWT token. Defaults to Depends(oauth2_scheme).
@@ -141,11 +177,12 @@ class AuthService:
         """
         try:
             # will raise an error if the token is invalid
-            decode_jwt(token)
+            decoded_token = decode_jwt(token)
 
             self.cognito_client.global_sign_out(
                 AccessToken=token,
             )
+            verified_token_cache.revoke(decoded_token)
             return {"message": f"Successfully logged out"}
         except Exception as e:
             raise ServerException("An error occurred while logging out the user")
@@ -176,14 +213,13 @@ class AuthService:
         except Exception as e:
             raise ServerException("An error occurred while resetting the user's password")
 
-    def get_current_user(self, token: str) -> str:
+    def get_current_user(self, claims: dict) -> str:
         """get the current user
 
         Args:
-            token (str, optional): JWT token. Defaults to Depends(oauth2_scheme).
+            claims (dict): verified access token claims
 
         Returns:
             str: username
         """
-        decoded_token = decode_jwt(token)
-        return decoded_token["username"]
+        return claims["username"]
@@ -0,0 +1,133 @@
+"""
+Verified access token cache
+
+Dashboards send the same access token with every request, and verifying its RS256 signature each time is the most
+expensive part of authenticating a request. Once a token has been verified its claims are cached under the SHA-256
+digest of the token until the token's exp, so later requests with the token cost a hash and a dict lookup. The cache is
+a bounded LRU, the least recently used tokens are evicted first.
+
+Cognito access tokens stay cryptographically valid after GlobalSignOut, so logging out records the time the user's
+tokens were revoked. Cached tokens of the user are dropped and tokens issued before the revocation are rejected,
+whether cached or freshly verified, until the longest Cognito access token lifetime has passed. iat has whole second
+precision, so the revocation is recorded in whole seconds and a token issued in the second of the sign out is accepted,
+otherwise logging in again right after logging out would be rejected. Revocations are held per worker, a token signed
+out through another worker is rejected here once it expires.
+
+Author: Tom Aston
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable
+
+# longest access token validity a Cognito app client can be configured with
+MAX_ACCESS_TOKEN_LIFETIME_SECONDS = 24 * 60 * 60
+
+
+class VerifiedTokenCache:
+    """
+    LRU cache of verified token claims by token digest, valid until the token expires
+    """
+
+    def __init__(self, max_entries: int, clock: Callable[[], float] = time.time) -> None:
+        """initialise the cache
+
+        Args:
+            max_entries (int): maximum number of cached tokens, 0 disables the cache
+            clock (Callable[[], float]): wall clock in epoch seconds, compared with the token exp and iat
+        """
+        self.max_entries = max_entries
+        self._clock = clock
+        self._claims: OrderedDict[bytes, dict[str, Any]] = OrderedDict()
+        self._revoked_at: dict[str, int] = {}
+        self._lock = Lock()
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        """get the claims of a verified, unexpired and unrevoked token
+
+        Args:
+            token (str): access token
+
+        Returns:
+            dict[str, Any] | None: cached claims, None if the token has to be verified
+        """
+        digest = _digest(token)
+        with self._lock:
+            claims = self._claims.get(digest)
+            if claims is None:
+                return None
+            if claims["exp"] <= self._clock():
+                del self._claims[digest]
+                return None
+            self._claims.move_to_end(digest)
+            return claims
+
+    def put(self, token: str, claims: dict[str, Any]) -> None:
+        """cache the claims of a verified token, tokens without an exp are not cached
+
+        Args:
+            token (str): access token
+            claims (dict[str, Any]): verified claims
+        """
+        if self.max_entries <= 0 or "exp" not in claims:
+            return
+
+        digest = _digest(token)
+        with self._lock:
+            self._claims[digest] = claims
+            self._claims.move_to_end(digest)
+            while len(self._claims) > self.max_entries:
+                self._claims.popitem(last=False)
+
+    def is_revoked(self, claims: dict[str, Any]) -> bool:
+        """check whether the token was issued before the second of a sign out of its user
+
+        Args:
+            claims (dict[str, Any]): verified claims
+
+        Returns:
+            bool: True if the token has been revoked
+        """
+        revoked_at = self._revoked_at.get(claims.get("sub"))
+        return revoked_at is not None and claims.get("iat", 0) < revoked_at
+
+    def revoke(self, claims: dict[str, Any]) -> None:
+        """revoke every token of the user the claims belong to, as GlobalSignOut does
+
+        Args:
+            claims (dict[str, Any]): verified claims of a token of the user
+        """
+        sub = claims.get("sub")
+        if sub is None:
+            return
+
+        now = self._clock()
+        with self._lock:
+            self._revoked_at = {
+                user: revoked_at
+                for user, revoked_at in self._revoked_at.items()
+                if now - revoked_at < MAX_ACCESS_TOKEN_LIFETIME_SECONDS
+            }
+            self._revoked_at[sub] = int(now)
+            for digest in [digest for digest, cached in self._claims.items() if cached.get("sub") == sub]:
+                del self._claims[digest]
+
+    def clear(self) -> None:
+        """drop every cached token and revocation"""
+        with self._lock:
+            self._claims.clear()
+            self._revoked_at = {}
+
+
+def _digest(token: str) -> bytes:
+    """digest a token so the cache does not hold the tokens themselves
+
+    Args:
+        token (str): access token
+
+    Returns:
+        bytes: SHA-256 digest of the token
+    """
+    return hashlib.sha256(token.encode()).digest()
@@ -2,7 +2,8 @@
 Helper functions for authentication including decoding JWT tokens and creating JWT tokens.
 
 The get public keys function gets the public keys from AWS Cognito and the decode JWT function
-decodes the JWT token. The get secret hash function gets the secret hash for the user and the create
+decodes the JWT token, with the parsed public keys held in a JWKS cache between decodes and the claims of verified
+tokens held in a verified token cache until they expire. The get secret hash function gets the secret hash for the user and the create
 JWT token function creates a JWT token for the user.
 
 Author: Tom Aston
@@ -11,7 +12,6 @@ Author: Tom Aston
 import base64
 import hashlib
 import hmac
-import json
 from datetime import datetime, timedelta
 
 import jwt
@@ -19,12 +19,19 @@ import jwt.algorithms
 import requests
 from fastapi import HTTPException
 from src.config import config_manager
-from src.errors import AccessTokenException, InvalidTokenException, ServerException
+from src.errors import AccessTokenException, InvalidTokenException, ServerException, ServiceUnavailableException
+
+from .jwks import JwksCache
+from .token_cache import VerifiedTokenCache
 
 USER_POOL_ID = config_manager.COGNITO_USER_POOL_ID
 CLIENT_ID = config_manager.COGNITO_USER_POOL_CLIENT_ID
 COGNITO_REGION = config_manager.COGNITO_USER_POOL_REGION
-COGNITO_KEYS_URL = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json"
+COGNITO_KEYS_URL = (
+    config_manager.COGNITO_JWKS_URL
+    or f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json"
+)
+COGNITO_KEYS_TIMEOUT_SECONDS = 5
 
 
 def get_cognito_public_keys() -> dict:
@@ -34,11 +41,41 @@ def get_cognito_public_keys() -> dict:
     Returns:
         dict: public keys
     """
-    return requests.get(COGNITO_KEYS_URL).json()["keys"]
+    response = requests.get(COGNITO_KEYS_URL, timeout=COGNITO_KEYS_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()["keys"]
+
+
+# looked up on each refresh so get_cognito_public_keys can be patched
+jwks_cache = JwksCache(
+    fetch_keys=lambda: get_cognito_public_keys(),
+    ttl_seconds=config_manager.JWKS_CACHE_TTL_SECONDS,
+    refresh_cooldown_seconds=config_manager.JWKS_REFRESH_COOLDOWN_SECONDS,
+)
+verified_token_cache = VerifiedTokenCache(max_entries=config_manager.VERIFIED_TOKEN_CACHE_MAX_ENTRIES)
+
+
+def get_cached_claims(token: str) -> dict | None:
+    """get the claims of a token verified before without verifying it again
+
+    Args:
+        token (str): jwt token
+
+    Raises:
+        InvalidTokenException: raised when the cached token has been revoked by a sign out
+
+    Returns:
+        dict | None: cached claims, None if the token has to be decoded with decode_jwt
+    """
+    cached_token = verified_token_cache.get(token)
+    if cached_token is not None and verified_token_cache.is_revoked(cached_token):
+        raise InvalidTokenException()
+    return cached_token
 
 
 def decode_jwt(token: str) -> dict:
     """decode the JWT token from AWS Cognito
+    tokens verified before are served from the verified token cache without checking the signature again
 
     Args:
         token (str): jwt token
@@ -46,23 +83,31 @@ def decode_jwt(token: str) -> dict:
     Raises:
         ValueError: raised when the public key is not found in the JWKs
         AccessTokenException: raised when the token use is not access token
-        InvalidTokenException: raised when the token is invalid due to expired signature or invalid token
+        InvalidTokenException: raised when the token is invalid due to expired signature, invalid token, a header
+            without a kid or sign out
+        ServiceUnavailableException: raised when the JWKS cannot be fetched and the kid is not cached
         ServerException: raised when there is an internal server error
 
     Returns:
         dict: decoded token
     """
-    keys = get_cognito_public_keys()
+    cached_token = get_cached_claims(token)
+    if cached_token is not None:
+        return cached_token
+
     header = jwt.get_unverified_header(token)
+    if "kid" not in header:
+        raise InvalidTokenException()
 
-    # Find the matching key
-    key = next((key for key in keys if key["kid"] == header["kid"]), None)
-    if key is None:
+    # Find the matching key, parsed from its JWK when the JWKS was fetched
+    try:
+        public_key = jwks_cache.get_key(header["kid"])
+    except Exception:
+        # the JWKS endpoint is down or failed within the refresh cooldown, the token itself may be valid
+        raise ServiceUnavailableException()
+    if public_key is None:
         raise ValueError("Public key not found in JWKs")
 
-    # Convert the JWK to PEM format
-    public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key))
-
     try:
         # Decode and verify the token
         decoded_token: dict = jwt.decode(
@@ -74,13 +119,16 @@ def decode_jwt(token: str) -> dict:
 
         if decoded_token.get("token_use") != "access":
             raise AccessTokenException()
+        if verified_token_cache.is_revoked(decoded_token):
+            raise InvalidTokenException()
 
+        verified_token_cache.put(token, decoded_token)
         return decoded_token
     except jwt.ExpiredSignatureError as ese:
         raise InvalidTokenException()
     except jwt.InvalidTokenError as ite:
         raise InvalidTokenException()
-    except AccessTokenException as ate:
+    except (AccessTokenException, InvalidTokenException) as ate:
         raise ate
     except Exception as e:
         raise ServerException()
@@ -45,6 +45,24 @@ class ConfigManager(BaseSettings):
     DB_TABLE_NAME: str
     DYNAMODB_ENDPOINT: str = "http://localhost:9000"
     DYNAMODB_REGION: str
+    DB_EXECUTOR_MAX_WORKERS: int = 64  # threads running blocking DynamoDB calls for the async routes
+    SCAN_MAX_SEGMENTS: int = 8  # upper bound on parallel scan segments (one thread and connection each)
+    SCAN_SEGMENT_SIZE_BYTES: int = 128 * 1024 * 1024  # table bytes read by each parallel scan segment
+    BATCH_CREATE_MAX_ITEMS: int = 10_000  # largest POST /cpu_metrics/batch request
+    # largest POST /cpu_metrics/batch_get or /cpu_metrics/batch_delete request, one BatchGetItem page, as each id
+    # costs an IdIndex query on the shared scan pool before its item is read or deleted
+    BATCH_IDS_MAX_ITEMS: int = 100
+    BATCH_CONCURRENCY: int = 8  # BatchGetItem and BatchWriteItem chunks run at once (one thread and connection each)
+    BATCH_MAX_ATTEMPTS: int = 8  # BatchGetItem or BatchWriteItem calls per chunk before its unprocessed items fail
+    IMPORT_CHUNK_ROWS: int = 1_000  # upload lines parsed, validated and written together by POST /cpu_metrics/import
+    IMPORT_MAX_PENDING_CHUNKS: int = 2  # import chunks written at once before reading the upload waits
+    IMPORT_MAX_LINE_BYTES: int = 64 * 1024  # longest upload line accepted
+    IMPORT_MAX_REPORTED_ERRORS: int = 100  # row errors listed in an import result, later ones are only counted
+    EXPORT_ROW_GROUP_ROWS: int = 50_000  # cpu metrics buffered into each row group of a GET /cpu_metrics/export Parquet
+    RETENTION_DAYS: int | None = None  # days created cpu metrics are kept before TTL removes them, as for the lambda
+
+    QUERY_CACHE_TTL_SECONDS: int = 30  # seconds a GET /cpu_metrics result is served from memory, 0 disables
+    QUERY_CACHE_MAX_ITEMS: int = 100_000  # cpu metrics held in the query cache across all entries, 0 disables
 
     # Postgres User config-------------------------------
     POSTGRES_PASSWORD: str
@@ -73,6 +91,13 @@ class ConfigManager(BaseSettings):
     COGNITO_USER_POOL_REGION: str
     COGNITO_JWT_SECRET: str
     COGNITO_CLIENT_SECRET: str
+    COGNITO_JWKS_URL: str | None = None  # overrides the user pool JWKS URL, e.g. a local JWKS stand-in
+    JWKS_CACHE_TTL_SECONDS: int = 6 * 60 * 60  # seconds the parsed JWKS keys are used before they are refetched
+    JWKS_REFRESH_COOLDOWN_SECONDS: int = 30  # minimum seconds between refetches for tokens with an unknown kid
+    VERIFIED_TOKEN_CACHE_MAX_ENTRIES: int = 10_000  # verified access tokens cached until they expire, 0 disables
+
+    # Pagination config---------------------------------
+    PAGINATION_CURSOR_SECRET: str | None = None  # signs page cursors, falls back to COGNITO_JWT_SECRET
 
     # Test config---------------------------------------
     TEST_USERNAME: str
@@ -0,0 +1,50 @@
+"""
+Time-bucket aggregation of CPU metrics
+
+The samples are loaded into NumPy arrays once and grouped by bucket start with pandas, so the aggregates are computed
+in vectorised code rather than Python loops. The result is returned as parallel arrays, one entry per bucket, which is
+far smaller than the raw samples a chart would otherwise download and aggregate itself.
+
+Author: Tom Aston
+"""
+
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from pandas.api.typing import SeriesGroupBy
+
+# vectorised groupby reduction for each API aggregation name
+_GROUPED_AGGREGATIONS: dict[str, Callable[[SeriesGroupBy], pd.Series]] = {
+    "avg": lambda grouped: grouped.mean(),
+    "min": lambda grouped: grouped.min(),
+    "max": lambda grouped: grouped.max(),
+    "p95": lambda grouped: grouped.quantile(0.95),
+}
+
+
+def aggregate_cpu_usage(items: list[dict[str, Any]], bucket_seconds: int, aggregations: list[str]) -> dict[str, list]:
+    """aggregate the cpu usage of the items into fixed size time buckets
+
+    Args:
+        items (list[dict[str, Any]]): cpu metric items with timestamp and cpu_usage
+        bucket_seconds (int): bucket size in seconds, buckets start on multiples of it
+        aggregations (list[str]): aggregations to compute from avg, min, max and p95
+
+    Returns:
+        dict[str, list]: bucket_start and count arrays and one array per aggregation, ordered by bucket start
+    """
+    if not items:
+        return {"bucket_start": [], "count": [], **{aggregation: [] for aggregation in aggregations}}
+
+    timestamps = np.fromiter((item["timestamp"] for item in items), dtype=np.int64, count=len(items))
+    cpu_usage = np.fromiter((item["cpu_usage"] for item in items), dtype=np.float64, count=len(items))
+
+    grouped = pd.Series(cpu_usage).groupby(timestamps // bucket_seconds * bucket_seconds, sort=True)
+    counts = grouped.count()
+
+    result: dict[str, list] = {"bucket_start": counts.index.tolist(), "count": counts.tolist()}
+    for aggregation in aggregations:
+        result[aggregation] = _GROUPED_AGGREGATIONS[aggregation](grouped).round(3).tolist()
+
+    return result
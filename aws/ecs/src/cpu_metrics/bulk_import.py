@@ -0,0 +1,271 @@
+"""
+Streaming bulk import of CPU metrics from NDJSON or CSV uploads
+
+POST /cpu_metrics/batch takes a JSON array, which FastAPI reads and validates whole, so restoring a large export through
+it holds the entire file and every parsed metric in memory. The import instead reads the request body as it arrives,
+splits it into lines and parses and validates the lines in chunks with CpuMetricCreateSchema on the threadpool. Each
+validated chunk is handed to the batch writer while the next one is parsed, so parsing overlaps the DynamoDB writes.
+
+At most IMPORT_MAX_PENDING_CHUNKS chunks are being written at once, reading the body waits for a write to finish
+beyond that, so memory is bounded by the chunk size and the number of chunks in flight whatever the size of the upload.
+The result holds counts and the first IMPORT_MAX_REPORTED_ERRORS row errors rather than a result per row.
+
+NDJSON uploads hold one cpu metric object per line. CSV uploads start with a header row of CpuMetricCreateSchema field
+names and hold one cpu metric per line, so quoted values cannot span lines. Empty CSV values are treated as missing.
+
+Author: Tom Aston
+"""
+
+import asyncio
+import csv
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, List
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from ..config import config_manager
+from ..errors import InvalidRequestException, UnsupportedMediaTypeException
+from .schemas import CpuMetricBatchCreateResultSchema, CpuMetricCreateSchema, CpuMetricImportResultSchema
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+IMPORT_MEDIA_TYPES = (NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE)
+
+WriteChunk = Callable[[List[CpuMetricCreateSchema]], Awaitable[CpuMetricBatchCreateResultSchema]]
+
+
+class _ImportTotals:
+    """
+    Running counts and reported row errors of an import
+    """
+
+    def __init__(self, max_reported_errors: int) -> None:
+        """initialise the totals
+
+        Args:
+            max_reported_errors (int): row errors kept for the result, later ones are only counted
+        """
+        self.max_reported_errors = max_reported_errors
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors: list[dict[str, Any]] = []
+
+    def add_error(self, line: int, error: str) -> None:
+        """count a failed row and keep its error while under the reporting cap
+
+        Args:
+            line (int): line number of the row in the upload
+            error (str): reason the row was not imported
+        """
+        self.failed += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({"line": line, "error": error})
+
+    def add_written(self, line_numbers: list[int], written: CpuMetricBatchCreateResultSchema) -> None:
+        """count the result of a written chunk
+
+        Args:
+            line_numbers (list[int]): line number of each cpu metric of the chunk
+            written (CpuMetricBatchCreateResultSchema): batch create result of the chunk
+        """
+        self.created += written.created
+        for result in written.results:
+            if result.status == "failed":
+                self.add_error(line_numbers[result.index], result.error or "Not written")
+
+
+async def import_cpu_metrics(
+    body: AsyncIterator[bytes],
+    media_type: str,
+    write_chunk: WriteChunk,
+    chunk_rows: int = config_manager.IMPORT_CHUNK_ROWS,
+    max_pending_chunks: int = config_manager.IMPORT_MAX_PENDING_CHUNKS,
+    max_line_bytes: int = config_manager.IMPORT_MAX_LINE_BYTES,
+    max_reported_errors: int = config_manager.IMPORT_MAX_REPORTED_ERRORS,
+) -> CpuMetricImportResultSchema:
+    """parse, validate and write the cpu metrics of a streamed upload chunk by chunk
+
+    Args:
+        body (AsyncIterator[bytes]): request body as it arrives
+        media_type (str): application/x-ndjson or text/csv
+        write_chunk (WriteChunk): writes a chunk of validated cpu metrics
+        chunk_rows (int): lines parsed, validated and written together
+        max_pending_chunks (int): chunks written at once before reading the body waits
+        max_line_bytes (int): longest line accepted, so a body without newlines cannot be buffered whole
+        max_reported_errors (int): row errors kept for the result
+
+    Raises:
+        UnsupportedMediaTypeException: raised if the media type is not NDJSON or CSV
+        InvalidRequestException: raised if a line is too long or the CSV header is missing or invalid
+
+    Returns:
+        CpuMetricImportResultSchema: row, created and failed counts and the first row errors
+    """
+    if media_type not in IMPORT_MEDIA_TYPES:
+        raise UnsupportedMediaTypeException()
+
+    totals = _ImportTotals(max_reported_errors)
+    pending: set[asyncio.Task] = set()
+    header: list[str] | None = None
+
+    async def write(line_numbers: list[int], cpu_metrics: List[CpuMetricCreateSchema]) -> None:
+        totals.add_written(line_numbers, await write_chunk(cpu_metrics))
+
+    try:
+        async for lines in _line_chunks(body, chunk_rows, max_line_bytes):
+            if media_type == CSV_MEDIA_TYPE and header is None:
+                header, lines = _csv_header(lines)
+
+            parsed = await run_in_threadpool(_parse_chunk, lines, header)
+            line_numbers, cpu_metrics = [], []
+            for line_number, row in parsed:
+                totals.rows += 1
+                if isinstance(row, str):
+                    totals.add_error(line_number, row)
+                else:
+                    line_numbers.append(line_number)
+                    cpu_metrics.append(row)
+
+            if not cpu_metrics:
+                continue
+            while len(pending) >= max_pending_chunks:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()  # re-raise a failed write
+            pending.add(asyncio.create_task(write(line_numbers, cpu_metrics)))
+
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return CpuMetricImportResultSchema(
+        rows=totals.rows, created=totals.created, failed=totals.failed, errors=totals.errors
+    )
+
+
+async def _line_chunks(
+    body: AsyncIterator[bytes], chunk_rows: int, max_line_bytes: int
+) -> AsyncIterator[list[tuple[int, bytes]]]:
+    """split the body into numbered non-blank lines, yielded in chunks of chunk_rows lines
+
+    Args:
+        body (AsyncIterator[bytes]): request body as it arrives
+        chunk_rows (int): lines per chunk
+        max_line_bytes (int): longest line accepted
+
+    Raises:
+        InvalidRequestException: raised if a line is longer than max_line_bytes
+
+    Yields:
+        list[tuple[int, bytes]]: line number and raw line of each line in the chunk
+    """
+    buffer = b""
+    line_number = 0
+    lines: list[tuple[int, bytes]] = []
+
+    async for data in body:
+        *complete, buffer = (buffer + data).split(b"\n")
+        for raw_line in complete:
+            line_number += 1
+            if len(raw_line) > max_line_bytes:
+                raise InvalidRequestException(f"Line {line_number} is longer than {max_line_bytes} bytes")
+            if raw_line.strip():
+                lines.append((line_number, raw_line))
+        if len(buffer) > max_line_bytes:
+            raise InvalidRequestException(f"Line {line_number + 1} is longer than {max_line_bytes} bytes")
+        while len(lines) >= chunk_rows:
+            yield lines[:chunk_rows]
+            lines = lines[chunk_rows:]
+
+    if buffer.strip():
+        lines.append((line_number + 1, buffer))
+    if lines:
+        yield lines
+
+
+def _csv_header(lines: list[tuple[int, bytes]]) -> tuple[list[str], list[tuple[int, bytes]]]:
+    """split the header row off the first chunk of a CSV upload
+
+    Args:
+        lines (list[tuple[int, bytes]]): first chunk of lines
+
+    Raises:
+        InvalidRequestException: raised if the header is not valid UTF-8 or names no CpuMetricCreateSchema field
+
+    Returns:
+        tuple[list[str], list[tuple[int, bytes]]]: column names and the remaining lines of the chunk
+    """
+    (_, raw_header), *lines = lines
+    try:
+        header = next(csv.reader([raw_header.decode("utf-8-sig").rstrip("\r")]))
+    except UnicodeDecodeError:
+        raise InvalidRequestException("CSV header is not valid UTF-8")
+
+    header = [column.strip() for column in header]
+    if not set(header) & set(CpuMetricCreateSchema.model_fields):
+        raise InvalidRequestException("CSV header names no cpu metric fields")
+    return header, lines
+
+
+def _parse_chunk(
+    lines: list[tuple[int, bytes]], header: list[str] | None
+) -> list[tuple[int, CpuMetricCreateSchema | str]]:
+    """parse and validate a chunk of NDJSON lines, or CSV lines if a header is given
+
+    Args:
+        lines (list[tuple[int, bytes]]): line number and raw line of each line in the chunk
+        header (list[str] | None): CSV column names, None for NDJSON
+
+    Returns:
+        list[tuple[int, CpuMetricCreateSchema | str]]: line number and the cpu metric or the reason it is invalid
+    """
+    parsed: list[tuple[int, CpuMetricCreateSchema | str]] = []
+    for line_number, raw_line in lines:
+        try:
+            text = raw_line.decode("utf-8-sig" if line_number == 1 else "utf-8").rstrip("\r")
+            row = json.loads(text) if header is None else _csv_row(text, header)
+            parsed.append((line_number, CpuMetricCreateSchema.model_validate(row)))
+        except UnicodeDecodeError:
+            parsed.append((line_number, "Line is not valid UTF-8"))
+        except json.JSONDecodeError as err:
+            parsed.append((line_number, f"Invalid JSON: {err.msg}"))
+        except ValidationError as err:
+            parsed.append((line_number, "; ".join(_validation_messages(err))))
+        except ValueError as err:
+            parsed.append((line_number, str(err)))
+    return parsed
+
+
+def _csv_row(text: str, header: list[str]) -> dict[str, str]:
+    """map the values of a CSV line to the header columns, leaving out empty values
+
+    Args:
+        text (str): CSV line
+        header (list[str]): column names
+
+    Raises:
+        ValueError: raised if the line has more values than the header has columns
+
+    Returns:
+        dict[str, str]: value by column name
+    """
+    values = next(csv.reader([text]))
+    if len(values) > len(header):
+        raise ValueError(f"Expected at most {len(header)} values, got {len(values)}")
+    return {column: value for column, value in zip(header, values) if value != ""}
+
+
+def _validation_messages(err: ValidationError) -> list[str]:
+    """one message per validation error, prefixed with the field it is for
+
+    Args:
+        err (ValidationError): validation error of a row
+
+    Returns:
+        list[str]: error messages
+    """
+    return [f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in err.errors()]
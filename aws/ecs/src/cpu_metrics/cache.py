@@ -0,0 +1,315 @@
+"""
+In-process result cache for CPU metric queries
+
+Dashboards poll the same GET /cpu_metrics queries from many tabs, and without a cache every call is a full read of the
+table. Results are cached per worker, keyed on the query parameters normalised to the read the service will actually
+run, so equivalent queries (e.g. no filters, or location_value=* with operator=*) share one entry.
+
+Entries expire after a TTL and the least recently used entries are evicted once the cached cpu metrics exceed the size
+cap. Each entry is tagged with what it reads (a location, a device, or * for every item) and writes through the API
+invalidate only the entries whose tags match the written items, so repeat reads cost no DynamoDB capacity and are never
+stale for writes made through this worker. Writes from elsewhere (the ingest lambda or other workers) are picked up
+within the TTL.
+
+Author: Tom Aston
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Hashable, Iterable, NamedTuple
+
+from .schemas import CpuMetricQueryParams
+
+ALL_ITEMS_TAG = "*"
+
+
+class _CacheEntry(NamedTuple):
+    """
+    Cached result with its invalidation tags, expiry and size in cpu metrics
+    """
+
+    value: list[Any]
+    tags: frozenset[str]
+    expires_at: float
+    size: int
+
+
+class QueryResultCache:
+    """
+    TTL and LRU cache of query results with tag based invalidation
+    """
+
+    def __init__(self, ttl_seconds: float, max_items: int, clock: Callable[[], float] = time.monotonic) -> None:
+        """initialise the cache
+
+        Args:
+            ttl_seconds (float): seconds an entry is served for, 0 disables the cache
+            max_items (int): cap on the number of cpu metrics held across all entries, 0 disables the cache
+            clock (Callable[[], float]): monotonic clock, replaceable in tests
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+        self._keys_by_tag: dict[str, set[Hashable]] = {}
+        self._size = 0
+        self._generation = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_items > 0
+
+    def get_or_load(self, key: Hashable, tags: Iterable[str], load: Callable[[], list[Any]]) -> list[Any]:
+        """get a cached result or load and cache it
+        the result is not cached if an invalidation ran while it was loading, as it may predate the write
+
+        Args:
+            key (Hashable): normalised query key
+            tags (Iterable[str]): tags of what the query reads
+            load (Callable[[], list[Any]]): reads the result on a miss, exceptions are not cached
+
+        Returns:
+            list[Any]: query result
+        """
+        if not self.enabled:
+            return load()
+
+        hit, value, generation = self._lookup(key)
+        if hit:
+            return value
+
+        value = load()
+        self._store(key, value, frozenset(tags), generation)
+        return value
+
+    async def aget_or_load(
+        self, key: Hashable, tags: Iterable[str], load: Callable[[], Awaitable[list[Any]]]
+    ) -> list[Any]:
+        """get_or_load for async loaders, hits are served without leaving the event loop
+
+        Args:
+            key (Hashable): normalised query key
+            tags (Iterable[str]): tags of what the query reads
+            load (Callable[[], Awaitable[list[Any]]]): reads the result on a miss, exceptions are not cached
+
+        Returns:
+            list[Any]: query result
+        """
+        if not self.enabled:
+            return await load()
+
+        hit, value, generation = self._lookup(key)
+        if hit:
+            return value
+
+        value = await load()
+        self._store(key, value, frozenset(tags), generation)
+        return value
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        """drop every entry tagged with any of the tags
+
+        Args:
+            tags (Iterable[str]): tags of the written items
+
+        Returns:
+            int: number of entries dropped
+        """
+        with self._lock:
+            self._generation += 1
+            keys = set().union(*(self._keys_by_tag.get(tag, ()) for tag in tags))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate_all(self) -> int:
+        """drop every entry, for writes whose items are not known e.g. deletes by id
+
+        Returns:
+            int: number of entries dropped
+        """
+        with self._lock:
+            self._generation += 1
+            count = len(self._entries)
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            self._size = 0
+            self.invalidations += count
+            return count
+
+    def clear(self) -> None:
+        """drop every entry and reset the counters"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            self._size = 0
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> dict[str, int]:
+        """cache counters and current size
+
+        Returns:
+            dict[str, int]: hits, misses, evictions, invalidations, entries and cached cpu metrics
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "items": self._size,
+            }
+
+    def _lookup(self, key: Hashable) -> tuple[bool, list[Any] | None, int]:
+        """look up an unexpired entry and count the hit or miss
+
+        Args:
+            key (Hashable): normalised query key
+
+        Returns:
+            tuple[bool, list[Any] | None, int]: whether it was a hit, the cached result and the invalidation generation
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry.value, self._generation
+            self.misses += 1
+            return False, None, self._generation
+
+    def _store(self, key: Hashable, value: list[Any], tags: frozenset[str], generation: int) -> None:
+        """store a loaded result unless an invalidation ran since the lookup
+
+        Args:
+            key (Hashable): normalised query key
+            value (list[Any]): query result
+            tags (frozenset[str]): tags of what the query reads
+            generation (int): invalidation generation at the lookup
+        """
+        with self._lock:
+            if generation == self._generation:
+                self._put(key, value, tags)
+
+    def _put(self, key: Hashable, value: list[Any], tags: frozenset[str]) -> None:
+        """store an entry and evict the least recently used entries over the size cap, lock must be held
+
+        Args:
+            key (Hashable): normalised query key
+            value (list[Any]): query result
+            tags (frozenset[str]): tags of what the query reads
+        """
+        size = max(1, len(value))
+        if size > self.max_items:
+            return
+
+        self._remove(key)
+        self._entries[key] = _CacheEntry(value, tags, self._clock() + self.ttl_seconds, size)
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        self._size += size
+
+        while self._size > self.max_items:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        """remove an entry and its tag index, lock must be held
+
+        Args:
+            key (Hashable): normalised query key
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        self._size -= entry.size
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+def query_cache_key(params: CpuMetricQueryParams) -> tuple[Any, ...]:
+    """normalise the query parameters to the read the service runs for them
+
+    Args:
+        params (CpuMetricQueryParams): query parameters, limit and cursor are ignored
+
+    Returns:
+        tuple[Any, ...]: cache key
+    """
+    read = _query_read(params)
+    if read == "range":
+        location = None if params.location_value == "*" else params.location_value
+        operator = None if params.operator == "*" or params.cpu_usage_value is None else params.operator
+        cpu_usage_value = None if operator is None else params.cpu_usage_value
+        return (read, params.device, location, operator, cpu_usage_value, params.start, params.end, params.order)
+    if read == "filter":
+        return (read, params.location_value, params.operator, params.cpu_usage_value, params.order)
+    return (read, params.order)
+
+
+def query_cache_tags(params: CpuMetricQueryParams) -> frozenset[str]:
+    """tag what the query reads, a device, a location or every item
+
+    Args:
+        params (CpuMetricQueryParams): query parameters
+
+    Returns:
+        frozenset[str]: invalidation tags
+    """
+    read = _query_read(params)
+    if read == "range" and params.device is not None:
+        return frozenset([f"device:{params.device}"])
+    if read in ("range", "filter") and params.location_value not in (None, "*"):
+        return frozenset([f"location:{params.location_value}"])
+    return frozenset([ALL_ITEMS_TAG])
+
+
+def item_cache_tags(items: Iterable[Any], locations: Iterable[str] = ()) -> set[str]:
+    """tags of the cached queries a write of the items can change
+
+    Args:
+        items (Iterable[Any]): written cpu metrics, as dicts or schemas
+        locations (Iterable[str]): further locations to invalidate, e.g. the unknown previous location of an update
+
+    Returns:
+        set[str]: invalidation tags
+    """
+    tags = {ALL_ITEMS_TAG, *(f"location:{location}" for location in locations)}
+    for item in items:
+        fields = item if isinstance(item, dict) else item.model_dump()
+        if fields.get("location") is not None:
+            tags.add(f"location:{fields['location']}")
+        if fields.get("device") is not None:
+            tags.add(f"device:{fields['device']}")
+    return tags
+
+
+def _query_read(params: CpuMetricQueryParams) -> str:
+    """the read the service runs for the query parameters, matching CpuMetricsService.get_cpu_metrics
+
+    Args:
+        params (CpuMetricQueryParams): query parameters
+
+    Returns:
+        str: range for time range queries, filter for cpu usage filters and all for a read of every item
+    """
+    if params.start is not None or params.end is not None or params.device is not None:
+        return "range"
+    if params.location_value and params.operator and params.cpu_usage_value is not None:
+        # location_value=* with operator=* reads every item with the same scan as no filters
+        return "all" if params.location_value == "*" and params.operator == "*" else "filter"
+    return "all"
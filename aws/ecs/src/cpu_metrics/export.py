@@ -0,0 +1,146 @@
+"""
+Columnar export of CPU metrics as Parquet or Arrow IPC
+
+JSON from GET /cpu_metrics is many times larger than the same metrics in a columnar format and slow to parse for
+analytics. The export converts each page read from the table into an Arrow table with a fixed schema and writes
+it to an in-memory sink whose bytes are handed to the response as soon as they are written, so the export is never
+built whole in memory.
+
+Arrow IPC streams write every page as its own record batches. Parquet buffers pages until EXPORT_ROW_GROUP_ROWS rows
+and writes them as one row group, as row groups of a single page would be too small to compress or scan well, so
+memory is bounded by the row group size.
+
+Resource
+--------
+- https://arrow.apache.org/docs/python/ipc.html
+- https://arrow.apache.org/docs/python/parquet.html
+
+Author: Tom Aston
+"""
+
+import io
+from typing import Any, Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..config import config_manager
+
+EXPORT_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("device", pa.string()),
+        ("location", pa.string()),
+        ("timestamp", pa.int64()),
+        ("cpu_usage", pa.float64()),  # float64 as in the archive, samples may be fractional
+        ("unit", pa.string()),
+        ("topic", pa.string()),
+        ("loop_count", pa.int64()),
+        ("project", pa.string()),
+        ("version", pa.string()),
+    ]
+)
+EXPORT_MEDIA_TYPES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+EXPORT_FILE_EXTENSIONS = {"parquet": "parquet", "arrow": "arrows"}
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write only file that keeps the bytes written since they were last drained
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        """keep the written bytes until they are drained
+
+        Args:
+            data (Any): bytes-like data
+
+        Returns:
+            int: number of bytes written
+        """
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        # writers record offsets in their metadata, so the position counts every byte ever written
+        return self._position
+
+    def drain(self) -> bytes:
+        """take the bytes written since the last drain
+
+        Returns:
+            bytes: written bytes
+        """
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export_chunks(
+    pages: Iterator[List[dict[str, Any]]],
+    export_format: str,
+    row_group_rows: int = config_manager.EXPORT_ROW_GROUP_ROWS,
+) -> Iterator[bytes]:
+    """encode pages of cpu metrics as a Parquet file or Arrow IPC stream, yielding the bytes as they are written
+
+    Args:
+        pages (Iterator[List[dict[str, Any]]]): pages of cpu metric items, numbers as Decimal
+        export_format (str): parquet or arrow
+        row_group_rows (int): rows buffered into each Parquet row group
+
+    Yields:
+        bytes: next part of the file
+    """
+    sink = _ChunkSink()
+    buffered: list[pa.Table] = []
+    buffered_rows = 0
+
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA)
+    else:
+        writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+
+    with writer:
+        for page in pages:
+            table = to_arrow_table(page)
+            if export_format == "parquet":
+                buffered.append(table)
+                buffered_rows += table.num_rows
+                if buffered_rows >= row_group_rows:
+                    writer.write_table(pa.concat_tables(buffered), row_group_size=buffered_rows)
+                    buffered, buffered_rows = [], 0
+            elif table.num_rows:
+                writer.write_table(table)
+
+            data = sink.drain()
+            if data:
+                yield data
+
+        if buffered_rows:
+            writer.write_table(pa.concat_tables(buffered), row_group_size=buffered_rows)
+
+    yield sink.drain()
+
+
+def to_arrow_table(items: List[dict[str, Any]]) -> pa.Table:
+    """convert DynamoDB items into an Arrow table with the export schema
+
+    Args:
+        items (List[dict[str, Any]]): cpu metric items, numbers as Decimal
+
+    Returns:
+        pa.Table: table with the export columns
+    """
+    frame = pd.DataFrame(items).reindex(columns=EXPORT_SCHEMA.names)
+    frame = frame.astype({"timestamp": "int64", "cpu_usage": "float64", "loop_count": "int64"})
+    return pa.Table.from_pandas(frame, schema=EXPORT_SCHEMA, preserve_index=False)
@@ -0,0 +1,109 @@
+"""
+Keys for the time-bucketed CPU metrics table
+
+The table is partitioned on device#day (UTC) with a sort key of the zero padded epoch seconds followed by the item id,
+matching the keys written by the ingest lambda. A per-device time-range read is a single-partition Query per day. Items
+are still addressed by id in the API so the IdIndex GSI maps an id back to its table key.
+
+Items written through the API carry the same TTL attribute as the ingest lambda when a retention is configured, so they
+expire from the table like ingested samples do.
+
+Author: Tom Aston
+"""
+
+import time
+from typing import Any
+
+PARTITION_KEY = "device_day"
+SORT_KEY = "timestamp_id"
+ID_INDEX_NAME = "IdIndex"
+LOCATION_INDEX_NAME = "LocationIndex"
+LOCATION_TIMESTAMP_INDEX_NAME = "LocationTimestampIndex"
+TTL_ATTRIBUTE = "expires_at"
+
+SECONDS_PER_DAY = 86400
+
+
+def device_day_key(device: str, timestamp: int) -> str:
+    """build the partition key for a cpu metric
+
+    Args:
+        device (str): device name
+        timestamp (int): epoch seconds
+
+    Returns:
+        str: device#YYYY-MM-DD partition key
+    """
+    return f"{device}#{time.strftime('%Y-%m-%d', time.gmtime(timestamp))}"
+
+
+def timestamp_id_key(timestamp: int, id: str) -> str:
+    """build the sort key for a cpu metric
+
+    Args:
+        timestamp (int): epoch seconds
+        id (str): cpu metric id
+
+    Returns:
+        str: zero padded timestamp#id sort key that orders lexicographically by time
+    """
+    return f"{timestamp:010d}#{id}"
+
+
+def timestamp_id_range(start: int, end: int) -> tuple[str, str]:
+    """build the sort key bounds covering every id between two timestamps
+
+    Args:
+        start (int): epoch seconds (inclusive)
+        end (int): epoch seconds (inclusive)
+
+    Returns:
+        tuple[str, str]: lower and upper sort keys for a between key condition
+    """
+    return f"{start:010d}#", f"{end:010d}#~"  # "~" sorts after every character of a uuid
+
+
+def device_day_keys(device: str, start: int, end: int) -> list[str]:
+    """build the partition keys of every UTC day between two timestamps
+
+    Args:
+        device (str): device name
+        start (int): epoch seconds (inclusive)
+        end (int): epoch seconds (inclusive)
+
+    Returns:
+        list[str]: device#YYYY-MM-DD partition keys in day order
+    """
+    first_day, last_day = start // SECONDS_PER_DAY, end // SECONDS_PER_DAY
+    return [device_day_key(device, day * SECONDS_PER_DAY) for day in range(first_day, last_day + 1)]
+
+
+def with_table_keys(item: dict[str, Any], retention_days: int | None = None) -> dict[str, Any]:
+    """add the partition and sort keys to an item holding device, timestamp and id
+
+    Args:
+        item (dict[str, Any]): cpu metric item
+        retention_days (int | None): days the item is kept before TTL removes it, no TTL is set if None
+
+    Returns:
+        dict[str, Any]: the same item with the table keys (and TTL) set
+    """
+    timestamp = int(item["timestamp"])
+    item[PARTITION_KEY] = device_day_key(item["device"], timestamp)
+    item[SORT_KEY] = timestamp_id_key(timestamp, item["id"])
+    if retention_days is not None:
+        item[TTL_ATTRIBUTE] = expires_at(timestamp, retention_days)
+    return item
+
+
+def expires_at(timestamp: int, retention_days: int) -> int:
+    """build the TTL attribute value for a cpu metric
+
+    Args:
+        timestamp (int): epoch seconds the cpu metric was taken
+        retention_days (int): days the cpu metric is kept in the table
+
+    Returns:
+        int: epoch seconds after which DynamoDB may delete the item
+    """
+    return int(timestamp) + retention_days * SECONDS_PER_DAY
@@ -0,0 +1,269 @@
+"""
+Cursor pagination for the CPU metrics API
+
+A page cursor is DynamoDB's LastEvaluatedKey serialised to its typed JSON form, base64url encoded and signed with an
+HMAC over the query it belongs to. The signature keeps the cursor opaque to clients and stops a cursor from one query
+(or a hand-edited key) being replayed against another query or index.
+
+A cursor can also carry query state resolved on the first page, such as the bounds of a time range that defaults to
+now, so later pages read the same range instead of resolving it again. The state is signed together with the key.
+
+Pages are read with Limit set to the number of items still needed, so the LastEvaluatedKey DynamoDB returns is the key
+of the last item on the page and the next page starts exactly after it.
+
+A read can span several partitions queried one after another, such as the device#day partitions of a device time
+range. The cursor of such a read also carries the index of the partition the next page continues in.
+
+Author: Tom Aston
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+from typing import Any, Callable, Iterator, NamedTuple
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from ..config import config_manager
+from ..databases.parallel_scan import copy_request_kwargs
+from ..errors import InvalidCursorException
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+class Page(NamedTuple):
+    """
+    Page of items and the cursor of the next page, None on the last page
+    """
+
+    items: list[dict[str, Any]]
+    next_cursor: str | None
+
+
+def encode_cursor(last_evaluated_key: dict[str, Any], scope: str, state: dict[str, Any] | None = None) -> str:
+    """encode and sign a LastEvaluatedKey as an opaque cursor
+
+    Args:
+        last_evaluated_key (dict[str, Any]): key returned by scan or query
+        scope (str): query the cursor belongs to
+        state (dict[str, Any] | None): JSON serialisable query state resolved on the first page
+
+    Returns:
+        str: page cursor
+    """
+    payload = json.dumps(
+        {
+            "key": {name: _serializer.serialize(value) for name, value in last_evaluated_key.items()},
+            "state": state or {},
+        },
+        separators=(",", ":"),
+        sort_keys=True,
+    ).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload, scope))}"
+
+
+def decode_cursor(cursor: str, scope: str) -> dict[str, Any]:
+    """verify a cursor and decode it back into an ExclusiveStartKey
+
+    Args:
+        cursor (str): page cursor
+        scope (str): query the cursor is being used with
+
+    Raises:
+        InvalidCursorException: raised if the cursor is malformed, tampered with or belongs to another query
+
+    Returns:
+        dict[str, Any]: ExclusiveStartKey
+    """
+    key, _ = read_cursor(cursor, scope)
+    return key
+
+
+def read_cursor(cursor: str, scope: str) -> tuple[dict[str, Any], dict[str, Any]]:
+    """verify a cursor and decode its ExclusiveStartKey and query state
+
+    Args:
+        cursor (str): page cursor
+        scope (str): query the cursor is being used with
+
+    Raises:
+        InvalidCursorException: raised if the cursor is malformed, tampered with or belongs to another query
+
+    Returns:
+        tuple[dict[str, Any], dict[str, Any]]: ExclusiveStartKey and the query state, empty if none was stored
+    """
+    try:
+        encoded_payload, encoded_signature = cursor.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except ValueError:
+        raise InvalidCursorException()
+
+    if not hmac.compare_digest(signature, _sign(payload, scope)):
+        raise InvalidCursorException()
+
+    decoded = json.loads(payload)
+    key = {name: _deserializer.deserialize(value) for name, value in decoded["key"].items()}
+    return key, decoded["state"]
+
+
+def read_page(
+    operation: Callable[..., dict[str, Any]],
+    kwargs: dict[str, Any],
+    limit: int,
+    cursor: str | None,
+    scope: str,
+    state: dict[str, Any] | None = None,
+) -> Page:
+    """read one page of up to limit items with a scan or query, following LastEvaluatedKey until the page is full
+
+    Args:
+        operation (Callable[..., dict[str, Any]]): table scan or query method
+        kwargs (dict[str, Any]): scan or query parameters
+        limit (int): maximum number of items on the page
+        cursor (str | None): cursor of the page to read, None for the first page
+        scope (str): query the cursor belongs to
+        state (dict[str, Any] | None): query state carried to the cursor of the next page
+
+    Returns:
+        Page: items and the cursor of the next page
+    """
+    return read_partitioned_page(operation, [kwargs], limit, cursor, scope, state)
+
+
+def read_partitioned_page(
+    operation: Callable[..., dict[str, Any]],
+    partitions: list[dict[str, Any]],
+    limit: int,
+    cursor: str | None,
+    scope: str,
+    state: dict[str, Any] | None = None,
+) -> Page:
+    """read one page of up to limit items from queries read one after another, moving on to the next query when one
+    has no LastEvaluatedKey left until the page is full
+
+    Args:
+        operation (Callable[..., dict[str, Any]]): table scan or query method
+        partitions (list[dict[str, Any]]): scan or query parameters of each partition in read order
+        limit (int): maximum number of items on the page
+        cursor (str | None): cursor of the page to read, None for the first page
+        scope (str): query the cursor belongs to
+        state (dict[str, Any] | None): query state carried to the cursor of the next page
+
+    Returns:
+        Page: items and the cursor of the next page
+    """
+    items: list[dict[str, Any]] = []
+    start_key, cursor_state = read_cursor(cursor, scope) if cursor else ({}, {})
+    partition = cursor_state.get("partition", 0)
+
+    while len(items) < limit and partition < len(partitions):
+        page_kwargs = copy_request_kwargs({**partitions[partition], "Limit": limit - len(items)})
+        if start_key:
+            page_kwargs["ExclusiveStartKey"] = start_key
+        response = operation(**page_kwargs)
+        items.extend(response.get("Items", []))
+        start_key = response.get("LastEvaluatedKey") or {}
+        if not start_key:
+            partition += 1
+
+    if partition >= len(partitions):
+        return Page(items, None)
+    # a page that ends exactly at the end of a partition continues at the start of the next one
+    next_state = {**(state or {}), "partition": partition} if partition else state
+    return Page(items, encode_cursor(start_key, scope, next_state))
+
+
+def iter_pages(
+    operation: Callable[..., dict[str, Any]],
+    kwargs: dict[str, Any],
+    start_key: dict[str, Any] | None = None,
+    limit: int | None = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """yield the items of each scan or query page as it arrives, following LastEvaluatedKey to the end
+
+    With a limit each request asks for the items still needed, so a query for the top N items reads only N items.
+
+    Args:
+        operation (Callable[..., dict[str, Any]]): table scan or query method
+        kwargs (dict[str, Any]): scan or query parameters
+        start_key (dict[str, Any] | None): ExclusiveStartKey of the first page
+        limit (int | None): stop after this many items, None reads every page
+
+    Yields:
+        list[dict[str, Any]]: items of one page, pages with no items after filtering are skipped
+    """
+    remaining = limit
+
+    while remaining is None or remaining > 0:
+        page_kwargs = copy_request_kwargs(kwargs)
+        if start_key:
+            page_kwargs["ExclusiveStartKey"] = start_key
+        if remaining is not None:
+            page_kwargs["Limit"] = remaining
+        response = operation(**page_kwargs)
+        items = response.get("Items", [])
+        if items:
+            yield items
+        if remaining is not None:
+            remaining -= len(items)
+        start_key = response.get("LastEvaluatedKey")
+        if not start_key:
+            return
+
+
+def iter_partitioned_pages(
+    operation: Callable[..., dict[str, Any]],
+    partitions: list[dict[str, Any]],
+    start_key: dict[str, Any] | None = None,
+    partition: int = 0,
+    limit: int | None = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """yield the items of each page of queries read one after another, following each to its end before the next
+
+    Args:
+        operation (Callable[..., dict[str, Any]]): table scan or query method
+        partitions (list[dict[str, Any]]): scan or query parameters of each partition in read order
+        start_key (dict[str, Any] | None): ExclusiveStartKey of the first page, within the first partition read
+        partition (int): index of the first partition read
+        limit (int | None): stop after this many items, None reads every page
+
+    Yields:
+        list[dict[str, Any]]: items of one page, pages with no items after filtering are skipped
+    """
+    remaining = limit
+
+    for kwargs in partitions[partition:]:
+        if remaining is not None and remaining <= 0:
+            return
+        for items in iter_pages(operation, kwargs, start_key, limit=remaining):
+            yield items
+            if remaining is not None:
+                remaining -= len(items)
+        start_key = None
+
+
+def _sign(payload: bytes, scope: str) -> bytes:
+    """sign a cursor payload for a query scope
+
+    Args:
+        payload (bytes): serialised key
+        scope (str): query the cursor belongs to
+
+    Returns:
+        bytes: HMAC-SHA256 signature
+    """
+    secret = (config_manager.PAGINATION_CURSOR_SECRET or config_manager.COGNITO_JWT_SECRET).encode()
+    return hmac.new(secret, scope.encode() + b"\0" + payload, hashlib.sha256).digest()
+
+
+def _b64encode(data: bytes) -> str:
+    """base64url encode without padding"""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    """base64url decode restoring the padding"""
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
@@ -7,109 +7,386 @@ CPU Metrics data in the DynamoDB table.
 Author: Tom Aston
 """
 
-from typing import Any, List
+from typing import Annotated, Any, AsyncIterator, Iterator, List
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Body, Depends, Request, Response, status
+from fastapi.responses import StreamingResponse
 from mypy_boto3_dynamodb.service_resource import Table
 
-from .schemas import CpuMetricCreateSchema, CpuMetricQueryParams, CpuMetricSchema, CpuMetricUpdateSchema
+from ..config import config_manager
+from .bulk_import import CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE, import_cpu_metrics
+from .cache import QueryResultCache, item_cache_tags, query_cache_key, query_cache_tags
+from .export import EXPORT_FILE_EXTENSIONS, EXPORT_MEDIA_TYPES, iter_export_chunks
+from .schemas import (
+    LOCATIONS,
+    CpuMetricAggregateParams,
+    CpuMetricAggregateSchema,
+    CpuMetricBatchCreateResultSchema,
+    CpuMetricBatchDeleteResultSchema,
+    CpuMetricBatchGetResultSchema,
+    CpuMetricCreateSchema,
+    CpuMetricExportParams,
+    CpuMetricImportResultSchema,
+    CpuMetricQueryParams,
+    CpuMetricSchema,
+    CpuMetricUpdateSchema,
+)
 from .service import CpuMetricsService
 
 cpu_metrics_router = APIRouter()
 cpu_metrics_service = CpuMetricsService()
-from src.auth.service import oauth2_scheme
+cpu_metrics_cache = QueryResultCache(
+    ttl_seconds=config_manager.QUERY_CACHE_TTL_SECONDS, max_items=config_manager.QUERY_CACHE_MAX_ITEMS
+)
+from src.auth.service import get_current_claims
 
-from ..databases.dynamo_db import get_db_table
+from ..databases.dynamo_db import get_db_table, run_in_db_executor
 
 
 @cpu_metrics_router.get("", tags=["cpu_metrics"], status_code=status.HTTP_200_OK)
-def get_all_cpu_metrics(
+async def get_all_cpu_metrics(
+    request: Request,
+    response: Response,
     params: CpuMetricQueryParams = Depends(),
     db_table: Table = Depends(get_db_table),
-    _=Depends(oauth2_scheme),
+    claims: dict = Depends(get_current_claims),
 ) -> List[CpuMetricSchema]:
     """get endpoint for all cpu metrics
     will return all cpu metrics if no query parameters are provided
+    if a limit or cursor is provided a single page is returned and the cursor of the next page is set in the
+    X-Next-Cursor header, which is absent on the last page
+    if the client accepts application/x-ndjson the cpu metrics are streamed one JSON object per line as each page is
+    read from the table instead of being collected into a list first
+    other reads are served from the query cache until they expire or a write changes them
 
     Args:
+        request (Request): request used to read the Accept header
+        response (Response): response used to set the next page cursor header
         params (CpuMetricQueryParams, optional): query parameters. Defaults to Depends().
         db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
 
     Returns:
         List[CpuMetricSchema]: list of cpu metrics data with all attributes included
     """
-    print(f"params: {params}")
-    return cpu_metrics_service.get_cpu_metrics(cpu_metric_table=db_table, params=params)
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        pages = cpu_metrics_service.stream_cpu_metrics(cpu_metric_table=db_table, params=params)
+        # read the first page before the response starts so errors are still returned as JSON with a status code
+        first_page = await run_in_db_executor(next, pages, [])
+        return StreamingResponse(_ndjson_stream(first_page, pages), media_type=NDJSON_MEDIA_TYPE)
+
+    if params.limit is None and params.cursor is None:
+        return await cpu_metrics_cache.aget_or_load(
+            query_cache_key(params),
+            query_cache_tags(params),
+            lambda: run_in_db_executor(cpu_metrics_service.get_cpu_metrics, cpu_metric_table=db_table, params=params),
+        )
+
+    page = await run_in_db_executor(cpu_metrics_service.get_cpu_metrics_page, cpu_metric_table=db_table, params=params)
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
+
+
+@cpu_metrics_router.get(
+    "/aggregate", tags=["cpu_metrics"], status_code=status.HTTP_200_OK, response_model_exclude_none=True
+)
+async def get_cpu_metric_aggregates(
+    params: CpuMetricAggregateParams = Depends(),
+    db_table: Table = Depends(get_db_table),
+    claims: dict = Depends(get_current_claims),
+) -> CpuMetricAggregateSchema:
+    """get endpoint for time-bucketed cpu usage aggregates
+    returns parallel arrays of bucket start, sample count and each requested aggregation instead of the raw samples
+    a device or a location is required
+
+    Args:
+        params (CpuMetricAggregateParams, optional): bucket, aggregations, device, location and time range.
+            Defaults to Depends().
+        db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
+
+    Returns:
+        CpuMetricAggregateSchema: cpu usage aggregates
+    """
+    return await run_in_db_executor(
+        cpu_metrics_service.get_cpu_metric_aggregates, cpu_metric_table=db_table, params=params
+    )
+
+
+@cpu_metrics_router.get(
+    "/export",
+    tags=["cpu_metrics"],
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={status.HTTP_200_OK: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}},
+)
+async def export_cpu_metrics(
+    params: CpuMetricExportParams = Depends(),
+    db_table: Table = Depends(get_db_table),
+    claims: dict = Depends(get_current_claims),
+) -> StreamingResponse:
+    """get endpoint to export cpu metrics as a Parquet file or an Arrow IPC stream
+    takes the filters of GET /cpu_metrics and streams the file as pages are read from the table
+
+    Args:
+        params (CpuMetricExportParams, optional): format and query parameters. Defaults to Depends().
+        db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
+
+    Returns:
+        StreamingResponse: parquet file or arrow IPC stream
+    """
+    pages = cpu_metrics_service.stream_cpu_metrics(cpu_metric_table=db_table, params=params)
+    chunks = iter_export_chunks(pages, params.format)
+    # read the first page before the response starts so errors are still returned as JSON with a status code
+    first_chunk = await run_in_db_executor(next, chunks, b"")
+    return StreamingResponse(
+        _byte_stream(first_chunk, chunks),
+        media_type=EXPORT_MEDIA_TYPES[params.format],
+        headers={"Content-Disposition": f'attachment; filename="cpu_metrics.{EXPORT_FILE_EXTENSIONS[params.format]}"'},
+    )
+
+
+@cpu_metrics_router.get("/cache", tags=["cpu_metrics"], status_code=status.HTTP_200_OK)
+async def get_cpu_metrics_cache_stats(claims: dict = Depends(get_current_claims)) -> dict[str, int]:
+    """get endpoint for the query cache counters of this worker
+
+    Args:
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
+
+    Returns:
+        dict[str, int]: hits, misses, evictions, invalidations, entries and cached cpu metrics
+    """
+    return cpu_metrics_cache.stats()
 
 
 @cpu_metrics_router.post("", tags=["cpu_metrics"], status_code=status.HTTP_201_CREATED)
-def create_cpu_metric(
+async def create_cpu_metric(
     cpu_metric: CpuMetricCreateSchema,
     db_table: Table = Depends(get_db_table),
-    _=Depends(oauth2_scheme),
+    claims: dict = Depends(get_current_claims),
 ) -> CpuMetricSchema:
     """post endpoint to create a cpu metric
 
     Args:
         cpu_metric (CpuMetricCreateSchema): cpu metric data
         db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
 
     Returns:
         CpuMetricSchema: created cpu metric data
     """
-    return cpu_metrics_service.create_cpu_metric(cpu_metric_table=db_table, cpu_metric=cpu_metric)
+    created_item = await run_in_db_executor(
+        cpu_metrics_service.create_cpu_metric, cpu_metric_table=db_table, cpu_metric=cpu_metric
+    )
+    cpu_metrics_cache.invalidate(item_cache_tags([created_item]))
+    return created_item
 
 
 @cpu_metrics_router.post("/batch", tags=["cpu_metrics"], status_code=status.HTTP_201_CREATED)
-def batch_create_cpu_metrics(
-    cpu_metrics: List[CpuMetricCreateSchema],
+async def batch_create_cpu_metrics(
+    response: Response,
+    cpu_metrics: Annotated[List[CpuMetricCreateSchema], Body(max_length=config_manager.BATCH_CREATE_MAX_ITEMS)],
     db_table: Table = Depends(get_db_table),
-    _=Depends(oauth2_scheme),
-) -> List[CpuMetricSchema]:
+    claims: dict = Depends(get_current_claims),
+) -> CpuMetricBatchCreateResultSchema:
     """post endpoint to create multiple cpu metrics
+    returns a result per cpu metric with 201 if every one was created or 207 if some failed
 
     Args:
-        cpu_metrics (List[CpuMetricCreateSchema]): list of cpu metric data
+        response (Response): response used to set the multi-status code
+        cpu_metrics (List[CpuMetricCreateSchema]): list of up to BATCH_CREATE_MAX_ITEMS cpu metric data
         db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
 
     Returns:
-        List[CpuMetricSchema]: list of created cpu metric data
+        CpuMetricBatchCreateResultSchema: created and failed counts and a result per cpu metric
     """
-    print(f"cpu_metrics: {cpu_metrics}")
-    return cpu_metrics_service.batch_create_cpu_metrics(cpu_metric_table=db_table, cpu_metrics=cpu_metrics)
+    batch_result = await run_in_db_executor(
+        cpu_metrics_service.batch_create_cpu_metrics, cpu_metric_table=db_table, cpu_metrics=cpu_metrics
+    )
+    cpu_metrics_cache.invalidate(item_cache_tags(result.item for result in batch_result.results if result.item))
+    if batch_result.failed:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return batch_result
+
+
+@cpu_metrics_router.post(
+    "/import",
+    tags=["cpu_metrics"],
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+                CSV_MEDIA_TYPE: {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def bulk_import_cpu_metrics(
+    request: Request,
+    response: Response,
+    db_table: Table = Depends(get_db_table),
+    claims: dict = Depends(get_current_claims),
+) -> CpuMetricImportResultSchema:
+    """post endpoint to import cpu metrics from a streamed NDJSON or CSV upload of any size
+    the upload is parsed and validated in chunks as it arrives and each chunk is batch written while the next is parsed
+    returns the row counts and the first row errors with 201 if every row was created or 207 if some failed
+
+    Args:
+        request (Request): request whose body is streamed, with a Content-Type of application/x-ndjson or text/csv
+        response (Response): response used to set the multi-status code
+        db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
+
+    Returns:
+        CpuMetricImportResultSchema: row, created and failed counts and the first row errors
+    """
+
+    async def write_chunk(cpu_metrics: List[CpuMetricCreateSchema]) -> CpuMetricBatchCreateResultSchema:
+        batch_result = await run_in_db_executor(
+            cpu_metrics_service.batch_create_cpu_metrics, cpu_metric_table=db_table, cpu_metrics=cpu_metrics
+        )
+        cpu_metrics_cache.invalidate(item_cache_tags(result.item for result in batch_result.results if result.item))
+        return batch_result
+
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    import_result = await import_cpu_metrics(request.stream(), media_type, write_chunk)
+    if import_result.failed:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return import_result
+
+
+@cpu_metrics_router.post("/batch_get", tags=["cpu_metrics"], status_code=status.HTTP_200_OK)
+async def batch_get_cpu_metrics(
+    ids: Annotated[List[str], Body(embed=True, min_length=1, max_length=config_manager.BATCH_IDS_MAX_ITEMS)],
+    db_table: Table = Depends(get_db_table),
+    claims: dict = Depends(get_current_claims),
+) -> CpuMetricBatchGetResultSchema:
+    """post endpoint to get multiple cpu metrics by id
+    returns a result per id, found with the cpu metric, not_found or failed
+
+    Args:
+        ids (List[str]): up to BATCH_IDS_MAX_ITEMS cpu metric ids, each resolved with an id index query
+        db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
+
+    Returns:
+        CpuMetricBatchGetResultSchema: found, not found and failed counts and a result per id
+    """
+    return await run_in_db_executor(
+        cpu_metrics_service.batch_get_cpu_metrics, cpu_metric_table=db_table, cpu_metric_ids=ids
+    )
+
+
+@cpu_metrics_router.post("/batch_delete", tags=["cpu_metrics"], status_code=status.HTTP_200_OK)
+async def batch_delete_cpu_metrics(
+    response: Response,
+    ids: Annotated[List[str], Body(embed=True, min_length=1, max_length=config_manager.BATCH_IDS_MAX_ITEMS)],
+    db_table: Table = Depends(get_db_table),
+    claims: dict = Depends(get_current_claims),
+) -> CpuMetricBatchDeleteResultSchema:
+    """post endpoint to delete multiple cpu metrics by id
+    returns a result per id with 200 if none failed or 207 if some failed, ids that do not exist are not failures
+
+    Args:
+        response (Response): response used to set the multi-status code
+        ids (List[str]): up to BATCH_IDS_MAX_ITEMS cpu metric ids, each resolved with an id index query
+        db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
+
+    Returns:
+        CpuMetricBatchDeleteResultSchema: deleted, not found and failed counts and a result per id
+    """
+    batch_result = await run_in_db_executor(
+        cpu_metrics_service.batch_delete_cpu_metrics, cpu_metric_table=db_table, cpu_metric_ids=ids
+    )
+    if batch_result.deleted:
+        # the deleted items are not read back, so their devices and locations are unknown
+        cpu_metrics_cache.invalidate_all()
+    if batch_result.failed:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return batch_result
 
 
 @cpu_metrics_router.put("", tags=["cpu_metrics"], status_code=status.HTTP_200_OK)
-def update_cpu_metric(
+async def update_cpu_metric(
     cpu_metric: CpuMetricUpdateSchema,
     db_table: Table = Depends(get_db_table),
-    _=Depends(oauth2_scheme),
+    claims: dict = Depends(get_current_claims),
 ) -> CpuMetricSchema:
     """put endpoint to update a cpu metric
 
     Args:
         cpu_metric (CpuMetricSchema): cpu metric data
         db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
 
     Returns:
         CpuMetricSchema: updated cpu metric data
     """
-    return cpu_metrics_service.update_cpu_metric(cpu_metric_table=db_table, cpu_metric=cpu_metric)
+    updated_item = await run_in_db_executor(
+        cpu_metrics_service.update_cpu_metric, cpu_metric_table=db_table, cpu_metric=cpu_metric
+    )
+    # the previous location is not returned, so a location change invalidates every location
+    cpu_metrics_cache.invalidate(item_cache_tags([updated_item], LOCATIONS if cpu_metric.location else ()))
+    return updated_item
 
 
 @cpu_metrics_router.delete("/{cpu_metric_id}", tags=["cpu_metrics"], status_code=status.HTTP_200_OK)
-def delete_cpu_metric(
+async def delete_cpu_metric(
     cpu_metric_id: str,
     db_table: Table = Depends(get_db_table),
-    _=Depends(oauth2_scheme),
+    claims: dict = Depends(get_current_claims),
 ) -> Any:
     """delete endpoint to delete a cpu metric
 
     Args:
         cpu_metric_id (str): cpu metric id
         db_table (Table, optional): db table. Defaults to Depends(get_db_table).
+        claims (dict, optional): verified access token claims. Defaults to Depends(get_current_claims).
 
     Returns:
         Any: response
     """
-    return cpu_metrics_service.delete_cpu_metric(cpu_metric_table=db_table, cpu_metric_id=cpu_metric_id)
+    deleted_item = await run_in_db_executor(
+        cpu_metrics_service.delete_cpu_metric, cpu_metric_table=db_table, cpu_metric_id=cpu_metric_id
+    )
+    cpu_metrics_cache.invalidate(item_cache_tags([deleted_item]))
+    return deleted_item
+
+
+async def _ndjson_stream(first_page: List[dict[str, Any]], pages: Iterator[List[dict[str, Any]]]) -> AsyncIterator[str]:
+    """encode each page of cpu metrics as one chunk of newline delimited JSON, reading the next page on the database
+    executor
+
+    Args:
+        first_page (List[dict[str, Any]]): page read before the response started
+        pages (Iterator[List[dict[str, Any]]]): remaining pages of cpu metric items
+
+    Yields:
+        str: one JSON line per cpu metric in the page
+    """
+    items = first_page
+    while items is not None:
+        yield "".join(CpuMetricSchema.model_validate(item).model_dump_json() + "\n" for item in items)
+        items = await run_in_db_executor(next, pages, None)
+
+
+async def _byte_stream(first_chunk: bytes, chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """yield the chunks of an export, reading and encoding the next one on the database executor
+
+    Args:
+        first_chunk (bytes): chunk encoded before the response started
+        chunks (Iterator[bytes]): remaining chunks of the export
+
+    Yields:
+        bytes: next part of the file
+    """
+    chunk = first_chunk
+    while chunk is not None:
+        yield chunk
+        chunk = await run_in_db_executor(next, chunks, None)
@@ -7,10 +7,18 @@ validate the data before it is stored in the database or returned to the client.
 Author: Tom Aston
 """
 
-from typing import Literal, Optional
+from typing import List, Literal, Optional, get_args
 
 from pydantic import BaseModel, Field
 
+# reads by location fan out over LOCATIONS, so every write path only accepts these locations (the ingest lambda too)
+Location = Literal["Home", "Office", "Factory"]
+LOCATIONS: tuple[str, ...] = get_args(Location)
+
+Aggregation = Literal["avg", "min", "max", "p95"]
+AGGREGATIONS: tuple[str, ...] = get_args(Aggregation)
+BUCKET_SECONDS = {"1m": 60, "1h": 3600}
+
 
 class CpuMetricSchema(BaseModel):
     id: str
@@ -26,13 +34,52 @@ class CpuMetricSchema(BaseModel):
 
 
 class CpuMetricQueryParams(BaseModel):
-    location_value: Optional[Literal["Home", "Office", "Factory", "*"]] = Field(
+    location_value: Optional[Location | Literal["*"]] = Field(
         None, description="Allowed locations are Home, Office, Factory, or *"
     )
     operator: Optional[Literal["eq", "gt", "lt", "*"]] = Field(
         None, description="Allowed operators are eq, gt, lt or *"
     )
     cpu_usage_value: Optional[int] = Field(None, ge=0, le=100, description="CPU usage value (0-100)")
+    device: Optional[str] = Field(None, description="Device name, read with start and end")
+    start: Optional[int] = Field(None, ge=0, description="Start of the time range in epoch seconds (inclusive)")
+    end: Optional[int] = Field(None, ge=0, description="End of the time range in epoch seconds (inclusive)")
+    order: Optional[Literal["asc", "desc"]] = Field(
+        None,
+        description="Order by timestamp for time ranges, otherwise by cpu usage (requires a location other than *)",
+    )
+    limit: Optional[int] = Field(None, ge=1, le=1000, description="Maximum number of items per page (1-1000)")
+    cursor: Optional[str] = Field(None, description="X-Next-Cursor header of the previous page")
+
+
+class CpuMetricExportParams(CpuMetricQueryParams):
+    format: Literal["parquet", "arrow"] = Field("parquet", description="parquet file or arrow IPC stream")
+
+
+class CpuMetricAggregateParams(BaseModel):
+    bucket: Literal["1m", "1h"] = Field("1m", description="Bucket size, 1m or 1h")
+    agg: str = Field("avg,min,max,p95", description="Comma separated aggregations from avg, min, max and p95")
+    device: Optional[str] = Field(None, description="Device name")
+    location: Optional[Location] = Field(None, description="Allowed locations are Home, Office or Factory")
+    start: Optional[int] = Field(None, ge=0, description="Start of the time range in epoch seconds (inclusive)")
+    end: Optional[int] = Field(None, ge=0, description="End of the time range in epoch seconds (inclusive)")
+
+    @property
+    def aggregations(self) -> List[str]:
+        """requested aggregations in order without blanks or duplicates"""
+        return list(dict.fromkeys(aggregation.strip() for aggregation in self.agg.split(",") if aggregation.strip()))
+
+
+class CpuMetricAggregateSchema(BaseModel):
+    """cpu usage aggregates as parallel arrays, one entry per bucket with at least one sample"""
+
+    bucket: str
+    bucket_start: List[int]
+    count: List[int]
+    avg: Optional[List[float]] = None
+    min: Optional[List[float]] = None
+    max: Optional[List[float]] = None
+    p95: Optional[List[float]] = None
 
 
 class CpuMetricCreateSchema(BaseModel):
@@ -40,10 +87,65 @@ class CpuMetricCreateSchema(BaseModel):
     loop_count: int
     project: str
     topic: str
-    location: str
+    location: Location = Field(..., description="Allowed locations are Home, Office or Factory")
     cpu_usage: int
     device: str
     version: str
+    timestamp: Optional[int] = Field(
+        None, ge=0, description="Epoch seconds the metric was sampled at, defaults to the time it is stored"
+    )
+
+
+class CpuMetricBatchItemResultSchema(BaseModel):
+    """result of one cpu metric of a batch create, in the order of the request"""
+
+    index: int
+    status: Literal["created", "failed"]
+    item: Optional[CpuMetricSchema] = None
+    error: Optional[str] = None
+
+
+class CpuMetricBatchCreateResultSchema(BaseModel):
+    created: int
+    failed: int
+    results: List[CpuMetricBatchItemResultSchema]
+
+
+class CpuMetricImportErrorSchema(BaseModel):
+    """a row of an import that was not imported"""
+
+    line: int
+    error: str
+
+
+class CpuMetricImportResultSchema(BaseModel):
+    rows: int
+    created: int
+    failed: int
+    errors: List[CpuMetricImportErrorSchema]
+
+
+class CpuMetricBatchIdResultSchema(BaseModel):
+    """result of one id of a batch get or delete, in the order of the request"""
+
+    id: str
+    status: Literal["found", "deleted", "not_found", "failed"]
+    item: Optional[CpuMetricSchema] = None
+    error: Optional[str] = None
+
+
+class CpuMetricBatchGetResultSchema(BaseModel):
+    found: int
+    not_found: int
+    failed: int
+    results: List[CpuMetricBatchIdResultSchema]
+
+
+class CpuMetricBatchDeleteResultSchema(BaseModel):
+    deleted: int
+    not_found: int
+    failed: int
+    results: List[CpuMetricBatchIdResultSchema]
 
 
 class CpuMetricUpdateSchema(BaseModel):
@@ -52,7 +154,7 @@ class CpuMetricUpdateSchema(BaseModel):
     loop_count: Optional[int] = Field(None, description="Loop count")
     project: Optional[str] = Field(None, description="Project name")
     topic: Optional[str] = Field(None, description="Topic")
-    location: Optional[str] = Field(None, description="Location")
+    location: Optional[Location] = Field(None, description="Allowed locations are Home, Office or Factory")
     cpu_usage: Optional[int] = Field(None, description="CPU usage value")
     device: Optional[str] = Field(None, description="Device")
     version: Optional[str] = Field(None, description="Version")
@@ -12,16 +12,53 @@ Resource
 Author: Tom Aston
 """
 
+import logging
 import time
 import uuid
-from typing import List
+from typing import Any, Callable, Iterator, List
 
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, ConditionBase, Key
 from botocore.exceptions import ClientError
 from mypy_boto3_dynamodb.service_resource import Table
 
-from ..errors import InvalidRequestException, ServerException
-from .schemas import CpuMetricCreateSchema, CpuMetricQueryParams, CpuMetricSchema, CpuMetricUpdateSchema
+from ..config import config_manager
+from ..databases.batch import batch_delete_items, batch_get_items, batch_put_items
+from ..databases.parallel_scan import parallel_query, parallel_scan, scan_segment_count
+from ..errors import CpuMetricNotFoundException, InvalidRequestException, ServerException
+from .aggregation import aggregate_cpu_usage
+from .keys import (
+    ID_INDEX_NAME,
+    LOCATION_INDEX_NAME,
+    LOCATION_TIMESTAMP_INDEX_NAME,
+    PARTITION_KEY,
+    SORT_KEY,
+    device_day_keys,
+    timestamp_id_range,
+    with_table_keys,
+)
+from .pagination import Page, iter_pages, iter_partitioned_pages, read_cursor, read_partitioned_page
+from .schemas import (
+    AGGREGATIONS,
+    BUCKET_SECONDS,
+    LOCATIONS,
+    CpuMetricAggregateParams,
+    CpuMetricAggregateSchema,
+    CpuMetricBatchCreateResultSchema,
+    CpuMetricBatchDeleteResultSchema,
+    CpuMetricBatchGetResultSchema,
+    CpuMetricBatchIdResultSchema,
+    CpuMetricBatchItemResultSchema,
+    CpuMetricCreateSchema,
+    CpuMetricQueryParams,
+    CpuMetricSchema,
+    CpuMetricUpdateSchema,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_LIMIT = 100
+DEFAULT_TIME_RANGE_SECONDS = 24 * 60 * 60
+MAX_TIME_RANGE_DAYS = 31
 
 
 class CpuMetricsService:
@@ -32,21 +69,214 @@ class CpuMetricsService:
     def get_cpu_metrics(self, cpu_metric_table: Table, params: CpuMetricQueryParams) -> List[CpuMetricSchema]:
         """router facing method to get cpu metrics based on the query parameters
         will return all cpu metrics if no query parameters are provided
+        a start, end or device reads a time range with key condition queries instead of a scan
 
         Args:
             cpu_metric_table (Table): cpu metric table
             params (CpuMetricQueryParams): query parameters including location, operator, and cpu usage value
 
+        Raises:
+            InvalidRequestException: raised if an order is provided without a single location or a time range, or the
+                time range is invalid
+
         Returns:
             List[CpuMetricSchema]: list of cpu metrics data with all attributes included
         """
+        _check_order_has_location(params)
+
+        if _has_time_range(params):
+            return self._get_cpu_metrics_in_time_range(cpu_metric_table, params=params)
         if params.location_value and params.operator and params.cpu_usage_value is not None:
             return self._get_filtered_cpu_metrics(cpu_metric_table, params=params)
         else:
             return self._get_all_cpu_metrics(cpu_metric_table)
 
+    def get_cpu_metrics_page(self, cpu_metric_table: Table, params: CpuMetricQueryParams) -> Page:
+        """router facing method to get one page of cpu metrics based on the query parameters
+        the filters are the same as get_cpu_metrics, the page is continued from params.cursor if provided, a time
+        range over every location is paged one location after another
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            params (CpuMetricQueryParams): query parameters including the filters, limit and cursor
+
+        Raises:
+            InvalidRequestException: raised if an order is provided without a single location
+            InvalidCursorException: raised if the cursor is invalid or belongs to a different query
+            ServerException: raised if the scan or query fails
+
+        Returns:
+            Page: cpu metrics on the page and the cursor of the next page
+        """
+        operation, partitions, scope, state = self._build_read(cpu_metric_table, params)
+
+        try:
+            return read_partitioned_page(
+                operation, partitions, params.limit or DEFAULT_PAGE_LIMIT, params.cursor, scope, state
+            )
+        except ClientError as err:
+            logger.error("ClientError: %s", err)
+            raise ServerException()
+
+    def stream_cpu_metrics(
+        self, cpu_metric_table: Table, params: CpuMetricQueryParams
+    ) -> Iterator[List[CpuMetricSchema]]:
+        """router facing method to stream cpu metrics page by page as they are read from the table
+        the filters are the same as get_cpu_metrics, the stream starts at params.cursor and stops after params.limit
+        items if provided, a time range over every location is streamed one location after another
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            params (CpuMetricQueryParams): query parameters including the filters, limit and cursor
+
+        Raises:
+            InvalidRequestException: raised if an order is provided without a single location
+            InvalidCursorException: raised if the cursor is invalid or belongs to a different query
+            ServerException: raised if a scan or query fails
+
+        Yields:
+            List[CpuMetricSchema]: cpu metrics of one page
+        """
+        operation, partitions, scope, _ = self._build_read(cpu_metric_table, params)
+        start_key, state = read_cursor(params.cursor, scope) if params.cursor else ({}, {})
+
+        try:
+            yield from iter_partitioned_pages(
+                operation, partitions, start_key or None, state.get("partition", 0), limit=params.limit
+            )
+        except ClientError as err:
+            logger.error("ClientError: %s", err)
+            raise ServerException()
+
+    def _build_read(
+        self, cpu_metric_table: Table, params: CpuMetricQueryParams
+    ) -> tuple[Callable[..., dict[str, Any]], list[dict[str, Any]], str, dict[str, Any] | None]:
+        """choose the scan or query and its parameters for the query parameters
+        a time range is resolved on the first page and read back from the cursor on later pages, so a range ending
+        now by default does not move between pages
+        a device time range is read one device#day partition after another in the requested order, a time range over
+        every location one location after another, each in timestamp order
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            params (CpuMetricQueryParams): query parameters including location, operator, and cpu usage value
+
+        Raises:
+            InvalidRequestException: raised if an order is provided without a single location or the time range is invalid
+            InvalidCursorException: raised if the cursor is invalid or belongs to a different query
+
+        Returns:
+            tuple[Callable[..., dict[str, Any]], list[dict[str, Any]], str, dict[str, Any] | None]: table scan or query
+                method, the parameters of each partition in read order, the scope page cursors are bound to and the
+                state they carry
+        """
+        _check_order_has_location(params)
+
+        if _has_time_range(params):
+            scope = (
+                f"{params.device}|{params.location_value}|{params.operator}|{params.cpu_usage_value}|{params.order}"
+                f"|{params.start}|{params.end}"
+            )
+            state = read_cursor(params.cursor, scope)[1] if params.cursor else {}
+            if "start" in state and "end" in state:
+                start, end = state["start"], state["end"]
+            else:
+                start, end = _time_range(params)
+            partitions = _time_range_queries(params, start, end)
+            return cpu_metric_table.query, partitions, scope, {"start": start, "end": end}
+
+        if params.location_value and params.operator and params.cpu_usage_value is not None:
+            # the cursor is bound to the filters so a page of one query cannot continue another
+            scope = f"{params.location_value}|{params.operator}|{int(params.cpu_usage_value)}|{params.order}"
+            if params.location_value == "*" and params.operator == "*":
+                return cpu_metric_table.scan, [_all_cpu_metrics_scan_kwargs()], scope, None
+            # location * pages read one location after another, each pushing the cpu usage down as a key condition
+            locations = LOCATIONS if params.location_value == "*" else [params.location_value]
+            partitions = [
+                _location_query_kwargs(location, params.operator, int(params.cpu_usage_value), params.order)
+                for location in locations
+            ]
+            return cpu_metric_table.query, partitions, scope, None
+
+        return cpu_metric_table.scan, [_all_cpu_metrics_scan_kwargs()], "*", None
+
+    def get_cpu_metric_aggregates(
+        self, cpu_metric_table: Table, params: CpuMetricAggregateParams
+    ) -> CpuMetricAggregateSchema:
+        """router facing method to get time-bucketed cpu usage aggregates
+        the samples are read with the time range queries, projected to timestamp and cpu usage, and aggregated into
+        compact arrays, a device or a location is required so the raw samples of every device are never read at once
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            params (CpuMetricAggregateParams): bucket, aggregations, device, location and time range
+
+        Raises:
+            InvalidRequestException: raised if an aggregation is unknown, neither a device nor a location is provided or
+                the time range is invalid
+            ServerException: raised if a query fails
+
+        Returns:
+            CpuMetricAggregateSchema: bucket starts, sample counts and one array per aggregation
+        """
+        aggregations = params.aggregations
+        if not aggregations or any(aggregation not in AGGREGATIONS for aggregation in aggregations):
+            raise InvalidRequestException(f"agg must be a comma separated list of {', '.join(AGGREGATIONS)}")
+        if params.device is None and params.location is None:
+            raise InvalidRequestException("aggregates require a device or a location")
+
+        query_params = CpuMetricQueryParams(
+            device=params.device, location_value=params.location, start=params.start, end=params.end
+        )
+        items = self._get_cpu_metrics_in_time_range(
+            cpu_metric_table, params=query_params, projection=["timestamp", "cpu_usage"]
+        )
+
+        return CpuMetricAggregateSchema(
+            bucket=params.bucket,
+            **aggregate_cpu_usage(items, BUCKET_SECONDS[params.bucket], aggregations),
+        )
+
+    def _get_cpu_metrics_in_time_range(
+        self, cpu_metric_table: Table, params: CpuMetricQueryParams, projection: List[str] | None = None
+    ) -> List[CpuMetricSchema]:
+        """get the cpu metrics between start and end with key condition queries
+        a device is read from its device#day partitions, one query per day, otherwise the location timestamp index is
+        queried for the location, or for * every location, the queries run in parallel and the location and cpu usage
+        filters are pushed down as a filter expression
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            params (CpuMetricQueryParams): query parameters including device, start and end
+            projection (List[str] | None): attributes to read, None reads every attribute
+
+        Raises:
+            InvalidRequestException: raised if the time range is invalid
+            ServerException: raised if a query fails
+
+        Returns:
+            List[CpuMetricSchema]: list of cpu metrics ordered by timestamp
+        """
+        start, end = _time_range(params)
+        queries = _time_range_queries(params, start, end)
+
+        if projection is not None:
+            for query in queries:
+                query["ProjectionExpression"] = ", ".join(f"#{name}" for name in projection)
+                query["ExpressionAttributeNames"] = {f"#{name}": name for name in projection}
+
+        try:
+            items = parallel_query(cpu_metric_table, queries)
+        except ClientError as err:
+            logger.error("ClientError: %s", err)
+            raise ServerException()
+
+        items.sort(key=lambda item: item["timestamp"], reverse=params.order == "desc")
+        return items
+
     def _get_all_cpu_metrics(self, cpu_metric_table: Table) -> List[CpuMetricSchema]:
         """scan for all items in the table where the timestamp is greater than 0 (all items with a timestamp)
+        the table is scanned in parallel segments, the number of segments grows with the table size
 
         Args:
             cpu_metric_table (Table): cpu metric table
@@ -57,40 +287,12 @@ class CpuMetricsService:
         Returns:
             List[CpuMetricSchema]: list of cpu metrics data with all attributes included
         """
-        all_cpu_metrics = []
-
-        # scan for all items in the table where the timestamp is greater than 0 (all items with a timestamp)
-        scan_kwargs = {
-            "FilterExpression": Key("timestamp").gt(0),
-            "ProjectionExpression": "#id, #timestamp, #cpu_usage, #device, #location, #unit, #topic, #loop_count, #project, #version",
-            "ExpressionAttributeNames": {
-                "#timestamp": "timestamp",
-                "#cpu_usage": "cpu_usage",
-                "#device": "device",
-                "#location": "location",
-                "#unit": "unit",
-                "#topic": "topic",
-                "#loop_count": "loop_count",
-                "#project": "project",
-                "#version": "version",
-                "#id": "id",
-            },
-        }
-
-        done = False
-        start_key = None
         try:
-            while not done:
-                if start_key:
-                    scan_kwargs["ExclusiveStartKey"] = start_key
-                response = cpu_metric_table.scan(**scan_kwargs)
-                all_cpu_metrics.extend(response.get("Items", []))
-                start_key = response.get("LastEvaluatedKey", None)
-                done = start_key is None
-
-            return all_cpu_metrics
+            return parallel_scan(
+                cpu_metric_table, _all_cpu_metrics_scan_kwargs(), total_segments=scan_segment_count(cpu_metric_table)
+            )
         except ClientError as err:
-            print(f"ClientError: {err}")
+            logger.error("ClientError: %s", err)
             raise ServerException()
 
     def _get_filtered_cpu_metrics(self, cpu_metric_table: Table, params: CpuMetricQueryParams) -> List[CpuMetricSchema]:
@@ -108,54 +310,50 @@ class CpuMetricsService:
         Returns:
             List[CpuMetricSchema]: list of cpu metrics data with all attributes included
         """
-        cpu_usage_value = int(params.cpu_usage_value)
-
         if params.location_value == "*":
-            return self._get_all_devices_filtered_by_cpu_usage(cpu_metric_table, cpu_usage_value, params.operator)
-
-        key_expressions = {
-            "eq": Key("cpu_usage").eq(cpu_usage_value),
-            "gt": Key("cpu_usage").gt(cpu_usage_value),
-            "lt": Key("cpu_usage").lt(cpu_usage_value),
-            "*": Key("cpu_usage").gt(0),  # all values
-        }
+            return self._get_all_devices_filtered_by_cpu_usage(
+                cpu_metric_table, int(params.cpu_usage_value), params.operator
+            )
 
         try:
-            response = cpu_metric_table.query(
-                IndexName="LocationIndex",  # Use the GSI name
-                KeyConditionExpression=(Key("location").eq(params.location_value) & key_expressions[params.operator]),
+            # follow every page, a single query stops at 1 MB of items
+            kwargs = _location_query_kwargs(
+                params.location_value, params.operator, int(params.cpu_usage_value), params.order
             )
+            pages = iter_pages(cpu_metric_table.query, kwargs)
+            return [item for items in pages for item in items]
         except ClientError as err:
-            print(f"ClientError: {err}")
+            logger.error("ClientError: %s", err)
             raise ServerException()
-        else:
-            return response.get("Items", [])
 
     def _get_all_devices_filtered_by_cpu_usage(
         self, cpu_metric_table: Table, cpu_usage: int, operator: str
     ) -> List[CpuMetricSchema]:
         """get all devices filtered by cpu usage
+        one location index query per location is run in parallel with the cpu usage as a key condition, so only
+        matching items are read, writes only accept the known locations so the queries cover every item
 
         Args:
             cpu_metric_table (Table): cpu metric table
             cpu_usage (int): cpu usage value
             operator (str): operator to filter by whch will be eq, gt, lt, or *
 
+        Raises:
+            ServerException: raised if a query fails
+
         Returns:
             List[CpuMetricSchema]: list of cpu metrics data with all attributes included
         """
-        all_cpu_metrics = self._get_all_cpu_metrics(cpu_metric_table)
-
         if operator == "*":
-            return all_cpu_metrics
+            return self._get_all_cpu_metrics(cpu_metric_table)
 
-        filter_operators = {
-            "eq": lambda x: x == cpu_usage,
-            "gt": lambda x: x > cpu_usage,
-            "lt": lambda x: x < cpu_usage,
-        }
+        queries = [_location_query_kwargs(location, operator, cpu_usage) for location in LOCATIONS]
 
-        return [metric for metric in all_cpu_metrics if filter_operators[operator](metric["cpu_usage"])]
+        try:
+            return parallel_query(cpu_metric_table, queries)
+        except ClientError as err:
+            logger.error("ClientError: %s", err)
+            raise ServerException()
 
     def create_cpu_metric(self, cpu_metric_table: Table, cpu_metric: CpuMetricCreateSchema) -> CpuMetricSchema:
         """router facing method to create a cpu metric
@@ -169,38 +367,51 @@ class CpuMetricsService:
         """
         item_data = cpu_metric.model_dump()
         item_data["id"] = str(uuid.uuid4())
-        item_data["timestamp"] = int(time.time())
+        if item_data["timestamp"] is None:
+            item_data["timestamp"] = int(time.time())
 
         try:
-            cpu_metric_table.put_item(Item=item_data)
+            cpu_metric_table.put_item(Item=with_table_keys(item_data, config_manager.RETENTION_DAYS))
         except ClientError as err:
-            print(f"ClientError: {err}")
+            logger.error("ClientError: %s", err)
             raise ServerException()
         else:
             return item_data
 
     def batch_create_cpu_metrics(
         self, cpu_metric_table: Table, cpu_metrics: List[CpuMetricCreateSchema]
-    ) -> List[CpuMetricSchema]:
+    ) -> CpuMetricBatchCreateResultSchema:
         """router facing method to batch create cpu metrics
+        the cpu metrics are written in concurrent chunks of 25 with unprocessed items retried, and each gets its own
+        result so a partly written batch can be retried for just the failed cpu metrics
 
         Args:
             cpu_metric_table (Table): cpu metric table
-            cpu_metrics (List[CpuMetricSchema]): list of cpu metric data
+            cpu_metrics (List[CpuMetricCreateSchema]): list of cpu metric data, each timestamp defaults to now
 
         Returns:
-            List[CpuMetricSchema]: list of created cpu metric data
+            CpuMetricBatchCreateResultSchema: created and failed counts and a result per cpu metric
         """
-        created_items: List[CpuMetricCreateSchema] = []
-        with cpu_metric_table.batch_writer() as batch:
-            for cpu_metric in cpu_metrics:
-                item_data = cpu_metric.model_dump()
-                item_data["id"] = str(uuid.uuid4())
-                item_data["timestamp"] = int(time.time())
-                created_items.append(item_data)
-                batch.put_item(Item=item_data)
-
-        return created_items
+        now = int(time.time())
+        items: List[dict[str, Any]] = []
+        for cpu_metric in cpu_metrics:
+            item_data = cpu_metric.model_dump()
+            item_data["id"] = str(uuid.uuid4())
+            if item_data["timestamp"] is None:
+                item_data["timestamp"] = now
+            items.append(with_table_keys(item_data, config_manager.RETENTION_DAYS))
+
+        errors = batch_put_items(cpu_metric_table, items, key_attributes=(PARTITION_KEY, SORT_KEY))
+
+        results = [
+            CpuMetricBatchItemResultSchema(index=index, status="created", item=item)
+            if error is None
+            else CpuMetricBatchItemResultSchema(index=index, status="failed", error=error)
+            for index, (item, error) in enumerate(zip(items, errors))
+        ]
+        failed = sum(error is not None for error in errors)
+
+        return CpuMetricBatchCreateResultSchema(created=len(items) - failed, failed=failed, results=results)
 
     def update_cpu_metric(self, cpu_metric_table: Table, cpu_metric: CpuMetricUpdateSchema) -> CpuMetricSchema:
         """router facing method to update a cpu metric
@@ -209,11 +420,20 @@ class CpuMetricsService:
             cpu_metric_table (Table): cpu metric table
             cpu_metric (CpuMetricUpdateSchema): cpu metric data
 
+        Raises:
+            InvalidRequestException: raised if no fields are provided or the device (part of the table key) is changed
+            CpuMetricNotFoundException: raised if the id does not exist
+            ServerException: raised if the update fails
+
         Returns:
             CpuMetricSchema: updated cpu metric data
         """
         item_data = cpu_metric.model_dump(exclude_none=True)
 
+        if "device" in item_data:
+            # the device is part of the partition key so it cannot be changed in place
+            raise InvalidRequestException("Device cannot be updated")
+
         update_expressions = []
         expression_values = {}
 
@@ -226,16 +446,17 @@ class CpuMetricsService:
             raise InvalidRequestException("No update fields provided")
 
         update_expression = "SET " + ", ".join(update_expressions)
+        item_key = self._get_item_key(cpu_metric_table, item_data["id"])
 
         try:
             response = cpu_metric_table.update_item(
-                Key={"id": item_data["id"]},
+                Key=item_key,
                 UpdateExpression=update_expression,
                 ExpressionAttributeValues=expression_values,
                 ReturnValues="ALL_NEW",
             )
         except ClientError as err:
-            print(f"ClientError: {err}")
+            logger.error("ClientError: %s", err)
             raise ServerException()
         else:
             return CpuMetricSchema(**response.get("Attributes", {}))
@@ -247,13 +468,352 @@ class CpuMetricsService:
             cpu_metric_table (Table): cpu metric table
             cpu_metric_id (str): cpu metric id
 
+        Raises:
+            CpuMetricNotFoundException: raised if the id does not exist
+            ServerException: raised if the delete fails
+
         Returns:
             CpuMetricSchema: deleted cpu metric data
         """
+        item_key = self._get_item_key(cpu_metric_table, cpu_metric_id)
+
         try:
-            response = cpu_metric_table.delete_item(Key={"id": cpu_metric_id}, ReturnValues="ALL_OLD")
+            response = cpu_metric_table.delete_item(Key=item_key, ReturnValues="ALL_OLD")
         except ClientError as err:
-            print(f"ClientError: {err}")
+            logger.error("ClientError: %s", err)
             raise ServerException()
         else:
             return CpuMetricSchema(**response.get("Attributes", {}))
+
+    def batch_get_cpu_metrics(
+        self, cpu_metric_table: Table, cpu_metric_ids: List[str]
+    ) -> CpuMetricBatchGetResultSchema:
+        """router facing method to get multiple cpu metrics by id
+        the ids are resolved to table keys concurrently, one id index query each, and the items read in concurrent
+        BatchGetItem chunks of 100 with unprocessed keys retried, each id gets its own result
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            cpu_metric_ids (List[str]): cpu metric ids, repeated ids are read once
+
+        Raises:
+            ServerException: raised if resolving the ids fails
+
+        Returns:
+            CpuMetricBatchGetResultSchema: found, not found and failed counts and a result per id
+        """
+        cpu_metric_ids = list(dict.fromkeys(cpu_metric_ids))
+        item_keys = self._get_item_keys(cpu_metric_table, cpu_metric_ids)
+        key_ids = [cpu_metric_id for cpu_metric_id in cpu_metric_ids if cpu_metric_id in item_keys]
+
+        reads = batch_get_items(
+            cpu_metric_table, [item_keys[cpu_metric_id] for cpu_metric_id in key_ids], (PARTITION_KEY, SORT_KEY)
+        )
+        reads_by_id = dict(zip(key_ids, reads))
+
+        results = []
+        for cpu_metric_id in cpu_metric_ids:
+            item, error = reads_by_id.get(cpu_metric_id, (None, None))
+            if error is not None:
+                results.append(CpuMetricBatchIdResultSchema(id=cpu_metric_id, status="failed", error=error))
+            elif item is None:
+                results.append(CpuMetricBatchIdResultSchema(id=cpu_metric_id, status="not_found"))
+            else:
+                results.append(CpuMetricBatchIdResultSchema(id=cpu_metric_id, status="found", item=item))
+
+        return CpuMetricBatchGetResultSchema(
+            found=sum(result.status == "found" for result in results),
+            not_found=sum(result.status == "not_found" for result in results),
+            failed=sum(result.status == "failed" for result in results),
+            results=results,
+        )
+
+    def batch_delete_cpu_metrics(
+        self, cpu_metric_table: Table, cpu_metric_ids: List[str]
+    ) -> CpuMetricBatchDeleteResultSchema:
+        """router facing method to delete multiple cpu metrics by id
+        the ids are resolved to table keys concurrently, one id index query each, and the items deleted in concurrent BatchWriteItem chunks of 25
+        with unprocessed deletes retried, each id gets its own result so a partly deleted batch can be retried for just
+        the failed ids
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            cpu_metric_ids (List[str]): cpu metric ids, repeated ids are deleted once
+
+        Raises:
+            ServerException: raised if resolving the ids fails
+
+        Returns:
+            CpuMetricBatchDeleteResultSchema: deleted, not found and failed counts and a result per id
+        """
+        cpu_metric_ids = list(dict.fromkeys(cpu_metric_ids))
+        item_keys = self._get_item_keys(cpu_metric_table, cpu_metric_ids)
+        key_ids = [cpu_metric_id for cpu_metric_id in cpu_metric_ids if cpu_metric_id in item_keys]
+
+        errors = batch_delete_items(
+            cpu_metric_table, [item_keys[cpu_metric_id] for cpu_metric_id in key_ids], (PARTITION_KEY, SORT_KEY)
+        )
+        errors_by_id = dict(zip(key_ids, errors))
+
+        results = []
+        for cpu_metric_id in cpu_metric_ids:
+            if cpu_metric_id not in errors_by_id:
+                results.append(CpuMetricBatchIdResultSchema(id=cpu_metric_id, status="not_found"))
+            elif errors_by_id[cpu_metric_id] is not None:
+                results.append(
+                    CpuMetricBatchIdResultSchema(id=cpu_metric_id, status="failed", error=errors_by_id[cpu_metric_id])
+                )
+            else:
+                results.append(CpuMetricBatchIdResultSchema(id=cpu_metric_id, status="deleted"))
+
+        return CpuMetricBatchDeleteResultSchema(
+            deleted=sum(result.status == "deleted" for result in results),
+            not_found=sum(result.status == "not_found" for result in results),
+            failed=sum(result.status == "failed" for result in results),
+            results=results,
+        )
+
+    def _get_item_key(self, cpu_metric_table: Table, cpu_metric_id: str) -> dict[str, str]:
+        """resolve a cpu metric id to its device#day / timestamp#id table key through the id index
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            cpu_metric_id (str): cpu metric id
+
+        Raises:
+            CpuMetricNotFoundException: raised if the id does not exist
+            ServerException: raised if the query fails
+
+        Returns:
+            dict[str, str]: table key of the item
+        """
+        try:
+            response = cpu_metric_table.query(
+                IndexName=ID_INDEX_NAME,
+                KeyConditionExpression=Key("id").eq(cpu_metric_id),
+            )
+        except ClientError as err:
+            logger.error("ClientError: %s", err)
+            raise ServerException()
+
+        items = response.get("Items", [])
+        if not items:
+            raise CpuMetricNotFoundException()
+
+        return {PARTITION_KEY: items[0][PARTITION_KEY], SORT_KEY: items[0][SORT_KEY]}
+
+    def _get_item_keys(self, cpu_metric_table: Table, cpu_metric_ids: List[str]) -> dict[str, dict[str, str]]:
+        """resolve cpu metric ids to their table keys with concurrent queries of the id index
+        the id index is keyed by id alone, so every id is its own query on the shared scan pool and the routes cap a
+        request at BATCH_IDS_MAX_ITEMS ids
+
+        Args:
+            cpu_metric_table (Table): cpu metric table
+            cpu_metric_ids (List[str]): cpu metric ids
+
+        Raises:
+            ServerException: raised if a query fails
+
+        Returns:
+            dict[str, dict[str, str]]: table key by id, ids that do not exist are left out
+        """
+        queries = [
+            {"IndexName": ID_INDEX_NAME, "KeyConditionExpression": Key("id").eq(cpu_metric_id)}
+            for cpu_metric_id in cpu_metric_ids
+        ]
+
+        try:
+            items = parallel_query(cpu_metric_table, queries)
+        except ClientError as err:
+            logger.error("ClientError: %s", err)
+            raise ServerException()
+
+        return {item["id"]: {PARTITION_KEY: item[PARTITION_KEY], SORT_KEY: item[SORT_KEY]} for item in items}
+
+
+def _cpu_usage_condition(cpu_usage: Key | Attr, operator: str, cpu_usage_value: int) -> ConditionBase:
+    """build the cpu usage condition for an operator
+
+    Args:
+        cpu_usage (Key | Attr): Key for a key condition, Attr for a filter expression
+        operator (str): operator to filter by which will be eq, gt, lt, or *
+        cpu_usage_value (int): cpu usage value
+
+    Returns:
+        ConditionBase: cpu usage condition, * matches all values
+    """
+    conditions = {
+        "eq": cpu_usage.eq(cpu_usage_value),
+        "gt": cpu_usage.gt(cpu_usage_value),
+        "lt": cpu_usage.lt(cpu_usage_value),
+        "*": cpu_usage.gt(0),  # all values
+    }
+    return conditions[operator]
+
+
+def _location_query_kwargs(
+    location: str, operator: str, cpu_usage_value: int, order: str | None = None
+) -> dict[str, Any]:
+    """query parameters for the location index, ordered by cpu usage when an order is provided
+
+    Args:
+        location (str): location
+        operator (str): operator to filter by which will be eq, gt, lt, or *
+        cpu_usage_value (int): cpu usage value
+        order (str | None): asc or desc, None keeps the index order
+
+    Returns:
+        dict[str, Any]: query parameters
+    """
+    kwargs = {
+        "IndexName": LOCATION_INDEX_NAME,
+        "KeyConditionExpression": Key("location").eq(location)
+        & _cpu_usage_condition(Key("cpu_usage"), operator, cpu_usage_value),
+    }
+    if order is not None:
+        # cpu_usage is the index sort key so descending order with a limit reads only the top N items
+        kwargs["ScanIndexForward"] = order == "asc"
+    return kwargs
+
+
+def _location_time_range_query_kwargs(location: str, start: int, end: int) -> dict[str, Any]:
+    """query parameters for the location timestamp index between two timestamps
+
+    Args:
+        location (str): location
+        start (int): epoch seconds (inclusive)
+        end (int): epoch seconds (inclusive)
+
+    Returns:
+        dict[str, Any]: query parameters
+    """
+    return {
+        "IndexName": LOCATION_TIMESTAMP_INDEX_NAME,
+        "KeyConditionExpression": Key("location").eq(location) & Key("timestamp").between(start, end),
+    }
+
+
+def _time_range_queries(params: CpuMetricQueryParams, start: int, end: int) -> List[dict[str, Any]]:
+    """build the key condition queries of a time range, one per device#day partition for a device, otherwise one
+    per location on the location timestamp index, in the requested order
+
+    Args:
+        params (CpuMetricQueryParams): query parameters including device, location, filters and order
+        start (int): epoch seconds (inclusive)
+        end (int): epoch seconds (inclusive)
+
+    Returns:
+        List[dict[str, Any]]: query parameters in read order
+    """
+    if params.device is not None:
+        lower, upper = timestamp_id_range(start, end)
+        queries = [
+            {"KeyConditionExpression": Key(PARTITION_KEY).eq(day_key) & Key(SORT_KEY).between(lower, upper)}
+            for day_key in device_day_keys(params.device, start, end)
+        ]
+        if params.order == "desc":
+            queries.reverse()
+    else:
+        locations = LOCATIONS if params.location_value in (None, "*") else [params.location_value]
+        queries = [_location_time_range_query_kwargs(location, start, end) for location in locations]
+
+    filter_expression = _time_range_filter(params)
+    for query in queries:
+        query["ScanIndexForward"] = params.order != "desc"
+        if filter_expression is not None:
+            query["FilterExpression"] = filter_expression
+    return queries
+
+
+def _has_time_range(params: CpuMetricQueryParams) -> bool:
+    """check whether the query parameters ask for a time range
+
+    Args:
+        params (CpuMetricQueryParams): query parameters
+
+    Returns:
+        bool: True if a start, end or device is provided
+    """
+    return params.start is not None or params.end is not None or params.device is not None
+
+
+def _time_range(params: CpuMetricQueryParams) -> tuple[int, int]:
+    """resolve the time range, end defaults to now and start to a day before end
+
+    Args:
+        params (CpuMetricQueryParams): query parameters
+
+    Raises:
+        InvalidRequestException: raised if start is after end or the range is longer than MAX_TIME_RANGE_DAYS
+
+    Returns:
+        tuple[int, int]: start and end epoch seconds (inclusive)
+    """
+    end = params.end if params.end is not None else int(time.time())
+    start = params.start if params.start is not None else end - DEFAULT_TIME_RANGE_SECONDS
+
+    if start > end:
+        raise InvalidRequestException("start must not be after end")
+    if end - start > MAX_TIME_RANGE_DAYS * DEFAULT_TIME_RANGE_SECONDS:
+        raise InvalidRequestException(f"time range must not exceed {MAX_TIME_RANGE_DAYS} days")
+
+    return start, end
+
+
+def _time_range_filter(params: CpuMetricQueryParams) -> ConditionBase | None:
+    """filter expression for the location and cpu usage of a time range read
+
+    Args:
+        params (CpuMetricQueryParams): query parameters
+
+    Returns:
+        ConditionBase | None: filter expression, None if nothing is filtered
+    """
+    conditions = []
+    if params.device is not None and params.location_value not in (None, "*"):
+        conditions.append(Attr("location").eq(params.location_value))
+    if params.operator not in (None, "*") and params.cpu_usage_value is not None:
+        conditions.append(_cpu_usage_condition(Attr("cpu_usage"), params.operator, int(params.cpu_usage_value)))
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else conditions[0] & conditions[1]
+
+
+def _check_order_has_location(params: CpuMetricQueryParams) -> None:
+    """only location queries, ordered by the cpu usage sort key of the location index, and time ranges, ordered by
+    timestamp, can be ordered
+
+    Args:
+        params (CpuMetricQueryParams): query parameters
+
+    Raises:
+        InvalidRequestException: raised if an order is provided without a single location or a time range
+    """
+    has_location = params.location_value not in (None, "*") and params.operator and params.cpu_usage_value is not None
+    if params.order is not None and not has_location and not _has_time_range(params):
+        raise InvalidRequestException("order requires a location_value other than * or a time range")
+
+
+def _all_cpu_metrics_scan_kwargs() -> dict[str, Any]:
+    """scan parameters for all items in the table where the timestamp is greater than 0 (all items with a timestamp)
+
+    Returns:
+        dict[str, Any]: scan parameters
+    """
+    return {
+        "FilterExpression": Key("timestamp").gt(0),
+        "ProjectionExpression": "#id, #timestamp, #cpu_usage, #device, #location, #unit, #topic, #loop_count, #project, #version",
+        "ExpressionAttributeNames": {
+            "#timestamp": "timestamp",
+            "#cpu_usage": "cpu_usage",
+            "#device": "device",
+            "#location": "location",
+            "#unit": "unit",
+            "#topic": "topic",
+            "#loop_count": "loop_count",
+            "#project": "project",
+            "#version": "version",
+            "#id": "id",
+        },
+    }
@@ -0,0 +1,320 @@
+"""
+Concurrent chunked batch reads and writes on a DynamoDB table
+
+Items are split into BatchWriteItem chunks of 25 and keys into BatchGetItem chunks of 100, the most DynamoDB accepts in
+one request, and the chunks are run concurrently on a bounded thread pool. DynamoDB may process only part of a chunk and
+return the rest as UnprocessedItems or UnprocessedKeys when the table or a partition is throttled (or a BatchGetItem
+response reaches 16 MB), those are retried until they are processed or the attempts run out.
+
+Retries wait with full jitter on a backoff shared by every chunk of the call: throttling doubles the delay and clean
+requests halve it, so concurrent chunks slow down together while the table is throttled and speed back up once it is
+not. Each item or key gets its own result, None once processed or the reason it was not.
+
+Resource
+--------
+- https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchWriteItem.html
+- https://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchGetItem.html
+- https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+
+Author: Tom Aston
+"""
+
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable
+
+from botocore.exceptions import BotoCoreError, ClientError
+from mypy_boto3_dynamodb.service_resource import Table
+
+from ..config import config_manager
+
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_GET_MAX_KEYS = 100
+THROTTLING_ERROR_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+
+logger = logging.getLogger(__name__)
+
+batch_executor = ThreadPoolExecutor(max_workers=config_manager.BATCH_CONCURRENCY, thread_name_prefix="dynamodb-batch")
+
+
+class AdaptiveBackoff:
+    """
+    Retry delay shared by concurrent chunks, doubled on throttling and halved on clean requests
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 0.05,
+        max_delay: float = 5.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """initialise the backoff
+
+        Args:
+            base_delay (float): smallest delay in seconds
+            max_delay (float): largest delay in seconds
+            sleep (Callable[[float], None]): sleeps for the given seconds, replaceable in tests
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = base_delay
+        self._sleep = sleep
+        self._lock = Lock()
+
+    def throttled(self) -> None:
+        """double the delay after a throttled request"""
+        with self._lock:
+            self.delay = min(self.max_delay, self.delay * 2)
+
+    def succeeded(self) -> None:
+        """halve the delay after a clean request"""
+        with self._lock:
+            self.delay = max(self.base_delay, self.delay / 2)
+
+    def wait(self) -> None:
+        """sleep for a random time up to the current delay"""
+        self._sleep(random.uniform(0, self.delay))
+
+
+def batch_put_items(
+    table: Table,
+    items: list[dict[str, Any]],
+    key_attributes: tuple[str, ...],
+    executor: ThreadPoolExecutor = batch_executor,
+    max_attempts: int = config_manager.BATCH_MAX_ATTEMPTS,
+    backoff: AdaptiveBackoff | None = None,
+) -> list[str | None]:
+    """put the items in concurrent chunks of BATCH_WRITE_MAX_ITEMS, retrying unprocessed items
+
+    Args:
+        table (Table): table to write to
+        items (list[dict[str, Any]]): items to put, keys must be unique
+        key_attributes (tuple[str, ...]): key attribute names of the table, used to match unprocessed items
+        executor (ThreadPoolExecutor): pool the chunks are written on
+        max_attempts (int): BatchWriteItem calls per chunk before the remaining items fail
+        backoff (AdaptiveBackoff | None): retry delay shared by the chunks, a new one if None
+
+    Returns:
+        list[str | None]: per item, None once written or the reason it was not written
+    """
+    requests = [{"PutRequest": {"Item": item}} for item in items]
+    return _run_chunks(
+        _write_chunk, requests, BATCH_WRITE_MAX_ITEMS, executor, table, key_attributes, max_attempts, backoff
+    )
+
+
+def batch_delete_items(
+    table: Table,
+    keys: list[dict[str, Any]],
+    key_attributes: tuple[str, ...],
+    executor: ThreadPoolExecutor = batch_executor,
+    max_attempts: int = config_manager.BATCH_MAX_ATTEMPTS,
+    backoff: AdaptiveBackoff | None = None,
+) -> list[str | None]:
+    """delete the items with the keys in concurrent chunks of BATCH_WRITE_MAX_ITEMS, retrying unprocessed deletes
+    deleting a key with no item succeeds, as it does for DeleteItem
+
+    Args:
+        table (Table): table to delete from
+        keys (list[dict[str, Any]]): table keys of the items, must be unique
+        key_attributes (tuple[str, ...]): key attribute names of the table, used to match unprocessed deletes
+        executor (ThreadPoolExecutor): pool the chunks are written on
+        max_attempts (int): BatchWriteItem calls per chunk before the remaining deletes fail
+        backoff (AdaptiveBackoff | None): retry delay shared by the chunks, a new one if None
+
+    Returns:
+        list[str | None]: per key, None once deleted or the reason it was not deleted
+    """
+    requests = [{"DeleteRequest": {"Key": key}} for key in keys]
+    return _run_chunks(
+        _write_chunk, requests, BATCH_WRITE_MAX_ITEMS, executor, table, key_attributes, max_attempts, backoff
+    )
+
+
+def batch_get_items(
+    table: Table,
+    keys: list[dict[str, Any]],
+    key_attributes: tuple[str, ...],
+    executor: ThreadPoolExecutor = batch_executor,
+    max_attempts: int = config_manager.BATCH_MAX_ATTEMPTS,
+    backoff: AdaptiveBackoff | None = None,
+) -> list[tuple[dict[str, Any] | None, str | None]]:
+    """get the items with the keys in concurrent chunks of BATCH_GET_MAX_KEYS, retrying unprocessed keys
+
+    Args:
+        table (Table): table to read from
+        keys (list[dict[str, Any]]): table keys of the items, must be unique
+        key_attributes (tuple[str, ...]): key attribute names of the table, used to match items to their keys
+        executor (ThreadPoolExecutor): pool the chunks are read on
+        max_attempts (int): BatchGetItem calls per chunk before the remaining keys fail
+        backoff (AdaptiveBackoff | None): retry delay shared by the chunks, a new one if None
+
+    Returns:
+        list[tuple[dict[str, Any] | None, str | None]]: per key, the item (None if it does not exist or was not read)
+            and None once read or the reason it was not read
+    """
+    return _run_chunks(_get_chunk, keys, BATCH_GET_MAX_KEYS, executor, table, key_attributes, max_attempts, backoff)
+
+
+def _run_chunks(
+    run_chunk: Callable[..., list[Any]],
+    values: list[Any],
+    chunk_size: int,
+    executor: ThreadPoolExecutor,
+    table: Table,
+    key_attributes: tuple[str, ...],
+    max_attempts: int,
+    backoff: AdaptiveBackoff | None,
+) -> list[Any]:
+    """split the values into chunks, run the chunks concurrently and join their results in the order of the values
+
+    Args:
+        run_chunk (Callable[..., list[Any]]): runs one chunk, returning a result per value of the chunk
+        values (list[Any]): requests or keys to run
+        chunk_size (int): most values per chunk
+        executor (ThreadPoolExecutor): pool the chunks are run on
+        table (Table): table of the requests
+        key_attributes (tuple[str, ...]): key attribute names of the table
+        max_attempts (int): calls per chunk before the remaining values fail
+        backoff (AdaptiveBackoff | None): retry delay shared by the chunks, a new one if None
+
+    Returns:
+        list[Any]: per value, the result of its chunk
+    """
+    backoff = backoff or AdaptiveBackoff()
+    futures = [
+        executor.submit(run_chunk, table, values[start : start + chunk_size], key_attributes, max_attempts, backoff)
+        for start in range(0, len(values), chunk_size)
+    ]
+    return [result for future in futures for result in future.result()]
+
+
+def _write_chunk(
+    table: Table,
+    requests: list[dict[str, Any]],
+    key_attributes: tuple[str, ...],
+    max_attempts: int,
+    backoff: AdaptiveBackoff,
+) -> list[str | None]:
+    """send up to BATCH_WRITE_MAX_ITEMS put or delete requests, retrying the unprocessed ones
+
+    Args:
+        table (Table): table to write to
+        requests (list[dict[str, Any]]): PutRequest or DeleteRequest write requests of the chunk
+        key_attributes (tuple[str, ...]): key attribute names of the table
+        max_attempts (int): BatchWriteItem calls before the remaining requests fail
+        backoff (AdaptiveBackoff): retry delay shared by the chunks
+
+    Returns:
+        list[str | None]: per request of the chunk, None once written or the reason it was not written
+    """
+
+    def request_key(request: dict[str, Any]) -> tuple[Any, ...]:
+        attributes = request["PutRequest"]["Item"] if "PutRequest" in request else request["DeleteRequest"]["Key"]
+        return tuple(attributes[attribute] for attribute in key_attributes)
+
+    def write(pending: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        response = table.meta.client.batch_write_item(RequestItems={table.name: pending})
+        return response.get("UnprocessedItems", {}).get(table.name, [])
+
+    positions = {request_key(request): position for position, request in enumerate(requests)}
+    errors: list[str | None] = [None] * len(requests)
+
+    unprocessed, error = _retry_unprocessed(write, requests, max_attempts, backoff)
+    for request in unprocessed:
+        errors[positions[request_key(request)]] = error
+
+    return errors
+
+
+def _get_chunk(
+    table: Table,
+    keys: list[dict[str, Any]],
+    key_attributes: tuple[str, ...],
+    max_attempts: int,
+    backoff: AdaptiveBackoff,
+) -> list[tuple[dict[str, Any] | None, str | None]]:
+    """get up to BATCH_GET_MAX_KEYS items, retrying the unprocessed keys
+
+    Args:
+        table (Table): table to read from
+        keys (list[dict[str, Any]]): table keys of the chunk
+        key_attributes (tuple[str, ...]): key attribute names of the table
+        max_attempts (int): BatchGetItem calls before the remaining keys fail
+        backoff (AdaptiveBackoff): retry delay shared by the chunks
+
+    Returns:
+        list[tuple[dict[str, Any] | None, str | None]]: per key of the chunk, the item and None once read or the
+            reason it was not read
+    """
+
+    def key_of(attributes: dict[str, Any]) -> tuple[Any, ...]:
+        return tuple(attributes[attribute] for attribute in key_attributes)
+
+    positions = {key_of(key): position for position, key in enumerate(keys)}
+    results: list[tuple[dict[str, Any] | None, str | None]] = [(None, None)] * len(keys)
+
+    def get(pending: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        response = table.meta.client.batch_get_item(RequestItems={table.name: {"Keys": pending}})
+        for item in response.get("Responses", {}).get(table.name, []):
+            results[positions[key_of(item)]] = (item, None)
+        return response.get("UnprocessedKeys", {}).get(table.name, {}).get("Keys", [])
+
+    unprocessed, error = _retry_unprocessed(get, keys, max_attempts, backoff)
+    for key in unprocessed:
+        results[positions[key_of(key)]] = (None, error)
+
+    return results
+
+
+def _retry_unprocessed(
+    send: Callable[[list[dict[str, Any]]], list[dict[str, Any]]],
+    requests: list[dict[str, Any]],
+    max_attempts: int,
+    backoff: AdaptiveBackoff,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """send the requests, resending the unprocessed ones with backoff until none are left or the attempts run out
+    throttling errors are retried, any other error, including errors raised by botocore before a response such as
+    connection errors, fails every request still pending so only the requests of this chunk fail
+
+    Args:
+        send (Callable[[list[dict[str, Any]]], list[dict[str, Any]]]): sends requests and returns the unprocessed ones
+        requests (list[dict[str, Any]]): requests of the chunk
+        max_attempts (int): calls before the remaining requests fail
+        backoff (AdaptiveBackoff): retry delay shared by the chunks
+
+    Returns:
+        tuple[list[dict[str, Any]], str | None]: requests that were not processed and the reason, None if all were
+    """
+    pending = requests
+    error = f"Unprocessed after {max_attempts} attempts"
+
+    for attempt in range(max_attempts):
+        if attempt:
+            backoff.wait()
+
+        try:
+            unprocessed = send(pending)
+        except ClientError as err:
+            logger.warning("ClientError: %s", err)
+            error_code = err.response["Error"]["Code"]
+            if error_code not in THROTTLING_ERROR_CODES:
+                return pending, error_code
+            error = f"{error_code} after {max_attempts} attempts"
+            backoff.throttled()
+            continue
+        except BotoCoreError as err:
+            return pending, type(err).__name__
+
+        if not unprocessed:
+            backoff.succeeded()
+            return [], None
+
+        backoff.throttled()
+        pending = unprocessed
+        error = f"Unprocessed after {max_attempts} attempts"
+
+    return pending, error
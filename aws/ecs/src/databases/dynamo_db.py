@@ -4,31 +4,64 @@ Module to interact with DynamoDB database
 The CpuMetricDatabase class is used to interact with the DynamoDB table that stores the CPU metrics data.
 There are functions to create the table, check if it exists, and populate it with test data.
 
+boto3 calls block, so the async routes run them on a dedicated executor sized by DB_EXECUTOR_MAX_WORKERS rather than
+on the Starlette threadpool. A request waiting on DynamoDB then holds no threadpool slot and at most
+DB_EXECUTOR_MAX_WORKERS calls are in flight, the rest queue on the executor without a thread each.
+
 Author: Tom Aston
 """
 
+import asyncio
 import random
 import time
 import uuid
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Any, Callable, TypeVar
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from mypy_boto3_dynamodb import DynamoDBClient, DynamoDBServiceResource
 from mypy_boto3_dynamodb.service_resource import Table
 
 from ..config import EnvrinomentEnum, config_manager
+from ..cpu_metrics.keys import (
+    ID_INDEX_NAME,
+    LOCATION_INDEX_NAME,
+    LOCATION_TIMESTAMP_INDEX_NAME,
+    PARTITION_KEY,
+    SORT_KEY,
+    with_table_keys,
+)
+
+T = TypeVar("T")
+
+# enough pooled connections for every executor thread, parallel scan segment and batch chunk to run at once
+boto_config = Config(
+    max_pool_connections=config_manager.DB_EXECUTOR_MAX_WORKERS
+    + config_manager.SCAN_MAX_SEGMENTS
+    + config_manager.BATCH_CONCURRENCY
+)
+
+db_executor = ThreadPoolExecutor(max_workers=config_manager.DB_EXECUTOR_MAX_WORKERS, thread_name_prefix="dynamodb")
 
 if config_manager.ENVIRONMENT == EnvrinomentEnum.LOCAL:
     dynamodb_client = boto3.client(
-        "dynamodb", region_name=config_manager.DYNAMODB_REGION, endpoint_url=config_manager.DYNAMODB_ENDPOINT
+        "dynamodb",
+        region_name=config_manager.DYNAMODB_REGION,
+        endpoint_url=config_manager.DYNAMODB_ENDPOINT,
+        config=boto_config,
     )
     dynamodb_resource = boto3.resource(
-        "dynamodb", region_name=config_manager.DYNAMODB_REGION, endpoint_url=config_manager.DYNAMODB_ENDPOINT
+        "dynamodb",
+        region_name=config_manager.DYNAMODB_REGION,
+        endpoint_url=config_manager.DYNAMODB_ENDPOINT,
+        config=boto_config,
     )
 else:  # Production (ECS)
-    dynamodb_client = boto3.client("dynamodb")
-    dynamodb_resource = boto3.resource("dynamodb")
+    dynamodb_client = boto3.client("dynamodb", config=boto_config)
+    dynamodb_resource = boto3.resource("dynamodb", config=boto_config)
 
 
 class CpuMetricDatabase:
@@ -71,32 +104,42 @@ class CpuMetricDatabase:
             table = self.resource.create_table(
                 TableName=config_manager.DB_TABLE_NAME,
                 AttributeDefinitions=[
-                    {"AttributeName": "id", "AttributeType": "S"},  # Partition Key
-                    {"AttributeName": "timestamp", "AttributeType": "N"},  # GSI Sort Key
-                    {"AttributeName": "cpu_usage", "AttributeType": "N"},  # GSI Partition Key
+                    {"AttributeName": PARTITION_KEY, "AttributeType": "S"},  # Partition Key (device#day)
+                    {"AttributeName": SORT_KEY, "AttributeType": "S"},  # Sort Key (timestamp#id)
+                    {"AttributeName": "id", "AttributeType": "S"},  # GSI Partition Key
+                    {"AttributeName": "cpu_usage", "AttributeType": "N"},  # GSI Sort Key
                     {"AttributeName": "location", "AttributeType": "S"},  # GSI Partition Key
+                    {"AttributeName": "timestamp", "AttributeType": "N"},  # GSI Sort Key
                 ],
                 KeySchema=[
-                    {"AttributeName": "id", "KeyType": "HASH"},  # Primary Key
+                    {"AttributeName": PARTITION_KEY, "KeyType": "HASH"},  # Partition Key
+                    {"AttributeName": SORT_KEY, "KeyType": "RANGE"},  # Sort Key
                 ],
                 BillingMode="PAY_PER_REQUEST",  # On-demand billing
                 GlobalSecondaryIndexes=[
                     {
-                        "IndexName": "TimestampCpuUsageIndex",
+                        "IndexName": ID_INDEX_NAME,
                         "KeySchema": [
-                            {"AttributeName": "cpu_usage", "KeyType": "HASH"},  # GSI Partition Key
-                            {"AttributeName": "timestamp", "KeyType": "RANGE"},  # GSI Sort Key
+                            {"AttributeName": "id", "KeyType": "HASH"},  # GSI Partition Key
                         ],
-                        "Projection": {"ProjectionType": "ALL"},
+                        "Projection": {"ProjectionType": "KEYS_ONLY"},  # only used to resolve an id to its key
                     },
                     {
-                        "IndexName": "LocationIndex",
+                        "IndexName": LOCATION_INDEX_NAME,
                         "KeySchema": [
                             {"AttributeName": "location", "KeyType": "HASH"},  # GSI Partition Key
                             {"AttributeName": "cpu_usage", "KeyType": "RANGE"},  # GSI Sort Key
                         ],
                         "Projection": {"ProjectionType": "ALL"},
                     },
+                    {
+                        "IndexName": LOCATION_TIMESTAMP_INDEX_NAME,  # time-range reads for a location
+                        "KeySchema": [
+                            {"AttributeName": "location", "KeyType": "HASH"},  # GSI Partition Key
+                            {"AttributeName": "timestamp", "KeyType": "RANGE"},  # GSI Sort Key
+                        ],
+                        "Projection": {"ProjectionType": "ALL"},
+                    },
                 ],
             )
             print("Creating table, please wait...")
@@ -126,7 +169,7 @@ class CpuMetricDatabase:
                 "version": "1.0",
             }
 
-            table.put_item(Item=test_data)
+            table.put_item(Item=with_table_keys(test_data))
 
 
 @lru_cache()
@@ -135,11 +178,25 @@ def get_database() -> CpuMetricDatabase:
     return CpuMetricDatabase(config_manager.DB_TABLE_NAME, dynamodb_resource, dynamodb_client)
 
 
-def get_db_table() -> Table:
+async def get_db_table() -> Table:
     """Retrieve the DynamoDB table."""
     return get_database().get_table()
 
 
+async def run_in_db_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """run a blocking DynamoDB call on the database executor without blocking the event loop
+
+    Args:
+        func (Callable[..., T]): blocking function
+        *args (Any): positional arguments of func
+        **kwargs (Any): keyword arguments of func
+
+    Returns:
+        T: return value of func, exceptions are raised in the caller
+    """
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+
 # Initialize the database only in LOCAL environment
 if config_manager.ENVIRONMENT == EnvrinomentEnum.LOCAL:
     db = get_database()
@@ -0,0 +1,251 @@
+"""
+Parallel scans and queries of a DynamoDB table
+
+A full table read is split into TotalSegments segments that are scanned concurrently on a bounded thread pool, each
+worker paging through its own segment. The segment count follows the table size reported by DescribeTable (updated by
+DynamoDB roughly every six hours, so it is cached for the same period) so small tables keep a single serial scan.
+
+Independent queries, such as one per location on the location index, are fanned out on the same pool.
+
+The table's own client is not safe to fan out on: it carries the resource's condition expression handler, which
+resets and fills a single ConditionExpressionBuilder shared by every call, so concurrent Key/Attr conditions corrupt
+each other's #n/:v placeholders. Each request is therefore built once on the calling thread, with its own builder and
+the values serialised to DynamoDB typed form, and the workers send the finished strings through the plain low-level
+client, which has no such handlers and is thread safe. Items are deserialised as each page arrives and appended to a
+single result list under a lock so no per-segment copies are built and merged.
+
+Resource
+--------
+- https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Scan.html#Scan.ParallelScan
+
+Author: Tom Aston
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Callable
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from mypy_boto3_dynamodb import DynamoDBClient
+from mypy_boto3_dynamodb.service_resource import Table
+
+from ..config import config_manager
+from .dynamo_db import dynamodb_client
+
+SEGMENT_COUNT_CACHE_SECONDS = 6 * 60 * 60
+
+scan_executor = ThreadPoolExecutor(max_workers=config_manager.SCAN_MAX_SEGMENTS, thread_name_prefix="dynamodb-scan")
+
+_segment_counts: dict[str, tuple[float, int]] = {}
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def scan_segment_count(
+    table: Table,
+    segment_size_bytes: int = config_manager.SCAN_SEGMENT_SIZE_BYTES,
+    max_segments: int = config_manager.SCAN_MAX_SEGMENTS,
+) -> int:
+    """get the number of parallel scan segments for the table size
+
+    Args:
+        table (Table): table to scan
+        segment_size_bytes (int): table bytes read by each segment
+        max_segments (int): upper bound on the segment count
+
+    Returns:
+        int: number of segments, 1 for tables smaller than one segment
+    """
+    cached = _segment_counts.get(table.name)
+    if cached is not None and time.monotonic() - cached[0] < SEGMENT_COUNT_CACHE_SECONDS:
+        return cached[1]
+
+    segments = max(1, min(max_segments, -(-table.table_size_bytes // segment_size_bytes)))
+    _segment_counts[table.name] = (time.monotonic(), segments)
+
+    return segments
+
+
+def parallel_scan(
+    table: Table,
+    scan_kwargs: dict[str, Any],
+    total_segments: int,
+    executor: ThreadPoolExecutor = scan_executor,
+    client: DynamoDBClient | None = None,
+) -> list[dict[str, Any]]:
+    """scan every item of the table, one worker per segment
+
+    Args:
+        table (Table): table to scan
+        scan_kwargs (dict[str, Any]): scan parameters e.g. FilterExpression and ProjectionExpression
+        total_segments (int): number of segments, 1 scans serially on the calling thread
+        executor (ThreadPoolExecutor): pool the segments are scanned on
+        client (DynamoDBClient | None): plain low-level client the segments are scanned with, the shared one if None
+
+    Raises:
+        ClientError: the first error raised by a segment, the remaining segments are cancelled
+
+    Returns:
+        list[dict[str, Any]]: every item, in no particular order across segments
+    """
+    request = build_request(table.name, scan_kwargs)
+    operation = (client or dynamodb_client).scan
+
+    if total_segments == 1:
+        return _run_all(operation, [request], executor=None)
+
+    return _run_all(
+        operation,
+        [{**request, "Segment": segment, "TotalSegments": total_segments} for segment in range(total_segments)],
+        executor,
+    )
+
+
+def parallel_query(
+    table: Table,
+    queries: list[dict[str, Any]],
+    executor: ThreadPoolExecutor = scan_executor,
+    client: DynamoDBClient | None = None,
+) -> list[dict[str, Any]]:
+    """run several queries concurrently, following every page of each, and merge their items
+
+    Args:
+        table (Table): table to query
+        queries (list[dict[str, Any]]): query parameters e.g. IndexName and KeyConditionExpression, one per query
+        executor (ThreadPoolExecutor): pool the queries are run on
+        client (DynamoDBClient | None): plain low-level client the queries are run with, the shared one if None
+
+    Raises:
+        ClientError: the first error raised by a query, the remaining queries are cancelled
+
+    Returns:
+        list[dict[str, Any]]: items of every query, in no particular order across queries
+    """
+    return _run_all(
+        (client or dynamodb_client).query,
+        [build_request(table.name, query_kwargs) for query_kwargs in queries],
+        executor if len(queries) > 1 else None,
+    )
+
+
+def build_request(table_name: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+    """build scan or query parameters for the plain low-level client
+
+    Key and Attr conditions are turned into expression strings with a builder of their own, so requests built on
+    different threads never share placeholder counters, and the values and ExclusiveStartKey are serialised to DynamoDB
+    typed form.
+
+    Args:
+        table_name (str): table to read
+        kwargs (dict[str, Any]): scan or query parameters as passed to the table resource
+
+    Returns:
+        dict[str, Any]: parameters including the TableName, the caller's dictionaries are not modified
+    """
+    builder = ConditionExpressionBuilder()
+    request = {**kwargs, "TableName": table_name}
+    names = {**kwargs.get("ExpressionAttributeNames", {})}
+    values = {**kwargs.get("ExpressionAttributeValues", {})}
+
+    for name, is_key_condition in (("KeyConditionExpression", True), ("FilterExpression", False)):
+        condition = request.get(name)
+        if isinstance(condition, ConditionBase):
+            expression = builder.build_expression(condition, is_key_condition=is_key_condition)
+            request[name] = expression.condition_expression
+            names.update(expression.attribute_name_placeholders)
+            values.update(expression.attribute_value_placeholders)
+
+    if names:
+        request["ExpressionAttributeNames"] = names
+    if values:
+        request["ExpressionAttributeValues"] = {key: _serializer.serialize(value) for key, value in values.items()}
+    if "ExclusiveStartKey" in request:
+        request["ExclusiveStartKey"] = {
+            key: _serializer.serialize(value) for key, value in request["ExclusiveStartKey"].items()
+        }
+
+    return request
+
+
+def copy_request_kwargs(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """copy scan or query parameters for a single request
+
+    Boto3 adds the placeholders generated for condition objects to ExpressionAttributeNames and
+    ExpressionAttributeValues in place, so the dictionaries are copied to keep requests from sharing them.
+
+    Args:
+        kwargs (dict[str, Any]): scan or query parameters
+
+    Returns:
+        dict[str, Any]: parameters safe to pass to a single request
+    """
+    request_kwargs = {**kwargs}
+    for name in ("ExpressionAttributeNames", "ExpressionAttributeValues"):
+        if name in request_kwargs:
+            request_kwargs[name] = {**request_kwargs[name]}
+    return request_kwargs
+
+
+def _run_all(
+    operation: Callable[..., dict[str, Any]],
+    requests: list[dict[str, Any]],
+    executor: ThreadPoolExecutor | None,
+) -> list[dict[str, Any]]:
+    """page through every request, concurrently on the executor, into a single result list
+
+    Args:
+        operation (Callable[..., dict[str, Any]]): plain low-level client scan or query method
+        requests (list[dict[str, Any]]): parameters of each paged read, built by build_request
+        executor (ThreadPoolExecutor | None): pool the reads are run on, None runs them on the calling thread
+
+    Returns:
+        list[dict[str, Any]]: items of every read
+    """
+    items: list[dict[str, Any]] = []
+    lock = Lock()
+
+    if executor is None:
+        for request_kwargs in requests:
+            _collect_pages(operation, request_kwargs, items, lock)
+        return items
+
+    futures = [executor.submit(_collect_pages, operation, request_kwargs, items, lock) for request_kwargs in requests]
+    done, not_done = wait(futures, return_when="FIRST_EXCEPTION")
+    for future in not_done:
+        future.cancel()
+    for future in done:
+        future.result()  # re-raise the first error
+
+    return items
+
+
+def _collect_pages(
+    operation: Callable[..., dict[str, Any]],
+    request_kwargs: dict[str, Any],
+    items: list[dict[str, Any]],
+    lock: Lock,
+) -> None:
+    """page through one scan segment or query appending each deserialised page to the shared result
+
+    Args:
+        operation (Callable[..., dict[str, Any]]): plain low-level client scan or query method
+        request_kwargs (dict[str, Any]): built scan or query parameters including the TableName
+        items (list[dict[str, Any]]): shared result list
+        lock (Lock): guards the shared result list
+    """
+    request_kwargs = {**request_kwargs}
+
+    while True:
+        response = operation(**request_kwargs)
+        page = [
+            {name: _deserializer.deserialize(value) for name, value in item.items()}
+            for item in response.get("Items", [])
+        ]
+        with lock:
+            items.extend(page)
+        if "LastEvaluatedKey" not in response:
+            return
+        request_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]  # already in typed form
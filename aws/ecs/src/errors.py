@@ -79,6 +79,38 @@ class UserNotFoundException(AppException):
     pass
 
 
+class CpuMetricNotFoundException(AppException):
+    """
+    Raised when a cpu metric id is not found in the database
+    """
+
+    pass
+
+
+class InvalidCursorException(AppException):
+    """
+    Raised when a pagination cursor is malformed, tampered with or used with a different query
+    """
+
+    pass
+
+
+class UnsupportedMediaTypeException(AppException):
+    """
+    Raised when a request body is sent with a content type the endpoint does not accept
+    """
+
+    pass
+
+
+class ServiceUnavailableException(AppException):
+    """
+    Raised when a service the request depends on, such as the Cognito JWKS endpoint, cannot be reached
+    """
+
+    pass
+
+
 class NotAuthorisedException(AppException):
     """
     Raised when the user does not have the required permissions or tokens
@@ -140,6 +172,26 @@ def register_all_errors(app: FastAPI) -> None:
         create_exception_hander(status.HTTP_404_NOT_FOUND, "User email or id not found"),
     )
 
+    app.add_exception_handler(
+        CpuMetricNotFoundException,
+        create_exception_hander(status.HTTP_404_NOT_FOUND, "CPU metric id not found"),
+    )
+
+    app.add_exception_handler(
+        InvalidCursorException,
+        create_exception_hander(status.HTTP_400_BAD_REQUEST, "Invalid pagination cursor"),
+    )
+
+    app.add_exception_handler(
+        UnsupportedMediaTypeException,
+        create_exception_hander(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Unsupported request body content type"),
+    )
+
+    app.add_exception_handler(
+        ServiceUnavailableException,
+        create_exception_hander(status.HTTP_503_SERVICE_UNAVAILABLE, "Service temporarily unavailable"),
+    )
+
     app.add_exception_handler(
         NotAuthorisedException, create_exception_hander(status.HTTP_401_UNAUTHORIZED, "Invalid username of password")
     )
@@ -62,6 +62,7 @@ def register_middleware(app: FastAPI) -> None:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],  # page cursor of the cpu metrics list
     )
 
     # Add TrustedHostMiddleware
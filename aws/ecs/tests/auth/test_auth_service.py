@@ -4,11 +4,25 @@ Unit tests for the service module in authentication API
 Author: Tom Aston
 """
 
+import asyncio
+import json
+import statistics
+import time
+from typing import Generator
 from unittest.mock import Mock, patch
 
+import jwt
+import jwt.algorithms
 import pytest
+import requests
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
 from src.auth.model import Token, User
-from src.auth.service import AuthService
+from src.auth.service import AuthService, get_current_claims
+from src.auth.utils import COGNITO_REGION, USER_POOL_ID, decode_jwt, jwks_cache, verified_token_cache
+from src.config import config_manager
+from src.errors import InvalidTokenException, ServerException, ServiceUnavailableException
+from src.main import app
 
 
 class TestUnitAuthService:
@@ -71,3 +85,177 @@ class TestUnitAuthService:
 
         assert isinstance(actual_response, Token)
         assert actual_response.model_dump() == {"access_token": "test_token", "token_type": "bearer"}
+
+    @patch("src.auth.service.verified_token_cache")
+    @patch("src.auth.service.decode_jwt")
+    def test_logout_revokes_cached_tokens(
+        self, mock_decode_jwt: Mock, mock_verified_token_cache: Mock, auth_service: AuthService
+    ) -> None:
+        """test logout signs the user out of Cognito and revokes their tokens in the verified token cache
+
+        Args:
+            mock_decode_jwt (Mock): mock of decode_jwt
+            mock_verified_token_cache (Mock): mock of the verified token cache
+            auth_service (AuthService): auth service object
+        """
+        mock_decode_jwt.return_value = {"sub": "user"}
+        auth_service.cognito_client.global_sign_out = Mock()
+
+        assert auth_service.logout("test_token") == {"message": "Successfully logged out"}
+        auth_service.cognito_client.global_sign_out.assert_called_once_with(AccessToken="test_token")
+        mock_verified_token_cache.revoke.assert_called_once_with({"sub": "user"})
+
+    @patch("src.auth.service.verified_token_cache")
+    @patch("src.auth.service.decode_jwt")
+    def test_logout_failed_sign_out_does_not_revoke(
+        self, mock_decode_jwt: Mock, mock_verified_token_cache: Mock, auth_service: AuthService
+    ) -> None:
+        """test tokens are not revoked when the Cognito sign out fails
+
+        Args:
+            mock_decode_jwt (Mock): mock of decode_jwt
+            mock_verified_token_cache (Mock): mock of the verified token cache
+            auth_service (AuthService): auth service object
+        """
+        auth_service.cognito_client.global_sign_out = Mock(side_effect=Exception("sign out failed"))
+
+        with pytest.raises(ServerException):
+            auth_service.logout("test_token")
+        mock_verified_token_cache.revoke.assert_not_called()
+
+
+class TestUnitGetCurrentClaims:
+    """
+    Unit tests for the get_current_claims auth dependency
+    """
+
+    @pytest.fixture
+    def private_key(self) -> Generator[rsa.RSAPrivateKey, None, None]:
+        """signing key published as the only JWKS key
+
+        Yields:
+            rsa.RSAPrivateKey: private key to sign tokens with
+        """
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = {**json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key())), "kid": "test_kid"}
+
+        jwks_cache.clear()
+        verified_token_cache.clear()
+        with patch("src.auth.utils.get_cognito_public_keys", return_value=[jwk]):
+            yield private_key
+        jwks_cache.clear()
+        verified_token_cache.clear()
+
+    def _sign(self, private_key: rsa.RSAPrivateKey, kid: str = "test_kid") -> str:
+        """sign an access token for the user pool
+
+        Args:
+            private_key (rsa.RSAPrivateKey): signing key
+            kid (str): key id in the token header
+
+        Returns:
+            str: access token
+        """
+        claims = {
+            "sub": "user",
+            "username": "test_user",
+            "token_use": "access",
+            "iss": f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{USER_POOL_ID}",
+            "iat": int(time.time()),
+            "exp": int(time.time()) + 60,
+        }
+        return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+    def test_valid_token_claims_injected(self, private_key: rsa.RSAPrivateKey) -> None:
+        """test a valid token is verified once and its claims are then served from the cache
+
+        Args:
+            private_key (rsa.RSAPrivateKey): signing key
+        """
+        token = self._sign(private_key)
+
+        with patch("src.auth.service.decode_jwt", wraps=decode_jwt) as mock_decode_jwt:
+            assert asyncio.run(get_current_claims(token))["username"] == "test_user"
+            assert asyncio.run(get_current_claims(token))["username"] == "test_user"
+
+        mock_decode_jwt.assert_called_once_with(token)
+
+    @pytest.mark.parametrize("token", ["not-a-jwt", "unknown-kid"])
+    def test_invalid_token_rejected(self, token: str, private_key: rsa.RSAPrivateKey) -> None:
+        """test malformed tokens and tokens signed with an unknown key are rejected as invalid tokens
+
+        Args:
+            token (str): token case
+            private_key (rsa.RSAPrivateKey): signing key
+        """
+        if token == "unknown-kid":
+            token = self._sign(private_key, kid="unknown_kid")
+
+        with pytest.raises(InvalidTokenException):
+            asyncio.run(get_current_claims(token))
+
+    def test_token_without_kid_rejected(self, private_key: rsa.RSAPrivateKey) -> None:
+        """test a signed token without a kid in its header is rejected as an invalid token
+
+        Args:
+            private_key (rsa.RSAPrivateKey): signing key
+        """
+        token = jwt.encode({"sub": "user", "token_use": "access"}, private_key, algorithm="RS256")
+
+        with pytest.raises(InvalidTokenException):
+            asyncio.run(get_current_claims(token))
+
+    @pytest.mark.parametrize("error", [requests.ConnectionError("down"), requests.HTTPError("503")])
+    def test_jwks_fetch_failure_unavailable(self, error: Exception, private_key: rsa.RSAPrivateKey) -> None:
+        """test a token that cannot be verified because the JWKS fetch fails is a 503, also within the cooldown
+
+        Args:
+            error (Exception): error raised by the JWKS fetch
+            private_key (rsa.RSAPrivateKey): signing key
+        """
+        token = self._sign(private_key)
+        client = TestClient(app)
+        url = f"/api/{config_manager.VERSION}/auth/current_user"
+
+        with patch("src.auth.utils.get_cognito_public_keys", side_effect=error):
+            with pytest.raises(ServiceUnavailableException):
+                asyncio.run(get_current_claims(token))
+            # the refresh failed within the cooldown so the cache raises without fetching again
+            response = client.get(url, headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 503
+
+    def test_route_evaluates_dependency_once_per_request(self, private_key: rsa.RSAPrivateKey) -> None:
+        """test a route rejects a missing token and validates a bearer token once
+
+        Args:
+            private_key (rsa.RSAPrivateKey): signing key
+        """
+        client = TestClient(app)
+        url = f"/api/{config_manager.VERSION}/auth/current_user"
+
+        assert client.get(url).status_code == 401
+        with patch("src.auth.service.get_cached_claims", return_value=None) as mock_get_cached_claims:
+            response = client.get(url, headers={"Authorization": f"Bearer {self._sign(private_key)}"})
+
+        assert response.json() == "test_user"
+        mock_get_cached_claims.assert_called_once()
+
+    def test_hot_token_overhead(self, private_key: rsa.RSAPrivateKey) -> None:
+        """test the dependency adds well under a millisecond at p99 for a token it has verified before
+
+        Args:
+            private_key (rsa.RSAPrivateKey): signing key
+        """
+        token = self._sign(private_key)
+
+        async def run() -> list[float]:
+            await get_current_claims(token)
+            samples_ms = []
+            for _ in range(1000):
+                start = time.perf_counter()
+                await get_current_claims(token)
+                samples_ms.append((time.perf_counter() - start) * 1000)
+            return samples_ms
+
+        assert statistics.quantiles(asyncio.run(run()), n=100)[98] < 1
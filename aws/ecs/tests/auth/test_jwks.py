@@ -0,0 +1,262 @@
+"""
+Unit tests for the jwks module against a local JWKS stand-in
+
+Author: Tom Aston
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Generator
+from unittest.mock import patch
+
+import jwt
+import jwt.algorithms
+import pytest
+import requests
+from cryptography.hazmat.primitives.asymmetric import rsa
+from src.auth.jwks import JwksCache
+from src.auth.utils import decode_jwt, get_cognito_public_keys, jwks_cache, verified_token_cache
+
+
+class JwksStandIn:
+    """
+    Local HTTP server serving a JWKS and counting the fetches
+    """
+
+    def __init__(self) -> None:
+        self.keys: list[dict[str, Any]] = []
+        self.fetches = 0
+        self.delay_seconds = 0.0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                stand_in.fetches += 1
+                time.sleep(stand_in.delay_seconds)
+                body = json.dumps({"keys": stand_in.keys}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/.well-known/jwks.json"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add_key(self, kid: str) -> rsa.RSAPrivateKey:
+        """generate a signing key and publish its public JWK
+
+        Args:
+            kid (str): key id
+
+        Returns:
+            rsa.RSAPrivateKey: private key to sign tokens with
+        """
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+        self.keys.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+        return private_key
+
+
+class FakeClock:
+    """
+    Clock advanced by hand
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestUnitJwksCache:
+    """
+    Test suite for the jwks cache using a local JWKS stand-in
+    """
+
+    @pytest.fixture
+    def stand_in(self) -> Generator[JwksStandIn, None, None]:
+        """local JWKS server fixture
+
+        Yields:
+            JwksStandIn: running JWKS stand-in
+        """
+        stand_in = JwksStandIn()
+        yield stand_in
+        stand_in.server.shutdown()
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        """fake clock fixture
+
+        Returns:
+            FakeClock: clock at 0
+        """
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, stand_in: JwksStandIn, clock: FakeClock) -> Generator[JwksCache, None, None]:
+        """jwks cache fetching from the stand-in through get_cognito_public_keys
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+            clock (FakeClock): fake clock
+
+        Yields:
+            JwksCache: cache with a 60 second ttl and 10 second cooldown
+        """
+        with patch("src.auth.utils.COGNITO_KEYS_URL", stand_in.url):
+            yield JwksCache(get_cognito_public_keys, ttl_seconds=60, refresh_cooldown_seconds=10, clock=clock)
+
+    def test_keys_fetched_once_within_ttl(self, stand_in: JwksStandIn, cache: JwksCache, clock: FakeClock) -> None:
+        """test repeat lookups use the parsed key until the ttl expires
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+            cache (JwksCache): jwks cache
+            clock (FakeClock): fake clock
+        """
+        private_key = stand_in.add_key("kid-1")
+
+        key = cache.get_key("kid-1")
+        assert cache.get_key("kid-1") is key
+        assert stand_in.fetches == 1
+        assert key.public_numbers() == private_key.public_key().public_numbers()
+
+        clock.now = 61
+        cache.get_key("kid-1")
+        assert stand_in.fetches == 2
+
+    def test_unknown_kid_refreshes_once_per_cooldown(
+        self, stand_in: JwksStandIn, cache: JwksCache, clock: FakeClock
+    ) -> None:
+        """test an unknown kid refreshes the keys to pick up a rotation but not more than once per cooldown
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+            cache (JwksCache): jwks cache
+            clock (FakeClock): fake clock
+        """
+        stand_in.add_key("kid-1")
+        cache.get_key("kid-1")
+
+        clock.now = 11
+        stand_in.add_key("kid-2")  # rotated in after the first fetch
+        assert cache.get_key("kid-2") is not None
+        assert cache.get_key("unknown") is None
+        assert cache.get_key("unknown") is None
+        assert stand_in.fetches == 2
+
+        clock.now = 22
+        assert cache.get_key("unknown") is None
+        assert stand_in.fetches == 3
+
+    def test_concurrent_misses_fetch_once(self, stand_in: JwksStandIn, cache: JwksCache) -> None:
+        """test concurrent lookups of a missing kid wait on a single fetch
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+            cache (JwksCache): jwks cache
+        """
+        stand_in.add_key("kid-1")
+        stand_in.delay_seconds = 0.2
+        results: list[Any] = []
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get_key("kid-1"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert stand_in.fetches == 1
+        assert len(results) == 8 and all(result is results[0] is not None for result in results)
+
+    def test_failed_refresh_serves_cached_keys(self, stand_in: JwksStandIn, cache: JwksCache, clock: FakeClock) -> None:
+        """test a failed refresh keeps serving the cached keys and fails only unknown kids
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+            cache (JwksCache): jwks cache
+            clock (FakeClock): fake clock
+        """
+        stand_in.add_key("kid-1")
+        key = cache.get_key("kid-1")
+        stand_in.server.shutdown()
+        stand_in.server.server_close()
+
+        clock.now = 61
+        assert cache.get_key("kid-1") is key
+        clock.now = 71
+        with pytest.raises(requests.ConnectionError):
+            cache.get_key("kid-2")
+
+    def test_failed_refresh_backs_off(self, stand_in: JwksStandIn, cache: JwksCache, clock: FakeClock) -> None:
+        """test lookups after a failed refresh serve the stale keys without refetching until the cooldown has passed
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+            cache (JwksCache): jwks cache
+            clock (FakeClock): fake clock
+        """
+        stand_in.add_key("kid-1")
+        key = cache.get_key("kid-1")
+        fetch_keys = cache._fetch_keys
+        attempts = 0
+
+        def failing_fetch() -> list[dict[str, Any]]:
+            nonlocal attempts
+            attempts += 1
+            raise requests.ConnectionError()
+
+        cache._fetch_keys = failing_fetch
+        clock.now = 61
+        for _ in range(5):
+            assert cache.get_key("kid-1") is key
+        with pytest.raises(RuntimeError):
+            cache.get_key("kid-2")
+        assert attempts == 1
+
+        clock.now = 71
+        cache._fetch_keys = fetch_keys
+        assert cache.get_key("kid-1") is not None
+        assert stand_in.fetches == 2
+
+    def test_decode_jwt_with_stand_in(self, stand_in: JwksStandIn) -> None:
+        """test decode_jwt verifies a signed token with keys fetched from the stand-in
+
+        Args:
+            stand_in (JwksStandIn): running JWKS stand-in
+        """
+        private_key = stand_in.add_key("kid-1")
+        token = jwt.encode(
+            {
+                "token_use": "access",
+                "username": "user",
+                "iss": "https://cognito-idp.region.amazonaws.com/pool",
+                "exp": int(time.time()) + 60,
+            },
+            private_key,
+            algorithm="RS256",
+            headers={"kid": "kid-1"},
+        )
+
+        jwks_cache.clear()
+        with (
+            patch("src.auth.utils.COGNITO_KEYS_URL", stand_in.url),
+            patch("src.auth.utils.COGNITO_REGION", "region"),
+            patch("src.auth.utils.USER_POOL_ID", "pool"),
+        ):
+            assert decode_jwt(token)["username"] == "user"
+            jwks_cache.clear()
+            verified_token_cache.clear()
+            assert decode_jwt(token)["username"] == "user"
+        jwks_cache.clear()
+        verified_token_cache.clear()
+
+        assert stand_in.fetches == 2
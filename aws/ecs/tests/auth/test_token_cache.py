@@ -0,0 +1,156 @@
+"""
+Unit tests for the token cache module
+
+Author: Tom Aston
+"""
+
+from typing import Generator
+from unittest.mock import MagicMock, patch
+
+import pytest
+from src.auth.token_cache import MAX_ACCESS_TOKEN_LIFETIME_SECONDS, VerifiedTokenCache
+from src.auth.utils import InvalidTokenException, decode_jwt, jwks_cache, verified_token_cache
+
+
+class FakeClock:
+    """
+    Clock advanced by hand
+    """
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestUnitVerifiedTokenCache:
+    """
+    Test suite for the verified token cache
+    """
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        """fake clock fixture
+
+        Returns:
+            FakeClock: clock at 1000
+        """
+        return FakeClock()
+
+    def test_claims_cached_until_exp(self, clock: FakeClock) -> None:
+        """test cached claims are served until the token expires
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = VerifiedTokenCache(max_entries=10, clock=clock)
+        claims = {"sub": "user", "iat": 900, "exp": 1100}
+        cache.put("token", claims)
+
+        assert cache.get("token") is claims
+        assert cache.get("other") is None
+        clock.now = 1100
+        assert cache.get("token") is None
+
+    def test_tokens_without_exp_not_cached(self, clock: FakeClock) -> None:
+        """test tokens without an exp are not cached
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = VerifiedTokenCache(max_entries=10, clock=clock)
+        cache.put("token", {"sub": "user"})
+
+        assert cache.get("token") is None
+
+    def test_least_recently_used_evicted(self, clock: FakeClock) -> None:
+        """test the least recently used token is evicted over the bound
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = VerifiedTokenCache(max_entries=2, clock=clock)
+        cache.put("a", {"exp": 2000})
+        cache.put("b", {"exp": 2000})
+        cache.get("a")
+        cache.put("c", {"exp": 2000})
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+
+    def test_revoke_drops_user_tokens_issued_before(self, clock: FakeClock) -> None:
+        """test a revocation drops the user's cached tokens and rejects tokens issued before it until they expire
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = VerifiedTokenCache(max_entries=10, clock=clock)
+        cache.put("a", {"sub": "user", "iat": 900, "exp": 2000})
+        cache.put("b", {"sub": "other", "iat": 900, "exp": 2000})
+
+        clock.now = 1000.5
+        cache.revoke({"sub": "user"})
+
+        assert cache.get("a") is None
+        assert cache.get("b") is not None
+        assert cache.is_revoked({"sub": "user", "iat": 999})
+        assert not cache.is_revoked({"sub": "user", "iat": 1000})  # logged in again in the second of the sign out
+        assert not cache.is_revoked({"sub": "other", "iat": 900})
+
+        clock.now += MAX_ACCESS_TOKEN_LIFETIME_SECONDS
+        cache.revoke({"sub": "other"})  # prunes revocations older than the longest token lifetime
+        assert not cache.is_revoked({"sub": "user", "iat": 900})
+
+
+class TestUnitDecodeJwtCache:
+    """
+    Test suite for decode_jwt with the verified token cache
+    """
+
+    @pytest.fixture(autouse=True)
+    def clear_caches(self) -> Generator[None, None, None]:
+        """clear the jwks and verified token caches around each test
+
+        Yields:
+            None: nothing
+        """
+        jwks_cache.clear()
+        verified_token_cache.clear()
+        yield
+        jwks_cache.clear()
+        verified_token_cache.clear()
+
+    @patch("src.auth.utils.get_cognito_public_keys")
+    @patch("jwt.get_unverified_header")
+    @patch("jwt.algorithms.RSAAlgorithm.from_jwk")
+    @patch("jwt.decode")
+    def test_repeat_decode_skips_verification(
+        self,
+        mock_decode: MagicMock,
+        mock_from_jwk: MagicMock,
+        mock_get_unverified_header: MagicMock,
+        mock_get_cognito_public_keys: MagicMock,
+    ) -> None:
+        """test a token is verified once and then served from the cache until it is revoked
+
+        Args:
+            mock_decode (MagicMock): mock object for jwt.decode
+            mock_from_jwk (MagicMock): mock object for jwt.algorithms.RSAAlgorithm.from_jwk
+            mock_get_unverified_header (MagicMock): mock object for jwt.get_unverified_header
+            mock_get_cognito_public_keys (MagicMock): mock object for get_cognito_public_keys
+        """
+        claims = {"token_use": "access", "sub": "user", "iat": 0, "exp": 2**40}
+        mock_get_cognito_public_keys.return_value = [{"kid": "test_kid"}]
+        mock_get_unverified_header.return_value = {"kid": "test_kid"}
+        mock_decode.return_value = claims
+
+        assert decode_jwt("token") == claims
+        assert decode_jwt("token") == claims
+        mock_decode.assert_called_once()
+
+        verified_token_cache.revoke(claims)
+        with pytest.raises(InvalidTokenException):
+            decode_jwt("token")
+        assert mock_decode.call_count == 2  # revoked tokens are verified again and rejected
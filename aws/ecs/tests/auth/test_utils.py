@@ -18,6 +18,7 @@ from src.auth.utils import (
     decode_jwt,
     get_cognito_public_keys,
     get_secret_hash,
+    jwks_cache,
 )
 
 
@@ -26,6 +27,11 @@ class TestUnitAuthUtils:
     Test suite for the auth utils module in the Auth API
     """
 
+    @pytest.fixture(autouse=True)
+    def clear_jwks_cache(self) -> None:
+        """clear the jwks cache so each test fetches its own patched public keys"""
+        jwks_cache.clear()
+
     @pytest.fixture
     def sample_token(self) -> str:
         """return a sample jwt token
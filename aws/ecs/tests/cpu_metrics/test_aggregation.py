@@ -0,0 +1,47 @@
+"""
+Unit tests for the aggregation module.
+Author: Tom Aston
+"""
+
+from decimal import Decimal
+
+from src.cpu_metrics.aggregation import aggregate_cpu_usage
+
+
+class TestUnitAggregation:
+    """
+    Unit tests for time-bucket aggregation of cpu usage
+    """
+
+    def test_aggregate_cpu_usage_buckets(self) -> None:
+        """test samples are grouped into buckets aligned to the bucket size and ordered by bucket start"""
+        items = [
+            {"timestamp": Decimal(3601), "cpu_usage": Decimal(7)},
+            {"timestamp": Decimal(0), "cpu_usage": Decimal(10)},
+            {"timestamp": Decimal(59), "cpu_usage": Decimal(30)},
+            {"timestamp": Decimal(30), "cpu_usage": Decimal(20)},
+            {"timestamp": Decimal(60), "cpu_usage": Decimal(5)},
+        ]
+
+        result = aggregate_cpu_usage(items, 60, ["avg", "min", "max", "p95"])
+
+        assert result == {
+            "bucket_start": [0, 60, 3600],
+            "count": [3, 1, 1],
+            "avg": [20.0, 5.0, 7.0],
+            "min": [10.0, 5.0, 7.0],
+            "max": [30.0, 5.0, 7.0],
+            "p95": [29.0, 5.0, 7.0],
+        }
+
+    def test_aggregate_cpu_usage_only_requested(self) -> None:
+        """test only the requested aggregations are computed"""
+        items = [{"timestamp": 10, "cpu_usage": 1}, {"timestamp": 3599, "cpu_usage": 2}]
+
+        result = aggregate_cpu_usage(items, 3600, ["max"])
+
+        assert result == {"bucket_start": [0], "count": [2], "max": [2.0]}
+
+    def test_aggregate_cpu_usage_no_items(self) -> None:
+        """test no samples gives empty arrays"""
+        assert aggregate_cpu_usage([], 60, ["avg"]) == {"bucket_start": [], "count": [], "avg": []}
@@ -0,0 +1,161 @@
+"""
+Unit tests for the bulk import module.
+Author: Tom Aston
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, List
+
+import pytest
+from src.cpu_metrics.bulk_import import CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE, import_cpu_metrics
+from src.cpu_metrics.schemas import (
+    CpuMetricBatchCreateResultSchema,
+    CpuMetricBatchItemResultSchema,
+    CpuMetricCreateSchema,
+    CpuMetricImportResultSchema,
+)
+from src.errors import InvalidRequestException, UnsupportedMediaTypeException
+
+ROW = {
+    "unit": "percent",
+    "loop_count": 1,
+    "project": "test",
+    "topic": "test",
+    "location": "Home",
+    "cpu_usage": 50,
+    "device": "test",
+    "version": "1.0",
+}
+
+
+async def _body(data: bytes, chunk_size: int) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start : start + chunk_size]
+
+
+class RecordingWriter:
+    """
+    write_chunk stand in that records the chunks and fails cpu metrics with a cpu usage of 99
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[List[CpuMetricCreateSchema]] = []
+
+    async def __call__(self, cpu_metrics: List[CpuMetricCreateSchema]) -> CpuMetricBatchCreateResultSchema:
+        self.chunks.append(cpu_metrics)
+        results = [
+            CpuMetricBatchItemResultSchema(index=index, status="failed", error="ValidationException")
+            if cpu_metric.cpu_usage == 99
+            else CpuMetricBatchItemResultSchema(index=index, status="created")
+            for index, cpu_metric in enumerate(cpu_metrics)
+        ]
+        failed = sum(result.status == "failed" for result in results)
+        return CpuMetricBatchCreateResultSchema(created=len(results) - failed, failed=failed, results=results)
+
+
+def _import(
+    data: bytes, media_type: str, writer: Any, chunk_size: int = 7, **kwargs: Any
+) -> CpuMetricImportResultSchema:
+    return asyncio.run(import_cpu_metrics(_body(data, chunk_size), media_type, writer, **kwargs))
+
+
+class TestUnitBulkImport:
+    """
+    Unit tests for the bulk import module in CPU Metrics API
+    """
+
+    def test_ndjson_rows_validated_and_written_in_chunks(self) -> None:
+        """test NDJSON lines split across body chunks are written in chunks and bad rows are reported by line"""
+        lines = [
+            json.dumps(ROW),
+            "",
+            json.dumps({**ROW, "timestamp": 1633529469}),
+            "{not json",
+            json.dumps({**ROW, "cpu_usage": "high"}),
+            json.dumps({**ROW, "cpu_usage": 99}),
+            json.dumps(ROW),
+        ]
+        writer = RecordingWriter()
+
+        result = _import("\n".join(lines).encode(), NDJSON_MEDIA_TYPE, writer, chunk_size=1024, chunk_rows=2)
+
+        assert (result.rows, result.created, result.failed) == (6, 3, 3)
+        assert [(error.line, error.error.split(":")[0]) for error in result.errors] == [
+            (4, "Invalid JSON"),
+            (5, "cpu_usage"),
+            (6, "ValidationException"),
+        ]
+        assert [len(chunk) for chunk in writer.chunks] == [2, 2]  # lines 4 and 5 leave nothing to write
+        assert writer.chunks[0][1].timestamp == 1633529469
+
+    def test_unknown_location_rejected(self) -> None:
+        """test a row for a location the location reads do not fan out over is not written"""
+        lines = [json.dumps(ROW), json.dumps({**ROW, "location": "Garage"})]
+        writer = RecordingWriter()
+
+        result = _import("\n".join(lines).encode(), NDJSON_MEDIA_TYPE, writer)
+
+        assert (result.rows, result.created, result.failed) == (2, 1, 1)
+        assert result.errors[0].line == 2
+        assert result.errors[0].error.startswith("location:")
+
+    def test_csv_rows_mapped_to_header(self) -> None:
+        """test CSV rows are read against the header, empty values are missing and extra values fail the row"""
+        header = ",".join(ROW)
+        values = ",".join(str(value) for value in ROW.values())
+        data = f"﻿{header},timestamp\r\n{values},\r\n{values},1633529469\r\n{values},1,2\r\n".encode()
+        writer = RecordingWriter()
+
+        result = _import(data, CSV_MEDIA_TYPE, writer)
+
+        assert (result.rows, result.created, result.failed) == (3, 2, 1)
+        assert result.errors[0].line == 4
+        assert [cpu_metric.timestamp for cpu_metric in writer.chunks[0]] == [None, 1633529469]
+
+    def test_pending_writes_bounded(self) -> None:
+        """test reading the upload waits once max_pending_chunks writes are in flight"""
+        data = "\n".join(json.dumps(ROW) for _ in range(10)).encode()
+        in_flight = 0
+        most_in_flight = 0
+
+        async def slow_writer(cpu_metrics: List[CpuMetricCreateSchema]) -> CpuMetricBatchCreateResultSchema:
+            nonlocal in_flight, most_in_flight
+            in_flight += 1
+            most_in_flight = max(most_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return await RecordingWriter()(cpu_metrics)
+
+        result = _import(data, NDJSON_MEDIA_TYPE, slow_writer, chunk_rows=1, max_pending_chunks=2)
+
+        assert result.created == 10
+        assert most_in_flight == 2
+
+    def test_reported_errors_capped(self) -> None:
+        """test only the first max_reported_errors row errors are listed while all are counted"""
+        data = b"\n".join(b"{}" for _ in range(5))
+
+        result = _import(data, NDJSON_MEDIA_TYPE, RecordingWriter(), max_reported_errors=2)
+
+        assert result.failed == 5
+        assert [error.line for error in result.errors] == [1, 2]
+
+    @pytest.mark.parametrize(
+        "data, media_type, exception",
+        [
+            (b"{}", "application/json", UnsupportedMediaTypeException),
+            (b"x" * 100, NDJSON_MEDIA_TYPE, InvalidRequestException),
+            (b"a,b\n1,2", CSV_MEDIA_TYPE, InvalidRequestException),
+        ],
+    )
+    def test_rejected_uploads(self, data: bytes, media_type: str, exception: type[Exception]) -> None:
+        """test unsupported media types, overlong lines and CSV headers without cpu metric fields are rejected
+
+        Args:
+            data (bytes): upload body
+            media_type (str): upload content type
+            exception (type[Exception]): expected exception
+        """
+        with pytest.raises(exception):
+            _import(data, media_type, RecordingWriter(), max_line_bytes=50)
@@ -0,0 +1,194 @@
+"""
+Unit tests for the cache module.
+Author: Tom Aston
+"""
+
+from unittest.mock import Mock
+
+import pytest
+from src.cpu_metrics.cache import QueryResultCache, item_cache_tags, query_cache_key, query_cache_tags
+from src.cpu_metrics.schemas import CpuMetricQueryParams
+
+
+class FakeClock:
+    """
+    Clock advanced by hand
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestUnitQueryResultCache:
+    """
+    Unit tests for the query result cache
+    """
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        """fake clock fixture
+
+        Returns:
+            FakeClock: clock at 0
+        """
+        return FakeClock()
+
+    def test_get_or_load_serves_hits_until_expiry(self, clock: FakeClock) -> None:
+        """test a repeat read is served from memory until the ttl expires
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = QueryResultCache(ttl_seconds=30, max_items=10, clock=clock)
+        load = Mock(return_value=[{"id": "a"}])
+
+        assert cache.get_or_load("key", ["*"], load) == [{"id": "a"}]
+        assert cache.get_or_load("key", ["*"], load) == [{"id": "a"}]
+        clock.now = 31
+        cache.get_or_load("key", ["*"], load)
+
+        assert load.call_count == 2
+        assert cache.stats() == {
+            "hits": 1,
+            "misses": 2,
+            "evictions": 0,
+            "invalidations": 0,
+            "entries": 1,
+            "items": 1,
+        }
+
+    def test_least_recently_used_evicted_over_size_cap(self, clock: FakeClock) -> None:
+        """test the least recently used entries are evicted once the cached items exceed the cap
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = QueryResultCache(ttl_seconds=30, max_items=4, clock=clock)
+        cache.get_or_load("a", ["*"], lambda: [1, 2])
+        cache.get_or_load("b", ["*"], lambda: [3])
+        cache.get_or_load("a", ["*"], Mock())  # a is now the most recently used
+        cache.get_or_load("c", ["*"], lambda: [4, 5])
+
+        stats = cache.stats()
+        assert (stats["evictions"], stats["entries"], stats["items"]) == (1, 2, 4)
+        load = Mock(return_value=[6])
+        cache.get_or_load("a", ["*"], load)
+        cache.get_or_load("c", ["*"], load)
+        load.assert_not_called()  # only b was evicted
+        assert cache.get_or_load("big", ["*"], lambda: [0] * 5) == [0] * 5
+        assert cache.stats()["entries"] == 2  # results larger than the cap are not cached
+
+    def test_invalidate_only_matching_tags(self, clock: FakeClock) -> None:
+        """test invalidation drops only the entries tagged with the written items
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = QueryResultCache(ttl_seconds=30, max_items=10, clock=clock)
+        cache.get_or_load("home", ["location:Home"], lambda: [1])
+        cache.get_or_load("office", ["location:Office"], lambda: [2])
+        cache.get_or_load("all", ["*"], lambda: [3])
+
+        assert cache.invalidate({"*", "location:Home", "device:pi"}) == 2
+        assert cache.stats()["entries"] == 1
+        load = Mock(return_value=[2])
+        cache.get_or_load("office", ["location:Office"], load)
+        load.assert_not_called()
+
+    def test_invalidate_all(self, clock: FakeClock) -> None:
+        """test invalidate_all drops every entry and counts them as invalidations
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = QueryResultCache(ttl_seconds=30, max_items=10, clock=clock)
+        cache.get_or_load("home", ["location:Home"], lambda: [1])
+        cache.get_or_load("pi", ["device:pi"], lambda: [2])
+
+        assert cache.invalidate_all() == 2
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["items"] == 0
+        assert cache.stats()["invalidations"] == 2
+
+    def test_result_loaded_across_an_invalidation_is_not_cached(self, clock: FakeClock) -> None:
+        """test a result read while a write invalidated the cache is returned but not stored
+
+        Args:
+            clock (FakeClock): fake clock
+        """
+        cache = QueryResultCache(ttl_seconds=30, max_items=10, clock=clock)
+
+        def load() -> list[int]:
+            cache.invalidate({"*"})
+            return [1]
+
+        assert cache.get_or_load("key", ["*"], load) == [1]
+        assert cache.stats()["entries"] == 0
+
+    def test_disabled_cache_always_loads(self) -> None:
+        """test a zero ttl disables the cache"""
+        cache = QueryResultCache(ttl_seconds=0, max_items=10)
+        load = Mock(return_value=[1])
+
+        cache.get_or_load("key", ["*"], load)
+        cache.get_or_load("key", ["*"], load)
+
+        assert load.call_count == 2
+
+
+class TestUnitQueryCacheKeys:
+    """
+    Unit tests for query normalisation and invalidation tags
+    """
+
+    def test_equivalent_reads_share_a_key(self) -> None:
+        """test queries the service answers with the same read share a key and ignore pagination"""
+        keys = {
+            query_cache_key(CpuMetricQueryParams()),
+            query_cache_key(CpuMetricQueryParams(location_value="*")),
+            query_cache_key(CpuMetricQueryParams(location_value="Home", operator="gt")),
+            query_cache_key(CpuMetricQueryParams(limit=10)),
+            query_cache_key(CpuMetricQueryParams(location_value="*", operator="*", cpu_usage_value=0)),
+            query_cache_key(CpuMetricQueryParams(location_value="*", operator="*", cpu_usage_value=50)),
+        }
+
+        assert len(keys) == 1
+        assert query_cache_key(CpuMetricQueryParams(location_value="Home", operator="gt", cpu_usage_value=5)) != (
+            query_cache_key(CpuMetricQueryParams(location_value="Home", operator="gt", cpu_usage_value=6))
+        )
+
+    @pytest.mark.parametrize(
+        "params, tags",
+        [
+            (CpuMetricQueryParams(), {"*"}),
+            (CpuMetricQueryParams(location_value="Home", operator="gt"), {"*"}),
+            (CpuMetricQueryParams(location_value="*", operator="*", cpu_usage_value=0), {"*"}),
+            (CpuMetricQueryParams(location_value="*", operator="gt", cpu_usage_value=5), {"*"}),
+            (CpuMetricQueryParams(location_value="Home", operator="gt", cpu_usage_value=5), {"location:Home"}),
+            (CpuMetricQueryParams(location_value="Home", start=0, end=10), {"location:Home"}),
+            (CpuMetricQueryParams(location_value="Home", device="pi"), {"device:pi"}),
+        ],
+    )
+    def test_query_cache_tags(self, params: CpuMetricQueryParams, tags: set[str]) -> None:
+        """test queries are tagged with the location or device they read, or * for every item
+
+        Args:
+            params (CpuMetricQueryParams): query parameters
+            tags (set[str]): expected tags
+        """
+        assert query_cache_tags(params) == tags
+
+    def test_item_cache_tags(self) -> None:
+        """test written items invalidate their location, device and reads of every item"""
+        items = [{"location": "Home", "device": "pi"}, Mock(model_dump=Mock(return_value={"location": "Office"}))]
+
+        assert item_cache_tags(items, ["Factory"]) == {
+            "*",
+            "location:Home",
+            "location:Office",
+            "location:Factory",
+            "device:pi",
+        }
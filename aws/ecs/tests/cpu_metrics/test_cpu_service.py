@@ -3,11 +3,34 @@ Unit tests for the service module.
 Author: Tom Aston
 """
 
-from unittest.mock import MagicMock, Mock
+import io
+from decimal import Decimal
+from typing import Any, Generator
+from unittest.mock import MagicMock, Mock, patch
 
+import pyarrow.parquet as pq
 import pytest
-from src.cpu_metrics.schemas import CpuMetricCreateSchema, CpuMetricQueryParams
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from src.config import config_manager
+from src.cpu_metrics.export import iter_export_chunks
+from src.cpu_metrics.schemas import (
+    LOCATIONS,
+    CpuMetricAggregateParams,
+    CpuMetricCreateSchema,
+    CpuMetricExportParams,
+    CpuMetricQueryParams,
+    CpuMetricUpdateSchema,
+)
 from src.cpu_metrics.service import CpuMetricsService
+from src.errors import CpuMetricNotFoundException, InvalidRequestException
+
+_serializer = TypeSerializer()
+
+
+def _typed(item: dict[str, Any]) -> dict[str, Any]:
+    """serialise an item to the typed form returned by the low-level client"""
+    return {name: _serializer.serialize(value) for name, value in item.items()}
 
 
 class TestUnitCpuMetricsService:
@@ -24,6 +47,16 @@ class TestUnitCpuMetricsService:
         """
         return Mock()
 
+    @pytest.fixture
+    def scan_client(self) -> Generator[Mock, None, None]:
+        """plain low-level client the parallel scans and queries are sent with
+
+        Yields:
+            Mock: mock of client
+        """
+        with patch("src.databases.parallel_scan.dynamodb_client") as client:
+            yield client
+
     @pytest.mark.parametrize(
         "query_params",
         [
@@ -103,13 +136,628 @@ class TestUnitCpuMetricsService:
             test_create_payload (list[CpuMetricCreateSchema]): payload to create cpu metric from conftest.py
         """
         mock_db_table = MagicMock()
+        mock_db_table.name = "TestTable"
+        mock_db_table.meta.client.batch_write_item.return_value = {"UnprocessedItems": {}}
         cpu_metrics_service = CpuMetricsService()
+        test_create_payload[0].timestamp = 1633529469  # backfilled metrics keep their sample time
 
         response = cpu_metrics_service.batch_create_cpu_metrics(
             cpu_metric_table=mock_db_table, cpu_metrics=test_create_payload
         )
 
-        assert len(response) == len(test_create_payload)
-        for item in response:
-            assert item["timestamp"] is not None
-            assert item["id"] is not None
+        assert (response.created, response.failed) == (len(test_create_payload), 0)
+        assert [result.index for result in response.results] == list(range(len(test_create_payload)))
+        for result in response.results:
+            assert result.status == "created"
+            assert result.item.timestamp is not None
+            assert result.item.id is not None
+        assert response.results[0].item.timestamp == 1633529469
+        mock_db_table.meta.client.batch_write_item.assert_called_once()
+
+    def test_created_cpu_metrics_expire(
+        self, mock_db_table: Mock, test_create_payload: list[CpuMetricCreateSchema]
+    ) -> None:
+        """test created cpu metrics carry the TTL attribute when a retention is configured
+
+        Args:
+            mock_db_table (Mock): mock of db table
+            test_create_payload (list[CpuMetricCreateSchema]): payload to create cpu metric from conftest.py
+        """
+        test_create_payload[0].timestamp = 1633529469
+
+        with patch.object(config_manager, "RETENTION_DAYS", 30):
+            CpuMetricsService().create_cpu_metric(cpu_metric_table=mock_db_table, cpu_metric=test_create_payload[0])
+
+        assert mock_db_table.put_item.call_args.kwargs["Item"]["expires_at"] == 1633529469 + 30 * 86400
+
+    def test_update_cpu_metric_resolves_key_by_id(self, mock_db_table: Mock) -> None:
+        """test update looks the item key up through the id index before updating
+
+        Args:
+            mock_db_table (Mock): mock of db table
+        """
+        item_key = {"device_day": "test#2021-10-06", "timestamp_id": "1633529469#abc"}
+        mock_db_table.query.return_value = {"Items": [{"id": "abc", **item_key}]}
+        mock_db_table.update_item.return_value = {
+            "Attributes": {
+                "id": "abc",
+                "unit": "percent",
+                "loop_count": 1,
+                "project": "test",
+                "topic": "test",
+                "location": "Home",
+                "cpu_usage": 55,
+                "device": "test",
+                "version": "1.0",
+                "timestamp": 1633529469,
+                **item_key,
+            }
+        }
+
+        cpu_metrics_service = CpuMetricsService()
+        response = cpu_metrics_service.update_cpu_metric(
+            cpu_metric_table=mock_db_table, cpu_metric=CpuMetricUpdateSchema(id="abc", cpu_usage=55)
+        )
+
+        assert mock_db_table.query.call_args.kwargs["IndexName"] == "IdIndex"
+        assert mock_db_table.update_item.call_args.kwargs["Key"] == item_key
+        assert response.cpu_usage == 55
+
+    def _batch_table(self, ids: list[str], scan_client: Mock) -> MagicMock:
+        """mock table whose id index resolves only the given ids
+
+        Args:
+            ids (list[str]): ids that exist
+            scan_client (Mock): plain client the id index queries are sent with
+
+        Returns:
+            MagicMock: mock of db table
+        """
+        table = MagicMock()
+        table.name = "TestTable"
+
+        def query(**kwargs: Any) -> dict[str, Any]:
+            cpu_metric_id = kwargs["ExpressionAttributeValues"][":v0"]["S"]
+            if cpu_metric_id not in ids:
+                return {"Items": []}
+            return {
+                "Items": [_typed({"id": cpu_metric_id, "device_day": "test#2021-10-06", "timestamp_id": cpu_metric_id})]
+            }
+
+        scan_client.query.side_effect = query
+        return table
+
+    def test_batch_get_cpu_metrics(self, scan_client: Mock) -> None:
+        """test batch get resolves the ids, reads the items once each and reports missing ids
+
+        Args:
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table = self._batch_table(["a", "b"], scan_client)
+        item = {
+            "unit": "percent",
+            "loop_count": 1,
+            "project": "test",
+            "topic": "test",
+            "location": "Home",
+            "cpu_usage": 55,
+            "device": "test",
+            "version": "1.0",
+            "timestamp": 1633529469,
+            "device_day": "test#2021-10-06",
+        }
+        mock_db_table.meta.client.batch_get_item.return_value = {
+            "Responses": {"TestTable": [{**item, "id": "b", "timestamp_id": "b"}]}
+        }
+
+        response = CpuMetricsService().batch_get_cpu_metrics(
+            cpu_metric_table=mock_db_table, cpu_metric_ids=["a", "b", "missing", "b"]
+        )
+
+        assert (response.found, response.not_found, response.failed) == (1, 2, 0)
+        assert [(result.id, result.status) for result in response.results] == [
+            ("a", "not_found"),  # resolved but deleted before it was read
+            ("b", "found"),
+            ("missing", "not_found"),
+        ]
+        assert response.results[1].item.cpu_usage == 55
+        keys = mock_db_table.meta.client.batch_get_item.call_args.kwargs["RequestItems"]["TestTable"]["Keys"]
+        assert [key["timestamp_id"] for key in keys] == ["a", "b"]
+
+    def test_batch_delete_cpu_metrics(self, scan_client: Mock) -> None:
+        """test batch delete deletes the resolved ids and reports failed and missing ids
+
+        Args:
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table = self._batch_table(["a", "b"], scan_client)
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            requests = RequestItems["TestTable"]
+            return {
+                "UnprocessedItems": {
+                    "TestTable": [r for r in requests if r["DeleteRequest"]["Key"]["timestamp_id"] == "b"]
+                }
+            }
+
+        mock_db_table.meta.client.batch_write_item.side_effect = batch_write_item
+
+        response = CpuMetricsService().batch_delete_cpu_metrics(
+            cpu_metric_table=mock_db_table, cpu_metric_ids=["a", "b", "missing"]
+        )
+
+        assert (response.deleted, response.not_found, response.failed) == (1, 1, 1)
+        assert [(result.id, result.status) for result in response.results] == [
+            ("a", "deleted"),
+            ("b", "failed"),
+            ("missing", "not_found"),
+        ]
+        assert response.results[1].error.startswith("Unprocessed after")
+
+    def test_update_cpu_metric_rejects_device_change(self, mock_db_table: Mock) -> None:
+        """test the device (part of the partition key) cannot be updated in place
+
+        Args:
+            mock_db_table (Mock): mock of db table
+        """
+        cpu_metrics_service = CpuMetricsService()
+
+        with pytest.raises(InvalidRequestException):
+            cpu_metrics_service.update_cpu_metric(
+                cpu_metric_table=mock_db_table, cpu_metric=CpuMetricUpdateSchema(id="abc", device="other")
+            )
+
+        mock_db_table.update_item.assert_not_called()
+
+    def test_delete_cpu_metric_not_found(self, mock_db_table: Mock) -> None:
+        """test deleting an unknown id raises not found without issuing a delete
+
+        Args:
+            mock_db_table (Mock): mock of db table
+        """
+        mock_db_table.query.return_value = {"Items": []}
+        cpu_metrics_service = CpuMetricsService()
+
+        with pytest.raises(CpuMetricNotFoundException):
+            cpu_metrics_service.delete_cpu_metric(cpu_metric_table=mock_db_table, cpu_metric_id="missing")
+
+        mock_db_table.delete_item.assert_not_called()
+
+    def test_get_cpu_metrics_page_queries_location_index(self, mock_db_table: Mock) -> None:
+        """test a page for a location is read from the location index with the page limit
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.return_value = {"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}}
+        query_params = CpuMetricQueryParams(location_value="Home", operator="gt", cpu_usage_value=10, limit=1)
+
+        page = CpuMetricsService().get_cpu_metrics_page(cpu_metric_table=mock_db_table, params=query_params)
+
+        assert page.items == [{"id": "a"}]
+        assert page.next_cursor is not None
+        assert mock_db_table.query.call_args.kwargs["IndexName"] == "LocationIndex"
+        assert mock_db_table.query.call_args.kwargs["Limit"] == 1
+        mock_db_table.scan.assert_not_called()
+
+    def test_stream_cpu_metrics_yields_pages_up_to_limit(self, mock_db_table: Mock) -> None:
+        """test pages are yielded as they are scanned and each scan only asks for the items still needed
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.scan.side_effect = [
+            {"Items": [{"id": "a"}, {"id": "b"}], "LastEvaluatedKey": {"id": "b"}},
+            {"Items": [{"id": "c"}], "LastEvaluatedKey": {"id": "c"}},
+        ]
+
+        pages = CpuMetricsService().stream_cpu_metrics(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(limit=3)
+        )
+
+        assert list(pages) == [[{"id": "a"}, {"id": "b"}], [{"id": "c"}]]
+        assert [call.kwargs["Limit"] for call in mock_db_table.scan.call_args_list] == [3, 1]
+
+    def test_get_filtered_cpu_metrics_follows_pages(self, mock_db_table: Mock) -> None:
+        """test every page of the location index query is returned
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.side_effect = [
+            {"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}},
+            {"Items": [{"id": "b"}]},
+        ]
+        query_params = CpuMetricQueryParams(location_value="Home", operator="gt", cpu_usage_value=10)
+
+        items = CpuMetricsService().get_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+        assert items == [{"id": "a"}, {"id": "b"}]
+        assert mock_db_table.query.call_args_list[1].kwargs["ExclusiveStartKey"] == {"id": "a"}
+
+    def test_get_cpu_metrics_page_top_n(self, mock_db_table: Mock) -> None:
+        """test the top N by cpu usage at a location is a single descending query limited to N items
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.return_value = {"Items": [{"id": "a"}, {"id": "b"}], "LastEvaluatedKey": {"id": "b"}}
+        query_params = CpuMetricQueryParams(
+            location_value="Office", operator="*", cpu_usage_value=0, order="desc", limit=2
+        )
+
+        page = CpuMetricsService().get_cpu_metrics_page(cpu_metric_table=mock_db_table, params=query_params)
+
+        assert len(page.items) == 2
+        mock_db_table.query.assert_called_once()
+        assert mock_db_table.query.call_args.kwargs["ScanIndexForward"] is False
+        assert mock_db_table.query.call_args.kwargs["Limit"] == 2
+
+    @pytest.mark.parametrize(
+        "query_params",
+        [
+            CpuMetricQueryParams(order="asc"),
+            CpuMetricQueryParams(location_value="*", operator="gt", cpu_usage_value=0, order="desc"),
+        ],
+    )
+    def test_order_requires_location(self, query_params: CpuMetricQueryParams, mock_db_table: Mock) -> None:
+        """test ordering is rejected for scans, only the location index is sorted by cpu usage
+
+        Args:
+            query_params (CpuMetricQueryParams): query parameters with an order and no single location
+            mock_db_table (Mock): db table mock
+        """
+        with pytest.raises(InvalidRequestException):
+            CpuMetricsService().get_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+    def test_get_all_devices_filtered_by_cpu_usage_queries_each_location(
+        self, mock_db_table: Mock, scan_client: Mock
+    ) -> None:
+        """test a location wildcard fans out one location index query per location instead of scanning the table
+
+        Args:
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table.name = "TestTable"
+        scan_client.query.side_effect = lambda **kwargs: {"Items": [{"id": {"S": str(len(kwargs))}}]}
+
+        items = CpuMetricsService()._get_all_devices_filtered_by_cpu_usage(mock_db_table, 50, "gt")
+
+        assert len(items) == 3
+        assert scan_client.query.call_count == 3
+        for call in scan_client.query.call_args_list:
+            assert call.kwargs["IndexName"] == "LocationIndex"
+            assert call.kwargs["TableName"] == "TestTable"
+            assert call.kwargs["ExpressionAttributeValues"][":v1"] == {"N": "50"}
+        scan_client.scan.assert_not_called()
+        mock_db_table.scan.assert_not_called()
+
+    def test_paged_location_wildcard_reads_each_location(self, mock_db_table: Mock) -> None:
+        """test pages for a location wildcard query one location after another instead of scanning the table
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.side_effect = [{"Items": [{"id": "a"}]}, {"Items": [{"id": "b"}]}, {"Items": []}]
+        service = CpuMetricsService()
+        query_params = {"location_value": "*", "operator": "gt", "cpu_usage_value": 50}
+
+        first = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(**query_params, limit=1)
+        )
+        second = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table,
+            params=CpuMetricQueryParams(**query_params, limit=5, cursor=first.next_cursor),
+        )
+
+        assert [first.items, second.items] == [[{"id": "a"}], [{"id": "b"}]]
+        assert second.next_cursor is None
+        key_conditions = [call.kwargs["KeyConditionExpression"] for call in mock_db_table.query.call_args_list]
+        assert key_conditions == [Key("location").eq(location) & Key("cpu_usage").gt(50) for location in LOCATIONS]
+        mock_db_table.scan.assert_not_called()
+
+    def test_get_cpu_metrics_device_time_range(self, mock_db_table: Mock, scan_client: Mock) -> None:
+        """test a device time range queries each device#day partition and returns items in time order
+
+        Args:
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table.name = "TestTable"
+        scan_client.query.side_effect = [
+            {"Items": [_typed({"id": "b", "timestamp": 1633564800})]},
+            {"Items": [_typed({"id": "a", "timestamp": 1633564799})]},
+        ]
+        query_params = CpuMetricQueryParams(device="pi", start=1633564799, end=1633564800)
+
+        items = CpuMetricsService().get_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+        assert [item["id"] for item in items] == ["a", "b"]
+        assert scan_client.query.call_count == 2
+        for call in scan_client.query.call_args_list:
+            assert "IndexName" not in call.kwargs
+        scan_client.scan.assert_not_called()
+
+    def test_get_cpu_metrics_location_time_range(self, mock_db_table: Mock, scan_client: Mock) -> None:
+        """test a location time range is a single query on the location timestamp index
+
+        Args:
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table.name = "TestTable"
+        scan_client.query.return_value = {"Items": []}
+        query_params = CpuMetricQueryParams(location_value="Home", start=0, end=3600)
+
+        CpuMetricsService().get_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+        scan_client.query.assert_called_once()
+        assert scan_client.query.call_args.kwargs["IndexName"] == "LocationTimestampIndex"
+
+    def test_get_cpu_metrics_every_location_time_range(self, mock_db_table: Mock, scan_client: Mock) -> None:
+        """test a time range without a location queries the location timestamp index for each location and never
+        scans the table
+
+        Args:
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table.name = "TestTable"
+        scan_client.query.side_effect = lambda **kwargs: {
+            "Items": [_typed({"id": kwargs["ExpressionAttributeValues"][":v0"]["S"], "timestamp": len(kwargs)})]
+        }
+        query_params = CpuMetricQueryParams(start=0, end=3600)
+
+        items = CpuMetricsService().get_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+        assert sorted(item["id"] for item in items) == sorted(LOCATIONS)
+        assert scan_client.query.call_count == 3
+        for call in scan_client.query.call_args_list:
+            assert call.kwargs["IndexName"] == "LocationTimestampIndex"
+            assert call.kwargs["ExpressionAttributeValues"][":v2"] == {"N": "3600"}
+        scan_client.scan.assert_not_called()
+        mock_db_table.scan.assert_not_called()
+
+    def test_paged_time_range_keeps_default_end(self, mock_db_table: Mock) -> None:
+        """test a paged time range ending now by default reads the bounds of the first page on every later page
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.return_value = {"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}}
+        service = CpuMetricsService()
+
+        with patch("src.cpu_metrics.service.time.time", return_value=90000):
+            first = service.get_cpu_metrics_page(
+                cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(location_value="Home", start=0, limit=1)
+            )
+        first_key_condition = mock_db_table.query.call_args.kwargs["KeyConditionExpression"]
+
+        with patch("src.cpu_metrics.service.time.time", return_value=95000):
+            service.get_cpu_metrics_page(
+                cpu_metric_table=mock_db_table,
+                params=CpuMetricQueryParams(location_value="Home", start=0, limit=1, cursor=first.next_cursor),
+            )
+
+        assert first_key_condition == Key("location").eq("Home") & Key("timestamp").between(0, 90000)
+        assert mock_db_table.query.call_args.kwargs["KeyConditionExpression"] == first_key_condition
+
+    def test_paged_device_time_range_reads_each_day(self, mock_db_table: Mock) -> None:
+        """test pages of a device time range continue from one device#day partition into the next
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.side_effect = [
+            {"Items": [{"id": "a"}], "LastEvaluatedKey": {"device_day": "pi#2021-10-06", "timestamp_id": "a"}},
+            {"Items": [{"id": "b"}]},
+            {"Items": [{"id": "c"}]},
+        ]
+        service = CpuMetricsService()
+        query_params = {"device": "pi", "start": 1633564799, "end": 1633564800, "limit": 2}
+
+        first = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(**query_params)
+        )
+        second = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(**query_params, cursor=first.next_cursor)
+        )
+
+        assert first.items == [{"id": "a"}, {"id": "b"}]
+        assert first.next_cursor is not None
+        assert second.items == [{"id": "c"}]
+        assert second.next_cursor is None
+        calls = mock_db_table.query.call_args_list
+        assert [call.kwargs["Limit"] for call in calls] == [2, 1, 2]
+        assert calls[1].kwargs["ExclusiveStartKey"] == {"device_day": "pi#2021-10-06", "timestamp_id": "a"}
+        assert "ExclusiveStartKey" not in calls[2].kwargs
+        assert calls[2].kwargs["KeyConditionExpression"] == Key("device_day").eq("pi#2021-10-07") & Key(
+            "timestamp_id"
+        ).between("1633564799#", "1633564800#~")
+
+    def test_stream_device_time_range_in_descending_order(self, mock_db_table: Mock) -> None:
+        """test a streamed device time range reads the latest day first and stops at the limit
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.side_effect = [{"Items": [{"id": "b"}]}, {"Items": [{"id": "a"}, {"id": "z"}]}]
+        query_params = CpuMetricQueryParams(device="pi", start=1633564799, end=1633564800, order="desc", limit=2)
+
+        pages = CpuMetricsService().stream_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+        assert list(pages) == [[{"id": "b"}], [{"id": "a"}, {"id": "z"}]]
+        calls = mock_db_table.query.call_args_list
+        assert [call.kwargs["Limit"] for call in calls] == [2, 1]
+        assert all(call.kwargs["ScanIndexForward"] is False for call in calls)
+        assert calls[0].kwargs["KeyConditionExpression"] == Key("device_day").eq("pi#2021-10-07") & Key(
+            "timestamp_id"
+        ).between("1633564799#", "1633564800#~")
+
+    def test_export_device_time_range(self, mock_db_table: Mock) -> None:
+        """test a device time range is exported from every device#day partition, continuing from a cursor
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        item = {
+            "device": "pi",
+            "location": "Home",
+            "cpu_usage": Decimal("12.5"),
+            "unit": "%",
+            "topic": "device/cpu",
+            "loop_count": Decimal(1),
+            "project": "test",
+            "version": "1.0",
+        }
+        mock_db_table.query.side_effect = [
+            {"Items": [{**item, "id": "a", "timestamp": Decimal(1633564799)}], "LastEvaluatedKey": {"id": "a"}},
+            {"Items": [{**item, "id": "b", "timestamp": Decimal(1633564800)}]},
+            {"Items": [{**item, "id": "c", "timestamp": Decimal(1633564800)}]},
+        ]
+        service = CpuMetricsService()
+        query_params = {"device": "pi", "start": 1633564799, "end": 1633564800}
+        first = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(**query_params, limit=1)
+        )
+
+        pages = service.stream_cpu_metrics(
+            cpu_metric_table=mock_db_table,
+            params=CpuMetricExportParams(**query_params, cursor=first.next_cursor, format="parquet"),
+        )
+        table = pq.read_table(io.BytesIO(b"".join(iter_export_chunks(pages, "parquet"))))
+
+        assert table.column("id").to_pylist() == ["b", "c"]
+        assert mock_db_table.query.call_args_list[1].kwargs["ExclusiveStartKey"] == {"id": "a"}
+        assert "ExclusiveStartKey" not in mock_db_table.query.call_args_list[2].kwargs
+
+    def test_stream_every_location_time_range(self, mock_db_table: Mock) -> None:
+        """test a time range over every location is streamed from one location timestamp index query per location
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.side_effect = [
+            {"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}},
+            {"Items": [{"id": "b"}]},
+            {"Items": []},
+            {"Items": [{"id": "c"}]},
+        ]
+
+        pages = CpuMetricsService().stream_cpu_metrics(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(start=0, end=3600)
+        )
+
+        assert list(pages) == [[{"id": "a"}], [{"id": "b"}], [{"id": "c"}]]
+        calls = mock_db_table.query.call_args_list
+        assert [call.kwargs["KeyConditionExpression"] for call in calls] == [
+            Key("location").eq(location) & Key("timestamp").between(0, 3600) for location in (LOCATIONS[0], *LOCATIONS)
+        ]
+        assert calls[1].kwargs["ExclusiveStartKey"] == {"id": "a"}
+        assert all(call.kwargs["IndexName"] == "LocationTimestampIndex" for call in calls)
+        mock_db_table.scan.assert_not_called()
+
+    def test_paged_every_location_time_range(self, mock_db_table: Mock) -> None:
+        """test pages of a time range over every location continue from one location into the next
+
+        Args:
+            mock_db_table (Mock): db table mock
+        """
+        mock_db_table.query.side_effect = [{"Items": [{"id": "a"}]}, {"Items": [{"id": "b"}]}, {"Items": []}]
+        service = CpuMetricsService()
+
+        first = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table, params=CpuMetricQueryParams(start=0, end=3600, limit=1)
+        )
+        second = service.get_cpu_metrics_page(
+            cpu_metric_table=mock_db_table,
+            params=CpuMetricQueryParams(start=0, end=3600, limit=5, cursor=first.next_cursor),
+        )
+
+        assert [first.items, second.items] == [[{"id": "a"}], [{"id": "b"}]]
+        assert second.next_cursor is None
+        assert mock_db_table.query.call_count == 3
+
+    @pytest.mark.parametrize(
+        "query_params",
+        [
+            CpuMetricQueryParams(device="pi", start=100, end=50),
+            CpuMetricQueryParams(device="pi", start=0, end=32 * 86400),
+        ],
+    )
+    def test_get_cpu_metrics_invalid_time_range(
+        self, query_params: CpuMetricQueryParams, mock_db_table: Mock, scan_client: Mock
+    ) -> None:
+        """test reversed and over long time ranges are rejected before querying
+
+        Args:
+            query_params (CpuMetricQueryParams): query parameters with an invalid time range
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        with pytest.raises(InvalidRequestException):
+            CpuMetricsService().get_cpu_metrics(cpu_metric_table=mock_db_table, params=query_params)
+
+        scan_client.query.assert_not_called()
+
+    def test_get_cpu_metric_aggregates(self, mock_db_table: Mock, scan_client: Mock) -> None:
+        """test aggregates are computed from a projected time range query
+
+        Args:
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        mock_db_table.name = "TestTable"
+        scan_client.query.return_value = {
+            "Items": [_typed({"timestamp": 60, "cpu_usage": 5}), _typed({"timestamp": 119, "cpu_usage": 7})]
+        }
+        params = CpuMetricAggregateParams(location="Home", start=0, end=3600, agg="avg,max,avg")
+
+        result = CpuMetricsService().get_cpu_metric_aggregates(cpu_metric_table=mock_db_table, params=params)
+
+        assert result.model_dump(exclude_none=True) == {
+            "bucket": "1m",
+            "bucket_start": [60],
+            "count": [2],
+            "avg": [6.0],
+            "max": [7.0],
+        }
+        query_kwargs = scan_client.query.call_args.kwargs
+        assert query_kwargs["IndexName"] == "LocationTimestampIndex"
+        assert query_kwargs["ProjectionExpression"] == "#timestamp, #cpu_usage"
+
+    @pytest.mark.parametrize("agg", ["median", "avg,median", ","])
+    def test_get_cpu_metric_aggregates_unknown_aggregation(
+        self, agg: str, mock_db_table: Mock, scan_client: Mock
+    ) -> None:
+        """test unknown aggregations are rejected before querying
+
+        Args:
+            agg (str): invalid aggregation list
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        with pytest.raises(InvalidRequestException):
+            CpuMetricsService().get_cpu_metric_aggregates(
+                cpu_metric_table=mock_db_table, params=CpuMetricAggregateParams(agg=agg, device="pi")
+            )
+
+        scan_client.query.assert_not_called()
+
+    def test_get_cpu_metric_aggregates_requires_device_or_location(
+        self, mock_db_table: Mock, scan_client: Mock
+    ) -> None:
+        """test aggregates over every device and location are rejected before reading any sample
+
+        Args:
+            mock_db_table (Mock): db table mock
+            scan_client (Mock): plain client mock
+        """
+        with pytest.raises(InvalidRequestException):
+            CpuMetricsService().get_cpu_metric_aggregates(
+                cpu_metric_table=mock_db_table, params=CpuMetricAggregateParams(start=0, end=3600)
+            )
+
+        scan_client.query.assert_not_called()
+        scan_client.scan.assert_not_called()
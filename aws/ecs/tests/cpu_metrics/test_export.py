@@ -0,0 +1,88 @@
+"""
+Unit tests for the export module.
+Author: Tom Aston
+"""
+
+import io
+from decimal import Decimal
+from typing import Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.cpu_metrics.export import EXPORT_SCHEMA, iter_export_chunks
+
+
+def _item(index: int) -> dict:
+    return {
+        "id": str(index),
+        "device": "pi",
+        "location": "Home",
+        "timestamp": Decimal(1633529469 + index),
+        "cpu_usage": Decimal("12.5"),
+        "unit": "%",
+        "topic": "device/cpu",
+        "loop_count": Decimal(1),
+        "project": "test",
+        "version": "1.0",
+    }
+
+
+def _pages(page_sizes: list[int]) -> list[list[dict]]:
+    pages, start = [], 0
+    for page_size in page_sizes:
+        pages.append([_item(index) for index in range(start, start + page_size)])
+        start += page_size
+    return pages
+
+
+class TestUnitExport:
+    """
+    Unit tests for the export module in CPU Metrics API
+    """
+
+    def test_parquet_written_in_row_groups_as_pages_arrive(self) -> None:
+        """test pages are buffered into row groups of at least row_group_rows and each is yielded once written"""
+        pages = _pages([3, 3, 3, 0])
+        pages_read = 0
+
+        def read_pages() -> Iterator[list[dict]]:
+            nonlocal pages_read
+            for page in pages:
+                pages_read += 1
+                yield page
+
+        chunks = iter_export_chunks(read_pages(), "parquet", row_group_rows=4)
+        data = next(chunks)
+        while len(data) <= 4:  # the PAR1 magic is written before the first row group
+            data += next(chunks)
+        assert pages_read == 2  # the first row group is yielded before the remaining pages are read
+        data += b"".join(chunks)
+
+        parquet_file = pq.ParquetFile(io.BytesIO(data))
+        assert [parquet_file.metadata.row_group(index).num_rows for index in range(2)] == [6, 3]
+        table = parquet_file.read()
+        assert table.schema == EXPORT_SCHEMA
+        assert table.column("timestamp").to_pylist() == [1633529469 + index for index in range(9)]
+        assert table.column("cpu_usage").to_pylist() == [12.5] * 9
+
+    def test_arrow_stream_writes_a_batch_per_page(self) -> None:
+        """test each non-empty page is written to the Arrow IPC stream as soon as it is read"""
+        chunks = list(iter_export_chunks(iter(_pages([2, 0, 3])), "arrow"))
+
+        reader = pa.ipc.open_stream(b"".join(chunks))
+        batches = list(reader)
+        assert reader.schema == EXPORT_SCHEMA
+        assert [batch.num_rows for batch in batches] == [2, 3]
+        assert len(chunks) == 3  # schema and first page, second page, end of stream
+
+    def test_empty_export(self) -> None:
+        """test an export without items is still a readable file with the export schema"""
+        for export_format in ("parquet", "arrow"):
+            data = b"".join(iter_export_chunks(iter([]), export_format))
+
+            if export_format == "parquet":
+                table = pq.read_table(io.BytesIO(data))
+            else:
+                table = pa.ipc.open_stream(data).read_all()
+            assert table.num_rows == 0
+            assert table.schema == EXPORT_SCHEMA
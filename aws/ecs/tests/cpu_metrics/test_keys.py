@@ -0,0 +1,82 @@
+"""
+Unit tests for the cpu metric table keys module
+Author: Tom Aston
+"""
+
+import uuid
+
+import pytest
+from src.cpu_metrics.keys import (
+    PARTITION_KEY,
+    SORT_KEY,
+    TTL_ATTRIBUTE,
+    device_day_key,
+    device_day_keys,
+    timestamp_id_key,
+    timestamp_id_range,
+    with_table_keys,
+)
+
+
+class TestUnitCpuMetricKeys:
+    """
+    Unit tests for the time-bucketed table keys in CPU Metrics API
+    """
+
+    @pytest.mark.parametrize(
+        "device,timestamp,expected",
+        [
+            ("raspberry_pi_1", 0, "raspberry_pi_1#1970-01-01"),
+            ("Raspberry Pi", 1633529469, "Raspberry Pi#2021-10-06"),
+            ("Raspberry Pi", 1633564799, "Raspberry Pi#2021-10-06"),  # last second of the UTC day
+            ("Raspberry Pi", 1633564800, "Raspberry Pi#2021-10-07"),
+        ],
+    )
+    def test_device_day_key(self, device: str, timestamp: int, expected: str) -> None:
+        """test the partition key buckets by UTC day
+
+        Args:
+            device (str): device name
+            timestamp (int): epoch seconds
+            expected (str): expected partition key
+        """
+        assert device_day_key(device, timestamp) == expected
+
+    def test_timestamp_id_key_orders_by_time(self) -> None:
+        """test the zero padded sort key orders lexicographically in time order"""
+        earlier = timestamp_id_key(999999999, "b")
+        later = timestamp_id_key(1000000000, "a")
+
+        assert earlier == "0999999999#b"
+        assert earlier < later
+
+    def test_with_table_keys(self) -> None:
+        """test the keys are added to an item in place"""
+        item = {"id": "abc", "device": "Raspberry Pi", "timestamp": 1633529469, "cpu_usage": 40}
+
+        result = with_table_keys(item)
+
+        assert result is item
+        assert item[PARTITION_KEY] == "Raspberry Pi#2021-10-06"
+        assert item[SORT_KEY] == "1633529469#abc"
+
+    def test_with_table_keys_sets_ttl(self) -> None:
+        """test the TTL is set from the timestamp only when a retention is given"""
+        item = {"id": "abc", "device": "Raspberry Pi", "timestamp": 1633529469, "cpu_usage": 40}
+
+        assert TTL_ATTRIBUTE not in with_table_keys(dict(item))
+        assert with_table_keys(dict(item), retention_days=30)[TTL_ATTRIBUTE] == 1633529469 + 30 * 86400
+
+    def test_timestamp_id_range_covers_every_id(self) -> None:
+        """test the sort key bounds include every id at the start and end seconds and nothing outside"""
+        lower, upper = timestamp_id_range(1633529469, 1633529470)
+
+        for timestamp in (1633529469, 1633529470):
+            assert lower <= timestamp_id_key(timestamp, str(uuid.uuid4())) <= upper
+        assert timestamp_id_key(1633529468, str(uuid.uuid4())) < lower
+        assert timestamp_id_key(1633529471, str(uuid.uuid4())) > upper
+
+    def test_device_day_keys(self) -> None:
+        """test one partition key per UTC day touched by the range"""
+        assert device_day_keys("pi", 1633564799, 1633564800) == ["pi#2021-10-06", "pi#2021-10-07"]
+        assert device_day_keys("pi", 1633529469, 1633529469) == ["pi#2021-10-06"]
@@ -0,0 +1,140 @@
+"""
+Unit tests for the pagination module.
+Author: Tom Aston
+"""
+
+from decimal import Decimal
+from typing import Any
+from unittest.mock import Mock
+
+import pytest
+from src.cpu_metrics.pagination import (
+    decode_cursor,
+    encode_cursor,
+    iter_partitioned_pages,
+    read_cursor,
+    read_page,
+    read_partitioned_page,
+)
+from src.errors import InvalidCursorException
+
+LAST_EVALUATED_KEY = {
+    "device_day": "pi#2025-04-08",
+    "timestamp_id": "1744070400#abc",
+    "location": "Home",
+    "cpu_usage": Decimal("12.5"),
+}
+
+
+class TestUnitPagination:
+    """
+    Unit tests for the pagination module in CPU Metrics API
+    """
+
+    def test_cursor_round_trip(self) -> None:
+        """test a cursor decodes back to the key it was created from"""
+        cursor = encode_cursor(LAST_EVALUATED_KEY, scope="Home|gt|10")
+
+        assert "pi#2025" not in cursor
+        assert decode_cursor(cursor, scope="Home|gt|10") == LAST_EVALUATED_KEY
+
+    @pytest.mark.parametrize("cursor", ["not-a-cursor", "a.b.c", "!!!.???"])
+    def test_malformed_cursor(self, cursor: str) -> None:
+        """test malformed cursors are rejected
+
+        Args:
+            cursor (str): malformed cursor
+        """
+        with pytest.raises(InvalidCursorException):
+            decode_cursor(cursor, scope="*")
+
+    def test_tampered_cursor(self) -> None:
+        """test a cursor with a modified key is rejected"""
+        cursor = encode_cursor(LAST_EVALUATED_KEY, scope="*")
+        other = encode_cursor({**LAST_EVALUATED_KEY, "device_day": "pi#2025-04-09"}, scope="*")
+
+        with pytest.raises(InvalidCursorException):
+            decode_cursor(f"{other.split('.')[0]}.{cursor.split('.')[1]}", scope="*")
+
+    def test_cursor_from_another_query(self) -> None:
+        """test a cursor cannot continue a different query"""
+        cursor = encode_cursor(LAST_EVALUATED_KEY, scope="Home|gt|10")
+
+        with pytest.raises(InvalidCursorException):
+            decode_cursor(cursor, scope="Office|gt|10")
+
+    def test_read_page_fills_page(self) -> None:
+        """test pages are followed with the remaining limit until the page is full"""
+        responses = [
+            {"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}},
+            {"Items": [{"id": "b"}, {"id": "c"}], "LastEvaluatedKey": {"id": "c"}},
+        ]
+        operation = Mock(side_effect=responses)
+
+        page = read_page(operation, {"IndexName": "LocationIndex"}, limit=3, cursor=None, scope="*")
+
+        assert [item["id"] for item in page.items] == ["a", "b", "c"]
+        assert [call.kwargs["Limit"] for call in operation.call_args_list] == [3, 2]
+        assert operation.call_args_list[1].kwargs["ExclusiveStartKey"] == {"id": "a"}
+        assert decode_cursor(page.next_cursor, scope="*") == {"id": "c"}
+
+    def test_read_page_continues_from_cursor(self) -> None:
+        """test a cursor is used as the ExclusiveStartKey and the last page has no cursor"""
+        operation = Mock(return_value={"Items": [{"id": "d"}]})
+        cursor = encode_cursor({"id": "c"}, scope="*")
+
+        page = read_page(operation, {}, limit=10, cursor=cursor, scope="*")
+
+        kwargs: dict[str, Any] = operation.call_args.kwargs
+        assert kwargs["ExclusiveStartKey"] == {"id": "c"}
+        assert page.items == [{"id": "d"}]
+        assert page.next_cursor is None
+
+    def test_read_page_carries_state(self) -> None:
+        """test the query state is signed into the cursor of the next page"""
+        operation = Mock(return_value={"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}})
+
+        page = read_page(operation, {}, limit=1, cursor=None, scope="*", state={"start": 0, "end": 3600})
+
+        assert read_cursor(page.next_cursor, scope="*") == ({"id": "a"}, {"start": 0, "end": 3600})
+
+    def test_read_partitioned_page_moves_to_next_partition(self) -> None:
+        """test a page continues into the next partition and its cursor carries the partition it ends in"""
+        operation = Mock(
+            side_effect=[
+                {"Items": [{"id": "a"}]},
+                {"Items": [{"id": "b"}], "LastEvaluatedKey": {"id": "b"}},
+                {"Items": [{"id": "c"}]},
+            ]
+        )
+        partitions = [{"KeyConditionExpression": "day1"}, {"KeyConditionExpression": "day2"}]
+
+        first = read_partitioned_page(operation, partitions, limit=2, cursor=None, scope="*", state={"end": 1})
+        second = read_partitioned_page(operation, partitions, limit=2, cursor=first.next_cursor, scope="*")
+
+        assert read_cursor(first.next_cursor, scope="*") == ({"id": "b"}, {"end": 1, "partition": 1})
+        assert [call.kwargs["KeyConditionExpression"] for call in operation.call_args_list] == ["day1", "day2", "day2"]
+        assert operation.call_args_list[2].kwargs["ExclusiveStartKey"] == {"id": "b"}
+        assert [first.items, second.items] == [[{"id": "a"}, {"id": "b"}], [{"id": "c"}]]
+        assert second.next_cursor is None
+
+    def test_read_partitioned_page_ending_with_a_partition(self) -> None:
+        """test a page filled by the last items of a partition continues at the start of the next partition"""
+        operation = Mock(return_value={"Items": [{"id": "a"}]})
+
+        page = read_partitioned_page(operation, [{}, {}], limit=1, cursor=None, scope="*")
+
+        assert read_cursor(page.next_cursor, scope="*") == ({}, {"partition": 1})
+
+    def test_iter_partitioned_pages(self) -> None:
+        """test partitions are read in order from the start partition and key up to the limit"""
+        operation = Mock(side_effect=[{"Items": [{"id": "b"}]}, {"Items": [{"id": "c"}, {"id": "d"}]}])
+        partitions = [{"KeyConditionExpression": day} for day in ("day1", "day2", "day3")]
+
+        pages = list(iter_partitioned_pages(operation, partitions, start_key={"id": "a"}, partition=1, limit=3))
+
+        assert pages == [[{"id": "b"}], [{"id": "c"}, {"id": "d"}]]
+        assert [call.kwargs["KeyConditionExpression"] for call in operation.call_args_list] == ["day2", "day3"]
+        assert operation.call_args_list[0].kwargs["ExclusiveStartKey"] == {"id": "a"}
+        assert "ExclusiveStartKey" not in operation.call_args_list[1].kwargs
+        assert [call.kwargs["Limit"] for call in operation.call_args_list] == [3, 2]
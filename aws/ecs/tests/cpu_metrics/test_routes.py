@@ -3,14 +3,116 @@ Unit tests for the routes module
 Author: Tom Aston
 """
 
+import io
+import json
+from typing import Generator
+from unittest.mock import Mock
+
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+from src.auth.service import get_current_claims
 from src.config import config_manager
+from src.cpu_metrics.bulk_import import NDJSON_MEDIA_TYPE
+from src.cpu_metrics.schemas import LOCATIONS
+from src.databases.dynamo_db import get_db_table
+from src.main import app
 
 API_VERSION = config_manager.VERSION
 
+ITEM = {
+    "id": "a",
+    "unit": "%",
+    "loop_count": 1,
+    "project": "test",
+    "topic": "device/cpu",
+    "location": "Home",
+    "cpu_usage": 12,
+    "device": "pi",
+    "version": "1.0",
+    "timestamp": 1800,
+}
+
 
 class TestUnitCpuMetricRoutes:
     """
     Test suite for the routes module in CPU Metrics API
     """
 
-    pass
+    @pytest.fixture
+    def db_table(self) -> Mock:
+        """db table mock returned by the db table dependency
+
+        Returns:
+            Mock: mock of db table
+        """
+        return Mock()
+
+    @pytest.fixture
+    def client(self, db_table: Mock) -> Generator[TestClient, None, None]:
+        """test client with the auth and db table dependencies overridden
+
+        Args:
+            db_table (Mock): db table mock
+
+        Yields:
+            TestClient: test client
+        """
+        app.dependency_overrides[get_current_claims] = lambda: {"username": "test_user"}
+        app.dependency_overrides[get_db_table] = lambda: db_table
+        yield TestClient(app)
+        app.dependency_overrides.clear()
+
+    @pytest.mark.parametrize("path", ["batch_get", "batch_delete"])
+    def test_batch_ids_limited_to_one_batch_get_page(self, path: str, client: TestClient) -> None:
+        """test batch id requests are capped at one BatchGetItem page, as each id costs an id index query
+
+        Args:
+            path (str): batch id route
+            client (TestClient): test client
+        """
+        ids = [str(index) for index in range(config_manager.BATCH_IDS_MAX_ITEMS + 1)]
+
+        response = client.post(f"/api/{API_VERSION}/cpu_metrics/{path}", json={"ids": ids})
+
+        assert config_manager.BATCH_IDS_MAX_ITEMS == 100
+        assert response.status_code == 422
+
+    def test_ndjson_time_range_over_every_location(self, client: TestClient, db_table: Mock) -> None:
+        """test an NDJSON stream of a time range without a device or location is read one location after another
+
+        Args:
+            client (TestClient): test client
+            db_table (Mock): db table mock
+        """
+        db_table.query.side_effect = lambda **kwargs: {"Items": [{**ITEM, "id": str(db_table.query.call_count)}]}
+
+        response = client.get(
+            f"/api/{API_VERSION}/cpu_metrics",
+            params={"start": 0, "end": 3600},
+            headers={"Accept": NDJSON_MEDIA_TYPE},
+        )
+
+        assert response.status_code == 200
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["1", "2", "3"]
+        assert db_table.query.call_count == len(LOCATIONS)
+        db_table.scan.assert_not_called()
+
+    def test_export_time_range_over_every_location(self, client: TestClient, db_table: Mock) -> None:
+        """test an export of a time range without a device is read from one query per location into one file
+
+        Args:
+            client (TestClient): test client
+            db_table (Mock): db table mock
+        """
+        db_table.query.side_effect = lambda **kwargs: {"Items": [{**ITEM, "id": str(db_table.query.call_count)}]}
+
+        response = client.get(
+            f"/api/{API_VERSION}/cpu_metrics/export", params={"start": 0, "end": 3600, "format": "parquet"}
+        )
+
+        assert response.status_code == 200
+        table = pq.read_table(io.BytesIO(response.content))
+        assert table.column("id").to_pylist() == ["1", "2", "3"]
+        assert all(call.kwargs["IndexName"] == "LocationTimestampIndex" for call in db_table.query.call_args_list)
+        db_table.scan.assert_not_called()
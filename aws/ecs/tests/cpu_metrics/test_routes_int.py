@@ -69,6 +69,22 @@ class TestIntegrationCpuMetricRoutes:
             elif operator == "lt":
                 assert cpu_metric["cpu_usage"] < CPU_USAGE_VALUE
 
+    def test_export_cpu_metrics(self, test_client: TestClient, auth_token: str) -> None:
+        """test export of cpu metrics as a parquet file
+
+        Args:
+            test_client (TestClient): test client from conftest.py
+        """
+        response = test_client.get(
+            url=f"{self.BASE_URL}/export",
+            params={"format": "parquet"},
+            headers={"Authorization": f"Bearer {auth_token}"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.apache.parquet"
+        assert response.content[:4] == b"PAR1"
+
     def test_create_cpu_metric(
         self, test_client: TestClient, test_create_payload: list[CpuMetricCreateSchema], auth_token: str
     ) -> None:
@@ -102,7 +118,28 @@ class TestIntegrationCpuMetricRoutes:
         )
 
         assert response.status_code == 201
-        assert len(response.json()) == len(payload)
+        assert response.json()["created"] == len(payload)
+        assert len(response.json()["results"]) == len(payload)
+
+    def test_import_cpu_metrics(
+        self, test_client: TestClient, test_create_payload: list[CpuMetricCreateSchema], auth_token: str
+    ) -> None:
+        """test import of cpu metrics from an NDJSON upload
+
+        Args:
+            test_client (TestClient): test client from conftest.py
+            test_create_payload (list[CpuMetricCreateSchema]): cpu metric payload
+        """
+        content = "".join(cpu_metric.model_dump_json() + "\n" for cpu_metric in test_create_payload)
+
+        response = test_client.post(
+            url=f"{self.BASE_URL}/import",
+            content=content,
+            headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.status_code == 201
+        assert response.json()["created"] == len(test_create_payload)
 
     def test_update_cpu_metric(
         self, test_client: TestClient, test_create_payload: list[CpuMetricCreateSchema], auth_token: str
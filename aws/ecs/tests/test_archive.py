@@ -0,0 +1,101 @@
+"""
+Unit tests for the archive tool.
+Author: Tom Aston
+"""
+
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from tools.archive import archive_cpu_metrics, archive_window, read_archive
+
+NOW = 1744156800 + 3600  # 2025-04-09 01:00 UTC
+DAY = 86400
+
+
+def _item(id: str, device: str, timestamp: int) -> dict:
+    return {
+        "id": id,
+        "device": device,
+        "location": "Home",
+        "timestamp": Decimal(timestamp),
+        "cpu_usage": Decimal("12.5"),
+        "unit": "%",
+        "topic": "device/cpu",
+        "loop_count": Decimal(1),
+        "project": "test",
+        "version": "1.0",
+        "device_day": "ignored",
+        "timestamp_id": "ignored",
+        "expires_at": Decimal(timestamp + 30 * DAY),
+    }
+
+
+class TestUnitArchive:
+    """
+    Unit tests for the archive tool of the CPU Metrics API
+    """
+
+    @pytest.fixture
+    def mock_db_table(self) -> Mock:
+        """mock db table fixture returning two scan pages from the day before NOW
+
+        Returns:
+            Mock: mock of db table
+        """
+        start = NOW - 3600 - DAY
+        table = Mock()
+        table.scan.side_effect = [
+            {"Items": [_item("a", "pi-1", start), _item("b", "pi-2", start + 60)], "LastEvaluatedKey": {"k": 1}},
+            {"Items": [_item("c", "pi-1", start + 120)]},
+        ]
+        return table
+
+    def test_archive_window(self) -> None:
+        """test the window covers whole UTC days ending older_than_days before today"""
+        assert archive_window(older_than_days=1, days=2, now=NOW) == (NOW - 3600 - 3 * DAY, NOW - 3600 - DAY)
+
+    def test_archive_cpu_metrics(self, mock_db_table: Mock, tmp_path: Path) -> None:
+        """test items are written partitioned by date and device and can be read back
+
+        Args:
+            mock_db_table (Mock): db table mock
+            tmp_path (Path): archive directory
+        """
+        results = archive_cpu_metrics(mock_db_table, str(tmp_path), older_than_days=0, now=NOW)
+
+        assert results == {"items": 3, "partitions": 2}
+        assert mock_db_table.scan.call_args_list[1].kwargs["ExclusiveStartKey"] == {"k": 1}
+        assert (tmp_path / "date=2025-04-08" / "device=pi-1" / "part-0.parquet").exists()
+
+        archived = read_archive(str(tmp_path), device="pi-1")
+        assert sorted(archived["id"]) == ["a", "c"]
+        assert "expires_at" not in archived.columns
+
+    def test_archive_cpu_metrics_is_idempotent(self, mock_db_table: Mock, tmp_path: Path) -> None:
+        """test re-archiving a day replaces its partitions rather than duplicating rows
+
+        Args:
+            mock_db_table (Mock): db table mock
+            tmp_path (Path): archive directory
+        """
+        pages = list(mock_db_table.scan.side_effect)
+        mock_db_table.scan.side_effect = pages + pages
+
+        archive_cpu_metrics(mock_db_table, str(tmp_path), older_than_days=0, now=NOW)
+        archive_cpu_metrics(mock_db_table, str(tmp_path), older_than_days=0, now=NOW)
+
+        assert len(read_archive(str(tmp_path))) == 3
+
+    def test_archive_cpu_metrics_empty_window(self, tmp_path: Path) -> None:
+        """test nothing is written when no items fall in the window
+
+        Args:
+            tmp_path (Path): archive directory
+        """
+        table = Mock()
+        table.scan.return_value = {"Items": []}
+
+        assert archive_cpu_metrics(table, str(tmp_path), older_than_days=7, now=NOW) == {"items": 0, "partitions": 0}
+        assert not any(tmp_path.iterdir())
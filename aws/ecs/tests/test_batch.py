@@ -0,0 +1,286 @@
+"""
+Test cases for the batch module.
+Author: Tom Aston
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Generator
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from src.databases.batch import AdaptiveBackoff, batch_delete_items, batch_get_items, batch_put_items
+
+KEY_ATTRIBUTES = ("pk", "sk")
+
+
+def _items(count: int) -> list[dict[str, Any]]:
+    return [{"pk": "device", "sk": f"{index:05d}", "value": index} for index in range(count)]
+
+
+def _client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "BatchWriteItem")
+
+
+class TestUnitBatchWrite:
+    """
+    Unit tests for the batch write module in CPU Metrics API
+    """
+
+    @pytest.fixture
+    def executor(self) -> Generator[ThreadPoolExecutor, None, None]:
+        """executor fixture
+
+        Yields:
+            ThreadPoolExecutor: executor for the chunks
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            yield executor
+
+    @pytest.fixture
+    def backoff(self) -> AdaptiveBackoff:
+        """backoff fixture that does not sleep
+
+        Returns:
+            AdaptiveBackoff: backoff with a no-op sleep
+        """
+        return AdaptiveBackoff(sleep=lambda _: None)
+
+    def _table(self, batch_write_item: Any) -> Mock:
+        table = Mock()
+        table.name = "TestTable"
+        table.meta.client.batch_write_item.side_effect = batch_write_item
+        return table
+
+    def test_items_split_into_chunks_of_25(self, executor: ThreadPoolExecutor, backoff: AdaptiveBackoff) -> None:
+        """test the items are written in chunks of at most 25 and every item succeeds
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+            backoff (AdaptiveBackoff): backoff that does not sleep
+        """
+        chunk_sizes: list[int] = []
+        lock = Lock()
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            with lock:
+                chunk_sizes.append(len(RequestItems["TestTable"]))
+            return {"UnprocessedItems": {}}
+
+        table = self._table(batch_write_item)
+
+        errors = batch_put_items(table, _items(60), KEY_ATTRIBUTES, executor=executor, backoff=backoff)
+
+        assert errors == [None] * 60
+        assert sorted(chunk_sizes) == [10, 25, 25]
+
+    def test_unprocessed_items_retried(self, executor: ThreadPoolExecutor, backoff: AdaptiveBackoff) -> None:
+        """test unprocessed items are retried alone until they are written
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+            backoff (AdaptiveBackoff): backoff that does not sleep
+        """
+        calls: list[list[str]] = []
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            requests = RequestItems["TestTable"]
+            calls.append([request["PutRequest"]["Item"]["sk"] for request in requests])
+            if len(calls) == 1:
+                return {"UnprocessedItems": {"TestTable": requests[1:]}}
+            return {"UnprocessedItems": {}}
+
+        table = self._table(batch_write_item)
+
+        errors = batch_put_items(table, _items(3), KEY_ATTRIBUTES, executor=executor, backoff=backoff)
+
+        assert errors == [None, None, None]
+        assert calls == [["00000", "00001", "00002"], ["00001", "00002"]]
+        assert backoff.delay == backoff.base_delay  # doubled on the throttled call, halved on the clean one
+
+    def test_items_fail_after_max_attempts(self, executor: ThreadPoolExecutor, backoff: AdaptiveBackoff) -> None:
+        """test items still unprocessed after the last attempt fail while the rest of the chunk succeeds
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+            backoff (AdaptiveBackoff): backoff that does not sleep
+        """
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            requests = RequestItems["TestTable"]
+            return {"UnprocessedItems": {"TestTable": [r for r in requests if r["PutRequest"]["Item"]["value"] == 1]}}
+
+        table = self._table(batch_write_item)
+
+        errors = batch_put_items(table, _items(3), KEY_ATTRIBUTES, executor=executor, max_attempts=3, backoff=backoff)
+
+        assert errors == [None, "Unprocessed after 3 attempts", None]
+        assert table.meta.client.batch_write_item.call_count == 3
+
+    def test_throttling_retried_and_other_errors_fail_chunk(
+        self, executor: ThreadPoolExecutor, backoff: AdaptiveBackoff
+    ) -> None:
+        """test throttling errors are retried while other errors fail only the items of their chunk
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+            backoff (AdaptiveBackoff): backoff that does not sleep
+        """
+        throttled = set()
+        lock = Lock()
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            first = RequestItems["TestTable"][0]["PutRequest"]["Item"]["value"]
+            if first == 25:
+                raise _client_error("ValidationException")
+            with lock:
+                if first not in throttled:
+                    throttled.add(first)
+                    raise _client_error("ProvisionedThroughputExceededException")
+            return {}
+
+        table = self._table(batch_write_item)
+
+        errors = batch_put_items(table, _items(30), KEY_ATTRIBUTES, executor=executor, backoff=backoff)
+
+        assert errors == [None] * 25 + ["ValidationException"] * 5
+        assert table.meta.client.batch_write_item.call_count == 3
+
+    def test_botocore_errors_fail_chunk(self, executor: ThreadPoolExecutor, backoff: AdaptiveBackoff) -> None:
+        """test an error raised by botocore before a response fails only the items of its chunk
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+            backoff (AdaptiveBackoff): backoff that does not sleep
+        """
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            if RequestItems["TestTable"][0]["PutRequest"]["Item"]["value"] == 25:
+                raise EndpointConnectionError(endpoint_url="https://dynamodb.test")
+            return {}
+
+        table = self._table(batch_write_item)
+
+        errors = batch_put_items(table, _items(30), KEY_ATTRIBUTES, executor=executor, backoff=backoff)
+
+        assert errors == [None] * 25 + ["EndpointConnectionError"] * 5
+        assert table.meta.client.batch_write_item.call_count == 2
+
+    def test_deletes_retried_and_matched_by_key(self, executor: ThreadPoolExecutor, backoff: AdaptiveBackoff) -> None:
+        """test deletes are sent as delete requests and unprocessed deletes are retried
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+            backoff (AdaptiveBackoff): backoff that does not sleep
+        """
+        calls: list[list[str]] = []
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            requests = RequestItems["TestTable"]
+            calls.append([request["DeleteRequest"]["Key"]["sk"] for request in requests])
+            return {
+                "UnprocessedItems": {"TestTable": [r for r in requests if r["DeleteRequest"]["Key"]["sk"] == "00000"]}
+            }
+
+        table = self._table(batch_write_item)
+        keys = [{"pk": "device", "sk": f"{index:05d}"} for index in range(30)]
+
+        errors = batch_delete_items(table, keys, KEY_ATTRIBUTES, executor=executor, max_attempts=2, backoff=backoff)
+
+        assert errors == ["Unprocessed after 2 attempts"] + [None] * 29
+        assert sorted(len(call) for call in calls) == [1, 5, 25]
+
+    def test_adaptive_backoff(self) -> None:
+        """test the delay doubles on throttling up to the max and halves on success down to the base"""
+        sleeps: list[float] = []
+        backoff = AdaptiveBackoff(base_delay=1, max_delay=4, sleep=sleeps.append)
+
+        for _ in range(4):
+            backoff.throttled()
+        assert backoff.delay == 4
+        backoff.wait()
+        for _ in range(4):
+            backoff.succeeded()
+        assert backoff.delay == 1
+
+        assert 0 <= sleeps[0] <= 4
+
+
+class TestUnitBatchGet:
+    """
+    Unit tests for the batch get in the batch module in CPU Metrics API
+    """
+
+    @pytest.fixture
+    def executor(self) -> Generator[ThreadPoolExecutor, None, None]:
+        """executor fixture
+
+        Yields:
+            ThreadPoolExecutor: executor for the chunks
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            yield executor
+
+    def _table(self, batch_get_item: Any) -> Mock:
+        table = Mock()
+        table.name = "TestTable"
+        table.meta.client.batch_get_item.side_effect = batch_get_item
+        return table
+
+    def test_keys_split_into_chunks_of_100_and_matched(self, executor: ThreadPoolExecutor) -> None:
+        """test the keys are read in chunks of at most 100 and each item is returned against its key
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+        """
+        chunk_sizes: list[int] = []
+        lock = Lock()
+
+        def batch_get_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            keys = RequestItems["TestTable"]["Keys"]
+            with lock:
+                chunk_sizes.append(len(keys))
+            # responses are unordered and leave out keys with no item
+            found = [{**key, "value": int(key["sk"])} for key in reversed(keys) if int(key["sk"]) % 2 == 0]
+            return {"Responses": {"TestTable": found}, "UnprocessedKeys": {}}
+
+        table = self._table(batch_get_item)
+        keys = [{"pk": "device", "sk": f"{index:05d}"} for index in range(150)]
+
+        results = batch_get_items(table, keys, KEY_ATTRIBUTES, executor=executor)
+
+        assert sorted(chunk_sizes) == [50, 100]
+        for index, (item, error) in enumerate(results):
+            assert error is None
+            assert item == ({**keys[index], "value": index} if index % 2 == 0 else None)
+
+    def test_unprocessed_keys_retried(self, executor: ThreadPoolExecutor) -> None:
+        """test unprocessed keys are retried alone and fail once the attempts run out
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+        """
+        calls: list[list[str]] = []
+
+        def batch_get_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            keys = RequestItems["TestTable"]["Keys"]
+            calls.append([key["sk"] for key in keys])
+            return {
+                "Responses": {"TestTable": [key for key in keys if key["sk"] != "00002"][:1]},
+                "UnprocessedKeys": {"TestTable": {"Keys": [key for key in keys if key["sk"] != "00002"][1:]}},
+            }
+
+        table = self._table(batch_get_item)
+        keys = [{"pk": "device", "sk": f"{index:05d}"} for index in range(4)]
+        backoff = AdaptiveBackoff(sleep=lambda _: None)
+
+        results = batch_get_items(table, keys, KEY_ATTRIBUTES, executor=executor, max_attempts=2, backoff=backoff)
+
+        assert calls == [["00000", "00001", "00002", "00003"], ["00001", "00003"]]
+        assert results == [
+            (keys[0], None),
+            (keys[1], None),
+            (None, None),
+            (None, "Unprocessed after 2 attempts"),
+        ]
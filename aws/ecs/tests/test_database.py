@@ -3,12 +3,14 @@ Test cases for the database module.
 Author: Tom Aston
 """
 
+import asyncio
+import threading
 from unittest.mock import Mock
 
 import pytest
 from mypy_boto3_dynamodb import DynamoDBClient, DynamoDBServiceResource
 from mypy_boto3_dynamodb.service_resource import Table
-from src.databases.dynamo_db import CpuMetricDatabase
+from src.databases.dynamo_db import CpuMetricDatabase, run_in_db_executor
 
 
 class TestUnitDatabase:
@@ -82,3 +84,49 @@ class TestUnitDatabase:
         mock_database_object.resource.Table.put_item = Mock()
         mock_database_object.populate_test_data(num_test_records=number_of_items)
         assert mock_database_object.resource.Table().put_item.call_count == number_of_items
+
+
+class TestUnitDatabaseExecutor:
+    """
+    Unit tests for running blocking DynamoDB calls from async routes
+    """
+
+    def test_run_in_db_executor(self) -> None:
+        """test the call runs on a database executor thread with its arguments"""
+
+        def call(value: int, offset: int = 0) -> tuple[str, int]:
+            return threading.current_thread().name, value + offset
+
+        thread_name, result = asyncio.run(run_in_db_executor(call, 1, offset=2))
+
+        assert thread_name.startswith("dynamodb")
+        assert result == 3
+
+    def test_run_in_db_executor_raises(self) -> None:
+        """test exceptions of the call are raised in the awaiting route"""
+
+        def call() -> None:
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError, match="boom"):
+            asyncio.run(run_in_db_executor(call))
+
+    def test_concurrent_calls_do_not_block_the_event_loop(self) -> None:
+        """test calls waiting on the executor leave the event loop free to run other requests"""
+        release = threading.Event()
+
+        async def main() -> list[str]:
+            order: list[str] = []
+
+            async def slow_request() -> None:
+                await run_in_db_executor(release.wait, 5)
+                order.append("slow")
+
+            async def fast_request() -> None:
+                order.append("fast")
+                release.set()
+
+            await asyncio.gather(slow_request(), fast_request())
+            return order
+
+        assert asyncio.run(main()) == ["fast", "slow"]
@@ -0,0 +1,166 @@
+"""
+Test cases for the parallel scan module.
+Author: Tom Aston
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest.mock import Mock
+
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from src.databases import parallel_scan as scan_module
+from src.databases.parallel_scan import build_request, parallel_query, parallel_scan, scan_segment_count
+
+MIB = 1024 * 1024
+
+
+class TestUnitParallelScan:
+    """
+    Unit tests for the parallel scan module in CPU Metrics API
+    """
+
+    @pytest.fixture
+    def mock_table(self) -> Mock:
+        """mock table fixture
+
+        Returns:
+            Mock: mock of table
+        """
+        table = Mock()
+        table.name = "TestTable"
+        return table
+
+    @pytest.fixture
+    def mock_client(self) -> Mock:
+        """mock low-level client fixture whose scan returns two typed pages per segment
+
+        Returns:
+            Mock: mock of client
+        """
+
+        def scan(**kwargs: Any) -> dict[str, Any]:
+            segment = kwargs.get("Segment", 0)
+            if "ExclusiveStartKey" not in kwargs:
+                return {"Items": [{"id": {"S": f"{segment}-0"}}], "LastEvaluatedKey": {"id": {"S": f"{segment}-0"}}}
+            return {"Items": [{"id": {"S": f"{segment}-1"}}]}
+
+        client = Mock()
+        client.scan.side_effect = scan
+        return client
+
+    @pytest.mark.parametrize("table_size_bytes, expected", [(0, 1), (100 * MIB, 1), (300 * MIB, 3), (10**12, 8)])
+    def test_scan_segment_count(self, table_size_bytes: int, expected: int) -> None:
+        """test the segment count grows with the table size up to the maximum
+
+        Args:
+            table_size_bytes (int): size reported by describe table
+            expected (int): expected segment count
+        """
+        scan_module._segment_counts.clear()
+        table = Mock(table_size_bytes=table_size_bytes)
+        table.name = f"Table{table_size_bytes}"
+
+        assert scan_segment_count(table, segment_size_bytes=128 * MIB, max_segments=8) == expected
+
+    @pytest.mark.parametrize("total_segments", [1, 4])
+    def test_parallel_scan(self, mock_table: Mock, mock_client: Mock, total_segments: int) -> None:
+        """test every page of every segment is returned deserialised
+
+        Args:
+            mock_table (Mock): table mock
+            mock_client (Mock): client mock
+            total_segments (int): number of segments
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            items = parallel_scan(
+                mock_table, {"FilterExpression": Attr("timestamp").gt(0)}, total_segments, executor, mock_client
+            )
+
+        assert sorted(item["id"] for item in items) == sorted(
+            f"{segment}-{page}" for segment in range(total_segments) for page in range(2)
+        )
+        assert mock_client.scan.call_count == 2 * total_segments
+        for call in mock_client.scan.call_args_list:
+            assert call.kwargs["TableName"] == "TestTable"
+            assert call.kwargs["FilterExpression"] == "#n0 > :v0"
+            assert call.kwargs["ExpressionAttributeValues"] == {":v0": {"N": "0"}}
+            assert ("TotalSegments" in call.kwargs) == (total_segments > 1)
+        mock_table.meta.client.scan.assert_not_called()
+
+    def test_parallel_scan_raises_segment_error(self, mock_table: Mock, mock_client: Mock) -> None:
+        """test a failing segment fails the scan
+
+        Args:
+            mock_table (Mock): table mock
+            mock_client (Mock): client mock
+        """
+        mock_client.scan.side_effect = ClientError({"Error": {"Code": "InternalServerError"}}, "Scan")
+
+        with ThreadPoolExecutor(max_workers=4) as executor, pytest.raises(ClientError):
+            parallel_scan(mock_table, {}, 4, executor, mock_client)
+
+    def test_parallel_query_sends_built_expressions(self, mock_table: Mock) -> None:
+        """test every query is sent with its own expression strings and typed values
+
+        Args:
+            mock_table (Mock): table mock
+        """
+        client = Mock()
+        client.query.side_effect = lambda **kwargs: {
+            "Items": [{"location": kwargs["ExpressionAttributeValues"][":v0"]}]
+        }
+        queries = [
+            {"IndexName": "LocationIndex", "KeyConditionExpression": Key("location").eq(location)} for location in "abc"
+        ]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            items = parallel_query(mock_table, queries, executor, client)
+
+        assert sorted(item["location"] for item in items) == ["a", "b", "c"]
+        for call in client.query.call_args_list:
+            assert call.kwargs["KeyConditionExpression"] == "#n0 = :v0"
+            assert call.kwargs["ExpressionAttributeNames"] == {"#n0": "location"}
+
+    def test_build_request(self) -> None:
+        """test key and filter conditions share one set of placeholders alongside the caller's names and values"""
+        kwargs = {
+            "KeyConditionExpression": Key("location").eq("Home") & Key("timestamp").between(0, 60),
+            "FilterExpression": Attr("cpu_usage").gt(50),
+            "ProjectionExpression": "#id",
+            "ExpressionAttributeNames": {"#id": "id"},
+            "ExclusiveStartKey": {"location": "Home", "timestamp": 30},
+        }
+
+        request = build_request("TestTable", kwargs)
+
+        assert request["TableName"] == "TestTable"
+        assert request["KeyConditionExpression"] == "(#n0 = :v0 AND #n1 BETWEEN :v1 AND :v2)"
+        assert request["FilterExpression"] == "#n2 > :v3"
+        assert request["ExpressionAttributeNames"] == {
+            "#id": "id",
+            "#n0": "location",
+            "#n1": "timestamp",
+            "#n2": "cpu_usage",
+        }
+        assert request["ExpressionAttributeValues"] == {
+            ":v0": {"S": "Home"},
+            ":v1": {"N": "0"},
+            ":v2": {"N": "60"},
+            ":v3": {"N": "50"},
+        }
+        assert request["ExclusiveStartKey"] == {"location": {"S": "Home"}, "timestamp": {"N": "30"}}
+        assert kwargs["ExpressionAttributeNames"] == {"#id": "id"}
+
+    def test_build_request_is_thread_safe(self) -> None:
+        """test requests built on many threads at once all get consistent placeholders"""
+        condition = Key("location").eq("Home") & Key("cpu_usage").gt(50)
+        expected = build_request("TestTable", {"KeyConditionExpression": condition})
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            requests = list(
+                executor.map(lambda _: build_request("TestTable", {"KeyConditionExpression": condition}), range(2000))
+            )
+
+        assert all(request == expected for request in requests)
@@ -0,0 +1,171 @@
+"""
+Archival of raw CPU metrics to partitioned Parquet
+
+Raw items expire from the DynamoDB table through TTL (expires_at, set from RETENTION_DAYS by the ingest lambda and the
+API). Before they expire this job exports whole UTC days of items to Parquet partitioned by date and device, so history
+stays queryable offline while the table and the cost of scanning it stay bounded. A local directory stands in for S3,
+the layout (date=YYYY-MM-DD/device=<device>/part-0.parquet) is the same as an S3 prefix for Athena or pandas.
+
+Each run rewrites the partitions of the days it exports, so re-running a day is idempotent. Run it daily with
+--older-than-days below the table retention so every day is archived before TTL removes it.
+
+Usage (from aws/ecs):
+    python -m tools.archive --output-dir archive --older-than-days 7 --days 1
+
+Author: Tom Aston
+"""
+
+import argparse
+import time
+from typing import Any
+
+import pandas as pd
+from boto3.dynamodb.conditions import Attr
+from mypy_boto3_dynamodb.service_resource import Table
+from src.databases.dynamo_db import get_database
+
+SECONDS_PER_DAY = 86400
+
+ARCHIVE_COLUMNS = [
+    "id",
+    "device",
+    "location",
+    "timestamp",
+    "cpu_usage",
+    "unit",
+    "topic",
+    "loop_count",
+    "project",
+    "version",
+]
+PARTITION_COLUMNS = ["date", "device"]
+
+
+def archive_window(older_than_days: int, days: int, now: float | None = None) -> tuple[int, int]:
+    """get the whole UTC days to archive
+
+    Args:
+        older_than_days (int): only archive days that ended at least this many days ago
+        days (int): number of days to archive
+        now (float | None): current epoch seconds, defaults to the current time
+
+    Returns:
+        tuple[int, int]: start (inclusive) and end (exclusive) epoch seconds of the window
+    """
+    today = int(time.time() if now is None else now) // SECONDS_PER_DAY * SECONDS_PER_DAY
+    end = today - older_than_days * SECONDS_PER_DAY
+    return end - days * SECONDS_PER_DAY, end
+
+
+def archive_cpu_metrics(
+    cpu_metric_table: Table, output_dir: str, older_than_days: int, days: int = 1, now: float | None = None
+) -> dict[str, int]:
+    """export the items of whole UTC days older than older_than_days to Parquet partitioned by date and device
+
+    Args:
+        cpu_metric_table (Table): cpu metric table
+        output_dir (str): archive root directory
+        older_than_days (int): only archive days that ended at least this many days ago
+        days (int): number of days to archive
+        now (float | None): current epoch seconds, defaults to the current time
+
+    Returns:
+        dict[str, int]: number of items and partitions written
+    """
+    start, end = archive_window(older_than_days, days, now)
+    items = _scan_window(cpu_metric_table, start, end)
+
+    if not items:
+        return {"items": 0, "partitions": 0}
+
+    frame = to_archive_frame(items)
+    frame.to_parquet(
+        output_dir,
+        engine="pyarrow",
+        index=False,
+        partition_cols=PARTITION_COLUMNS,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+
+    return {"items": len(frame), "partitions": frame.groupby(PARTITION_COLUMNS).ngroups}
+
+
+def to_archive_frame(items: list[dict[str, Any]]) -> pd.DataFrame:
+    """convert DynamoDB items into a typed frame with the date partition column
+
+    Args:
+        items (list[dict[str, Any]]): cpu metric items, numbers as Decimal
+
+    Returns:
+        pd.DataFrame: frame with the archive columns and date
+    """
+    frame = pd.DataFrame(items).reindex(columns=ARCHIVE_COLUMNS)
+    frame = frame.astype({"timestamp": "int64", "cpu_usage": "float64", "loop_count": "int64"})
+    frame["date"] = pd.to_datetime(frame["timestamp"], unit="s", utc=True).dt.strftime("%Y-%m-%d")
+    return frame
+
+
+def read_archive(
+    output_dir: str, device: str | None = None, start_date: str | None = None, end_date: str | None = None
+) -> pd.DataFrame:
+    """read archived cpu metrics back, pruning partitions outside the filters
+
+    Args:
+        output_dir (str): archive root directory
+        device (str | None): only read this device
+        start_date (str | None): first date to read (YYYY-MM-DD, inclusive)
+        end_date (str | None): last date to read (YYYY-MM-DD, inclusive)
+
+    Returns:
+        pd.DataFrame: archived cpu metrics
+    """
+    filters = []
+    if device is not None:
+        filters.append(("device", "==", device))
+    if start_date is not None:
+        filters.append(("date", ">=", start_date))
+    if end_date is not None:
+        filters.append(("date", "<=", end_date))
+
+    return pd.read_parquet(output_dir, engine="pyarrow", filters=filters or None)
+
+
+def _scan_window(cpu_metric_table: Table, start: int, end: int) -> list[dict[str, Any]]:
+    """scan every page of items with a timestamp in [start, end)
+
+    Args:
+        cpu_metric_table (Table): cpu metric table
+        start (int): window start epoch seconds (inclusive)
+        end (int): window end epoch seconds (exclusive)
+
+    Returns:
+        list[dict[str, Any]]: items in the window
+    """
+    scan_kwargs: dict[str, Any] = {"FilterExpression": Attr("timestamp").between(start, end - 1)}
+    items: list[dict[str, Any]] = []
+
+    while True:
+        response = cpu_metric_table.scan(**scan_kwargs)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def main() -> None:
+    """
+    Archive entry point
+    """
+    parser = argparse.ArgumentParser(description="Archive raw CPU metrics to Parquet partitioned by date and device")
+    parser.add_argument("--output-dir", default="archive", help="archive root directory (stand-in for an S3 prefix)")
+    parser.add_argument("--older-than-days", type=int, default=7, help="archive days that ended this many days ago")
+    parser.add_argument("--days", type=int, default=1, help="number of days to archive")
+    args = parser.parse_args()
+
+    results = archive_cpu_metrics(get_database().get_table(), args.output_dir, args.older_than_days, args.days)
+    print(f"archive complete: items={results['items']} partitions={results['partitions']}")
+
+
+if __name__ == "__main__":
+    main()
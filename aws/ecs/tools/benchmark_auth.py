@@ -0,0 +1,190 @@
+"""
+Benchmark the auth dependency of the protected routes
+
+Signs RS256 access tokens with a generated key whose JWK is served in-process in place of the Cognito JWKS, then
+measures:
+- the get_current_claims dependency for a hot token (served from the verified token cache) and a cold token (full
+  signature verification on the threadpool)
+- GET /cpu_metrics/cache, a route without database calls, with the real dependency against the same route with the
+  dependency overridden, so the difference is the auth overhead a request sees
+
+The run fails if the p99 overhead of a hot token is above --max-p99-ms.
+
+Usage (from aws/ecs):
+    python -m tools.benchmark_auth --requests 2000 --max-p99-ms 1
+
+Author: Tom Aston
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+import jwt
+import jwt.algorithms
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
+from src.auth import utils
+from src.auth.service import get_current_claims
+from src.config import config_manager
+from src.main import app
+
+BENCHMARK_KID = "benchmark-kid"
+
+
+def percentiles(samples_ms: list[float]) -> dict[str, float]:
+    """p50 and p99 of the samples
+
+    Args:
+        samples_ms (list[float]): durations in milliseconds
+
+    Returns:
+        dict[str, float]: p50 and p99 in milliseconds
+    """
+    cut_points = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    return {"p50": cut_points[49], "p99": cut_points[98]}
+
+
+def sign_access_token(private_key: rsa.RSAPrivateKey, sub: str, lifetime_seconds: int = 3600) -> str:
+    """sign an access token the way the Cognito user pool does
+
+    Args:
+        private_key (rsa.RSAPrivateKey): signing key published under BENCHMARK_KID
+        sub (str): subject of the token
+        lifetime_seconds (int): seconds until the token expires
+
+    Returns:
+        str: RS256 access token
+    """
+    now = int(time.time())
+    claims = {
+        "sub": sub,
+        "username": sub,
+        "token_use": "access",
+        "iss": f"https://cognito-idp.{utils.COGNITO_REGION}.amazonaws.com/{utils.USER_POOL_ID}",
+        "iat": now,
+        "exp": now + lifetime_seconds,
+    }
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": BENCHMARK_KID})
+
+
+def use_generated_key() -> rsa.RSAPrivateKey:
+    """serve the JWK of a generated key in place of the Cognito JWKS
+
+    Returns:
+        rsa.RSAPrivateKey: private key to sign tokens with
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = {**json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key())), "kid": BENCHMARK_KID}
+
+    utils.get_cognito_public_keys = lambda: [jwk]
+    utils.jwks_cache.clear()
+    utils.verified_token_cache.clear()
+    return private_key
+
+
+async def _time_calls(call: Callable[[int], Awaitable[Any]], count: int) -> list[float]:
+    """time count awaited calls
+
+    Args:
+        call (Callable[[int], Awaitable[Any]]): call to time, given the iteration number
+        count (int): number of calls
+
+    Returns:
+        list[float]: duration of each call in milliseconds
+    """
+    samples_ms = []
+    for iteration in range(count):
+        start = time.perf_counter()
+        await call(iteration)
+        samples_ms.append((time.perf_counter() - start) * 1000)
+    return samples_ms
+
+
+def benchmark_dependency(private_key: rsa.RSAPrivateKey, count: int) -> dict[str, dict[str, float]]:
+    """time get_current_claims for a hot token and for tokens it has not seen
+
+    Args:
+        private_key (rsa.RSAPrivateKey): signing key published under BENCHMARK_KID
+        count (int): calls per case
+
+    Returns:
+        dict[str, dict[str, float]]: p50 and p99 in milliseconds for the hot and cold cases
+    """
+    hot_token = sign_access_token(private_key, "hot-user")
+    cold_tokens = [sign_access_token(private_key, f"cold-user-{iteration}") for iteration in range(count)]
+
+    async def run() -> dict[str, list[float]]:
+        await get_current_claims(hot_token)  # verified once, then served from the cache
+        return {
+            "hot": await _time_calls(lambda _: get_current_claims(hot_token), count),
+            "cold": await _time_calls(lambda iteration: get_current_claims(cold_tokens[iteration]), count),
+        }
+
+    return {case: percentiles(samples) for case, samples in asyncio.run(run()).items()}
+
+
+def benchmark_route(private_key: rsa.RSAPrivateKey, count: int) -> dict[str, dict[str, float]]:
+    """time a route without database calls with and without the auth dependency
+
+    Args:
+        private_key (rsa.RSAPrivateKey): signing key published under BENCHMARK_KID
+        count (int): requests per case
+
+    Returns:
+        dict[str, dict[str, float]]: p50 and p99 in milliseconds with auth overridden and with a hot token
+    """
+    url = f"/api/{config_manager.VERSION}/cpu_metrics/cache"
+    headers = {"Authorization": f"Bearer {sign_access_token(private_key, 'route-user')}"}
+
+    def time_requests(client: TestClient) -> list[float]:
+        samples_ms = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            samples_ms.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+        return samples_ms
+
+    with TestClient(app) as client:
+        client.get(url, headers=headers).raise_for_status()  # warm up and verify the token once
+
+        app.dependency_overrides[get_current_claims] = lambda: {}
+        try:
+            baseline = time_requests(client)
+        finally:
+            app.dependency_overrides.pop(get_current_claims)
+        authenticated = time_requests(client)
+
+    return {"no_auth": percentiles(baseline), "hot_token": percentiles(authenticated)}
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the auth dependency of the protected routes")
+    parser.add_argument("--requests", type=int, default=2000, help="calls or requests per case")
+    parser.add_argument("--max-p99-ms", type=float, default=1.0, help="fail above this p99 overhead for a hot token")
+    args = parser.parse_args()
+
+    private_key = use_generated_key()
+    dependency = benchmark_dependency(private_key, args.requests)
+    route = benchmark_route(private_key, args.requests)
+    route_overhead_ms = route["hot_token"]["p99"] - route["no_auth"]["p99"]
+
+    for name, results in [*dependency.items(), *route.items()]:
+        print(f"{name:>10}: p50={results['p50']:.3f}ms p99={results['p99']:.3f}ms")
+    print(f"route p99 auth overhead: {route_overhead_ms:.3f}ms")
+
+    if max(dependency["hot"]["p99"], route_overhead_ms) > args.max_p99_ms:
+        print(f"p99 auth overhead is above {args.max_p99_ms}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Local replay benchmark for the ingest lambda
+
+Synthesises SQS batches in the shape of events/sqs_rpi_cpu_event.json and invokes handler.handler in-process against
+either an in-memory DynamoDB stand-in or DynamoDB Local (the amazon/dynamodb-local image from aws/ecs/compose.yml).
+Reports records/s, per-record latency and DynamoDB write calls per record so ingest regressions can be measured
+before deploying.
+
+Usage (from aws/sam):
+    python -m benchmarks.ingest_replay --batch-size 10 --batches 200 --devices 5
+    python -m benchmarks.ingest_replay --backend local --endpoint http://localhost:9000
+
+Author: Tom Aston
+"""
+
+import argparse
+import contextlib
+import copy
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+EVENT_TEMPLATE_PATH = Path(__file__).resolve().parent.parent / "events" / "sqs_rpi_cpu_event.json"
+LOCATIONS = ["Home", "Office", "Factory"]
+WRITE_OPERATIONS = {"put_item", "update_item", "delete_item", "batch_write_item"}
+
+
+class WriteCounter:
+    """counts DynamoDB write calls made through any wrapped table or client"""
+
+    def __init__(self) -> None:
+        self.calls: Counter[str] = Counter()
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+
+class CountingProxy:
+    """proxy around a boto3 table/client (or stand-in) that counts write calls before delegating"""
+
+    def __init__(self, target: Any, counter: WriteCounter) -> None:
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if name in WRITE_OPERATIONS and callable(attribute):
+
+            def counted(*args: Any, **kwargs: Any) -> Any:
+                self._counter.calls[name] += 1
+                return attribute(*args, **kwargs)
+
+            return counted
+        return attribute
+
+
+class InMemoryTable:
+    """minimal in-memory stand-in for a DynamoDB table resource
+
+    Only the operations used by the ingest path are implemented. Update expressions are not evaluated, the stand-in
+    only records the item so the handler sees a successful response.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items: dict[Any, dict[str, Any]] = {}
+
+    def put_item(self, Item: dict[str, Any], **kwargs: Any) -> dict[str, Any]:
+        self.items[Item.get("id", len(self.items))] = Item
+        return {}
+
+    def update_item(self, Key: dict[str, Any], **kwargs: Any) -> dict[str, Any]:
+        item = self.items.setdefault(tuple(Key.values()), dict(Key))
+        return {"Attributes": item}
+
+
+class InMemoryClient:
+    """minimal in-memory stand-in for the low-level DynamoDB client used for batch writes"""
+
+    def __init__(self, tables: dict[str, InMemoryTable]) -> None:
+        self.tables = tables
+
+    def batch_write_item(self, RequestItems: dict[str, list[dict[str, Any]]], **kwargs: Any) -> dict[str, Any]:
+        for table_name, requests in RequestItems.items():
+            table = self.tables[table_name]
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                table.items[item["id"]["S"]] = item
+        return {"UnprocessedItems": {}}
+
+
+def build_event(
+    template: dict[str, Any], batch_size: int, devices: list[str], start_time: float, event_format: str = "sns"
+) -> dict[str, Any]:
+    """build an SQS event of batch_size records like the real pipeline
+
+    Args:
+        template (dict[str, Any]): sample event used for the record shape
+        batch_size (int): number of records in the batch
+        devices (list[str]): device names to spread the records over
+        start_time (float): epoch seconds of the first sample
+        event_format (str): sns for SNS enveloped bodies, raw for raw message delivery
+
+    Returns:
+        dict[str, Any]: SQS event
+    """
+    record_template = template["Records"][0]
+    records = []
+
+    for index in range(batch_size):
+        message = {
+            "cpu_usage": random.randint(0, 100),
+            "timestamp": start_time + index,
+            "device": devices[index % len(devices)],
+            "location": random.choice(LOCATIONS),
+            "unit": "percentage",
+            "topic": "device/cpu",
+            "loop_count": index,
+            "project": "rpi-cpu-metrics",
+            "version": "1.0.0",
+        }
+        record = copy.deepcopy(record_template)
+        record["messageId"] = str(uuid.uuid4())
+        body = json.dumps(message)
+        record["body"] = json.dumps({"Message": body}) if event_format == "sns" else body
+        records.append(record)
+
+    return {"Records": records}
+
+
+def configure_backend(backend: str, endpoint: str, counter: WriteCounter) -> Any:
+    """import the ingest modules and point them at the chosen backend
+
+    Environment variables have to be set before the import because the ingest module creates its tables at import time.
+
+    Args:
+        backend (str): stub or local
+        endpoint (str): DynamoDB Local endpoint
+        counter (WriteCounter): counter shared by every wrapped table
+
+    Returns:
+        module: the handler module
+    """
+    os.environ.setdefault("DB_TABLE_NAME", "RpiCpuMetricsBenchmark")
+    os.environ.setdefault("ROLLUP_TABLE_NAME", "RpiCpuMetricRollupsBenchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+
+    if backend == "local":
+        os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = endpoint
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+
+    import rpi_cpu_metrics.dynamodb as CPU_METRICS_DB
+    from rpi_cpu_metrics import handler
+
+    if backend == "local":
+        _create_local_tables(CPU_METRICS_DB)
+        CPU_METRICS_DB.cpu_metric_table = CountingProxy(CPU_METRICS_DB.cpu_metric_table, counter)
+        CPU_METRICS_DB.cpu_metric_client = CountingProxy(CPU_METRICS_DB.cpu_metric_client, counter)
+        CPU_METRICS_DB.rollup_table = CountingProxy(CPU_METRICS_DB.rollup_table, counter)
+    else:
+        metric_table = InMemoryTable(CPU_METRICS_DB.CPU_METRIC_TABLE_NAME)
+        CPU_METRICS_DB.cpu_metric_table = CountingProxy(metric_table, counter)
+        CPU_METRICS_DB.cpu_metric_client = CountingProxy(InMemoryClient({metric_table.name: metric_table}), counter)
+        CPU_METRICS_DB.rollup_table = CountingProxy(InMemoryTable(CPU_METRICS_DB.ROLLUP_TABLE_NAME), counter)
+
+    return handler
+
+
+def _create_local_tables(CPU_METRICS_DB: Any) -> None:
+    """create the metric and rollup tables on DynamoDB Local if they do not exist yet
+
+    Args:
+        CPU_METRICS_DB (module): ingest dynamodb module
+    """
+    client = CPU_METRICS_DB.dynamo_db_client.meta.client
+    existing = set(client.list_tables()["TableNames"])
+    definitions = {
+        CPU_METRICS_DB.CPU_METRIC_TABLE_NAME: [("device_day", "S", "HASH"), ("timestamp_id", "S", "RANGE")],
+        CPU_METRICS_DB.ROLLUP_TABLE_NAME: [("device_granularity", "S", "HASH"), ("bucket_start", "N", "RANGE")],
+    }
+
+    for table_name, keys in definitions.items():
+        if table_name in existing:
+            continue
+        client.create_table(
+            TableName=table_name,
+            AttributeDefinitions=[{"AttributeName": name, "AttributeType": kind} for name, kind, _ in keys],
+            KeySchema=[{"AttributeName": name, "KeyType": key_type} for name, _, key_type in keys],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        client.get_waiter("table_exists").wait(TableName=table_name)
+
+
+def run(
+    batch_size: int, batches: int, device_count: int, backend: str, endpoint: str, event_format: str = "sns"
+) -> dict[str, float]:
+    """replay synthetic batches through the handler and collect the benchmark figures
+
+    Args:
+        batch_size (int): records per SQS batch
+        batches (int): number of batches to replay
+        device_count (int): number of distinct devices in each batch
+        backend (str): stub or local
+        endpoint (str): DynamoDB Local endpoint
+        event_format (str): sns or raw SQS record bodies
+
+    Returns:
+        dict[str, float]: benchmark results
+    """
+    counter = WriteCounter()
+    handler = configure_backend(backend, endpoint, counter)
+    template = json.loads(EVENT_TEMPLATE_PATH.read_text())
+    devices = [f"raspberry_pi_{index}" for index in range(device_count)]
+
+    events = [
+        build_event(template, batch_size, devices, time.time() + batch * batch_size, event_format)
+        for batch in range(batches)
+    ]
+    per_record_latencies = []
+    failures = 0
+
+    from common.logger import logger
+
+    # log lines are still formatted so their cost is measured, they are just not printed
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        log_stream = logger.registered_handler.setStream(devnull)
+        started = time.perf_counter()
+        for event in events:
+            invoke_started = time.perf_counter()
+            response = handler.handler(event, None)
+            per_record_latencies.append((time.perf_counter() - invoke_started) / batch_size)
+            failures += bool(response.get("batchItemFailures"))
+        elapsed = time.perf_counter() - started
+        logger.registered_handler.setStream(log_stream)
+
+    records = batch_size * batches
+    per_record_latencies.sort()
+
+    return {
+        "records": records,
+        "failed_invocations": failures,
+        "elapsed_s": elapsed,
+        "records_per_s": records / elapsed,
+        "latency_per_record_p50_us": statistics.median(per_record_latencies) * 1e6,
+        "latency_per_record_p95_us": per_record_latencies[int(len(per_record_latencies) * 0.95) - 1] * 1e6,
+        "write_calls_per_record": counter.total / records,
+        **{f"{operation}_calls": count for operation, count in sorted(counter.calls.items())},
+    }
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description="Replay synthetic SQS batches through the ingest lambda")
+    parser.add_argument("--batch-size", type=int, default=10, help="records per SQS batch")
+    parser.add_argument("--batches", type=int, default=100, help="number of batches to replay")
+    parser.add_argument("--devices", type=int, default=1, help="distinct devices per batch")
+    parser.add_argument("--backend", choices=["stub", "local"], default="stub", help="in-memory stub or DynamoDB Local")
+    parser.add_argument("--endpoint", default="http://localhost:9000", help="DynamoDB Local endpoint")
+    parser.add_argument("--format", choices=["sns", "raw"], default="sns", help="SNS enveloped or raw SQS bodies")
+    args = parser.parse_args()
+
+    results = run(args.batch_size, args.batches, args.devices, args.backend, args.endpoint, args.format)
+
+    for name, value in results.items():
+        print(f"{name:>30}: {value:,.2f}" if isinstance(value, float) else f"{name:>30}: {value}")
+
+
+if __name__ == "__main__":
+    main()
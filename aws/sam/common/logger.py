@@ -0,0 +1,31 @@
+"""
+Structured logger shared by the lambda functions
+
+Logs are emitted as JSON through the Powertools logger. The level is taken from POWERTOOLS_LOG_LEVEL and
+POWERTOOLS_LOGGER_SAMPLE_RATE can switch a fraction of invocations to DEBUG. Per-record logs are additionally sampled
+with RECORD_LOG_SAMPLE_RATE so even a debug invocation does not format and ship every item it writes.
+
+Author: Tom Aston
+"""
+
+import logging
+import os
+import random
+from typing import Any
+
+from aws_lambda_powertools import Logger
+
+logger = Logger(service=os.environ.get("POWERTOOLS_SERVICE_NAME", "rpi_cpu_metrics"))
+
+RECORD_LOG_SAMPLE_RATE = float(os.environ.get("RECORD_LOG_SAMPLE_RATE", "0.01"))
+
+
+def log_record_sampled(message: str, **fields: Any) -> None:
+    """debug log a single record, subject to the debug level and the per-record sample rate
+
+    Args:
+        message (str): log message
+        **fields (Any): structured fields to attach to the log line
+    """
+    if RECORD_LOG_SAMPLE_RATE and logger.isEnabledFor(logging.DEBUG) and random.random() < RECORD_LOG_SAMPLE_RATE:
+        logger.debug(message, extra=fields, stacklevel=3)  # report the caller rather than this helper
@@ -4,7 +4,15 @@ Author: Tom Aston
 """
 
 import json
-from typing import Any, TypedDict
+from typing import Any, NotRequired, TypedDict
+
+
+class BatchItemFailure(TypedDict):
+    """
+    SQS message the event source mapping should redeliver (ReportBatchItemFailures)
+    """
+
+    itemIdentifier: str
 
 
 class LambdaInvokeResponse(TypedDict):
@@ -15,18 +23,22 @@ class LambdaInvokeResponse(TypedDict):
     message: str
     status_code: int
     headers: dict
+    batchItemFailures: NotRequired[list[BatchItemFailure]]
 
 
-def create_response(status_code: int, message: dict[str, Any]) -> LambdaInvokeResponse:
+def create_response(
+    status_code: int, message: dict[str, Any], failed_message_ids: list[str] | None = None
+) -> LambdaInvokeResponse:
     """create a response dictionary
     Args:
         status_code (int): http status code
         message (dict[str, Any]): message to return
+        failed_message_ids (list[str] | None): SQS message ids to report as batch item failures
 
     Returns:
         dict: dictionary containing the response
     """
-    return LambdaInvokeResponse(
+    response = LambdaInvokeResponse(
         message=json.dumps(message),
         status_code=status_code,
         headers={
@@ -36,3 +48,8 @@ def create_response(status_code: int, message: dict[str, Any]) -> LambdaInvokeRe
             "Access-Control-Allow-Method": "*",
         },
     )
+
+    if failed_message_ids is not None:
+        response["batchItemFailures"] = [BatchItemFailure(itemIdentifier=id) for id in failed_message_ids]
+
+    return response
@@ -0,0 +1,167 @@
+"""
+Backfill the device#day keyed table from the legacy id keyed table
+
+Copies every item of the legacy table into the time-bucketed table, adding the device_day partition key and the
+timestamp_id sort key. The source is read with a parallel scan (one worker per Segment of TotalSegments) and each
+worker writes its pages with BatchWriteItem, retrying unprocessed items. Items are copied in DynamoDB typed form so no
+value is round-tripped through Python floats. The copy is idempotent and can be re-run after an interruption.
+
+With a retention (--retention-days, defaulting to the lambda's RETENTION_DAYS) each copied item gets the same
+expires_at TTL as newly ingested samples, computed from its own timestamp, so backfilled history ages out of the table
+too. Items already past their retention are removed by TTL shortly after the copy, so archive those days first.
+
+Usage (from aws/sam):
+    python -m migrations.backfill_device_day --source RpiCpuMetrics --target RpiCpuMetricsByDeviceDay --segments 8 \
+        --retention-days 30
+
+Author: Tom Aston
+"""
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any
+
+import boto3
+from botocore.config import Config
+from mypy_boto3_dynamodb import DynamoDBClient
+from rpi_cpu_metrics.batch_writer import write_put_requests
+from rpi_cpu_metrics.keys import (
+    PARTITION_KEY,
+    SORT_KEY,
+    TTL_ATTRIBUTE,
+    device_day_key,
+    expires_at,
+    timestamp_id_key,
+)
+
+
+def backfill(
+    client: DynamoDBClient, source: str, target: str, total_segments: int, retention_days: int | None = None
+) -> dict[str, int]:
+    """copy the source table into the target table with a parallel scan
+
+    Args:
+        client (DynamoDBClient): low-level client shared by the segment workers
+        source (str): legacy id keyed table
+        target (str): device#day keyed table
+        total_segments (int): number of parallel scan segments, one worker each
+        retention_days (int | None): days each item is kept after its timestamp before TTL removes it, no TTL if None
+
+    Returns:
+        dict[str, int]: number of items copied and skipped
+    """
+    with ThreadPoolExecutor(max_workers=total_segments, thread_name_prefix="backfill") as executor:
+        futures = [
+            executor.submit(_backfill_segment, client, source, target, segment, total_segments, retention_days)
+            for segment in range(total_segments)
+        ]
+        results = [future.result() for future in futures]
+
+    return {
+        "copied": sum(copied for copied, _ in results),
+        "skipped": sum(skipped for _, skipped in results),
+    }
+
+
+def _backfill_segment(
+    client: DynamoDBClient,
+    source: str,
+    target: str,
+    segment: int,
+    total_segments: int,
+    retention_days: int | None = None,
+) -> tuple[int, int]:
+    """copy a single scan segment page by page
+
+    Args:
+        client (DynamoDBClient): low-level client
+        source (str): legacy id keyed table
+        target (str): device#day keyed table
+        segment (int): segment this worker scans
+        total_segments (int): total number of segments
+        retention_days (int | None): days each item is kept after its timestamp, no TTL if None
+
+    Returns:
+        tuple[int, int]: items copied and items skipped for missing device, timestamp or id
+    """
+    copied = skipped = 0
+    paginator = client.get_paginator("scan")
+
+    for page in paginator.paginate(TableName=source, Segment=segment, TotalSegments=total_segments):
+        put_requests = []
+        for item in page.get("Items", []):
+            converted = to_time_series_item(item, retention_days)
+            if converted is None:
+                skipped += 1
+                continue
+            put_requests.append({"PutRequest": {"Item": converted}})
+
+        if put_requests:
+            write_put_requests(client, target, put_requests)
+            copied += len(put_requests)
+
+    print(f"segment {segment}/{total_segments} done: copied={copied} skipped={skipped}")
+    return copied, skipped
+
+
+def to_time_series_item(item: dict[str, Any], retention_days: int | None = None) -> dict[str, Any] | None:
+    """add the time-bucketed keys (and TTL) to a legacy item in DynamoDB typed form
+
+    Args:
+        item (dict[str, Any]): legacy item with typed attribute values
+        retention_days (int | None): days the item is kept after its timestamp before TTL removes it, no TTL if None
+
+    Returns:
+        dict[str, Any] | None: item with device_day, timestamp_id and expires_at, or None if it cannot be keyed
+    """
+    device = item.get("device", {}).get("S")
+    timestamp = item.get("timestamp", {}).get("N")
+    id = item.get("id", {}).get("S")
+
+    if not device or timestamp is None or not id:
+        return None
+
+    timestamp = int(Decimal(timestamp))
+
+    converted = {
+        **item,
+        PARTITION_KEY: {"S": device_day_key(device, timestamp)},
+        SORT_KEY: {"S": timestamp_id_key(timestamp, id)},
+    }
+    if retention_days is not None:
+        converted[TTL_ATTRIBUTE] = {"N": str(expires_at(timestamp, retention_days))}
+
+    return converted
+
+
+def main() -> None:
+    """
+    Backfill entry point
+    """
+    parser = argparse.ArgumentParser(description="Copy the legacy id keyed table into the device#day keyed table")
+    parser.add_argument("--source", default="RpiCpuMetrics", help="legacy id keyed table")
+    parser.add_argument("--target", default="RpiCpuMetricsByDeviceDay", help="device#day keyed table")
+    parser.add_argument("--segments", type=int, default=8, help="parallel scan segments (one thread each)")
+    parser.add_argument("--endpoint", default=None, help="DynamoDB endpoint override e.g. http://localhost:9000")
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=int(os.environ["RETENTION_DAYS"]) if os.environ.get("RETENTION_DAYS") else None,
+        help="days copied items are kept after their timestamp (TTL), defaults to RETENTION_DAYS, no TTL if unset",
+    )
+    args = parser.parse_args()
+
+    client: DynamoDBClient = boto3.client(
+        "dynamodb",
+        endpoint_url=args.endpoint,
+        config=Config(max_pool_connections=args.segments, retries={"mode": "adaptive"}),
+    )
+
+    results = backfill(client, args.source, args.target, args.segments, args.retention_days)
+    print(f"backfill complete: copied={results['copied']} skipped={results['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+module for concurrent chunked BatchWriteItem writes
+
+Large SQS batches are split into BatchWriteItem chunks of at most 25 put requests. The chunks are written concurrently
+through a bounded thread pool which shares a single low-level boto3 client (clients are thread safe, resources are not),
+so the client's max_pool_connections must be at least the number of workers. Each chunk retries its own
+UnprocessedItems with exponential backoff and jitter.
+
+A chunk that cannot be written fails on its own: write_items_concurrently reports the positions of its items so the
+caller can retry just those messages, the other chunks are still written.
+
+Author: Tom Aston
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, NamedTuple, Sequence
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
+from mypy_boto3_dynamodb import DynamoDBClient
+
+BATCH_WRITE_MAX_ITEMS = 25  # DynamoDB BatchWriteItem limit
+MAX_CHUNK_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 2.0
+
+_serializer = TypeSerializer()
+
+
+class UnprocessedItemsError(RuntimeError):
+    """
+    Raised when a chunk still has unprocessed items after all retries
+    """
+
+    pass
+
+
+class WriteResult(NamedTuple):
+    """
+    Outcome of a chunked write
+
+    failed holds the positions of the items in chunks that could not be written and errors the reason of each failed
+    chunk. Items in a failed chunk may still have been written by an earlier attempt.
+    """
+
+    calls: int
+    failed: list[int]
+    errors: list[Exception]
+
+
+def write_items_concurrently(
+    client: DynamoDBClient, table_name: str, items: Sequence[dict[str, Any]], executor: ThreadPoolExecutor
+) -> WriteResult:
+    """write the items with BatchWriteItem chunks spread over the executor
+
+    Args:
+        client (DynamoDBClient): shared low-level DynamoDB client
+        table_name (str): table to write to
+        items (Sequence[dict[str, Any]]): DynamoDB ready items (numbers as int/Decimal)
+        executor (ThreadPoolExecutor): bounded pool the chunks are written on
+
+    Returns:
+        WriteResult: BatchWriteItem calls made and the positions of the items that could not be written
+    """
+    put_requests = [{"PutRequest": {"Item": _serialize(item)}} for item in items]
+    return _write_chunks(client, table_name, put_requests, executor)
+
+
+def write_put_requests(
+    client: DynamoDBClient,
+    table_name: str,
+    put_requests: Sequence[dict[str, Any]],
+    executor: ThreadPoolExecutor | None = None,
+) -> int:
+    """write already serialized put requests in BatchWriteItem chunks
+
+    Args:
+        client (DynamoDBClient): shared low-level DynamoDB client
+        table_name (str): table to write to
+        put_requests (Sequence[dict[str, Any]]): PutRequest entries with DynamoDB typed attribute values
+        executor (ThreadPoolExecutor | None): bounded pool to spread the chunks over, chunks are written serially
+            on the calling thread if None
+
+    Raises:
+        UnprocessedItemsError: raised if any chunk still has unprocessed items after all retries
+        ClientError: raised if a chunk was rejected by DynamoDB
+        BotoCoreError: raised if a chunk could not be sent
+
+    Returns:
+        int: number of BatchWriteItem calls made
+    """
+    result = _write_chunks(client, table_name, put_requests, executor)
+
+    if result.errors:
+        raise result.errors[0]
+
+    return result.calls
+
+
+def _write_chunks(
+    client: DynamoDBClient,
+    table_name: str,
+    put_requests: Sequence[dict[str, Any]],
+    executor: ThreadPoolExecutor | None,
+) -> WriteResult:
+    """write the put requests in BatchWriteItem chunks, recording the chunks that fail rather than raising
+
+    Args:
+        client (DynamoDBClient): shared low-level DynamoDB client
+        table_name (str): table to write to
+        put_requests (Sequence[dict[str, Any]]): PutRequest entries with DynamoDB typed attribute values
+        executor (ThreadPoolExecutor | None): bounded pool to spread the chunks over, chunks are written serially
+            on the calling thread if None
+
+    Returns:
+        WriteResult: BatchWriteItem calls made, positions of the unwritten items and the chunk errors
+    """
+    starts = range(0, len(put_requests), BATCH_WRITE_MAX_ITEMS)
+    chunks = [list(put_requests[start : start + BATCH_WRITE_MAX_ITEMS]) for start in starts]
+
+    if executor is None or len(chunks) == 1:  # no point paying for a thread hand-off
+        outcomes = [_write_chunk(client, table_name, chunk) for chunk in chunks]
+    else:
+        futures = [executor.submit(_write_chunk, client, table_name, chunk) for chunk in chunks]
+        # wait for every chunk before surfacing an unexpected error so no write is left running unobserved
+        wait(futures)
+        outcomes = [future.result() for future in futures]
+
+    failed: list[int] = []
+    errors: list[Exception] = []
+    for start, chunk, (_, error) in zip(starts, chunks, outcomes):
+        if error is not None:
+            failed.extend(range(start, start + len(chunk)))
+            errors.append(error)
+
+    return WriteResult(calls=sum(calls for calls, _ in outcomes), failed=failed, errors=errors)
+
+
+def _write_chunk(
+    client: DynamoDBClient, table_name: str, requests: list[dict[str, Any]]
+) -> tuple[int, Exception | None]:
+    """write a single chunk, retrying unprocessed items with backoff
+
+    The error is returned instead of raised so one chunk does not fail the others. A call rejected by DynamoDB or that
+    could not be sent is still counted so the call metrics do not drop while errors happen.
+
+    Args:
+        client (DynamoDBClient): shared low-level DynamoDB client
+        table_name (str): table to write to
+        requests (list[dict[str, Any]]): at most 25 write requests
+
+    Returns:
+        tuple[int, Exception | None]: BatchWriteItem calls made and the error if the chunk failed, an
+            UnprocessedItemsError if items are still unprocessed after MAX_CHUNK_ATTEMPTS
+    """
+    for attempt in range(MAX_CHUNK_ATTEMPTS):
+        try:
+            response = client.batch_write_item(RequestItems={table_name: requests})
+        except (ClientError, BotoCoreError) as e:
+            return attempt + 1, e
+        requests = response.get("UnprocessedItems", {}).get(table_name, [])
+
+        if not requests:
+            return attempt + 1, None
+
+        # full jitter backoff before retrying what DynamoDB could not absorb
+        time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)))
+
+    return MAX_CHUNK_ATTEMPTS, UnprocessedItemsError(
+        f"{len(requests)} items still unprocessed after {MAX_CHUNK_ATTEMPTS} attempts"
+    )
+
+
+def _serialize(item: dict[str, Any]) -> dict[str, Any]:
+    """serialize an item into DynamoDB attribute values for the low-level client
+
+    Args:
+        item (dict[str, Any]): item with python values
+
+    Returns:
+        dict[str, Any]: item with DynamoDB typed attribute values
+    """
+    return {key: _serializer.serialize(value) for key, value in item.items()}
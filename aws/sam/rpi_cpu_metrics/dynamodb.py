@@ -5,92 +5,186 @@ Author: Tom Aston
 
 import json
 import os
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from typing import Any
+from typing import Any, NamedTuple
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
-from mypy_boto3_dynamodb import DynamoDBServiceResource
+from common.logger import log_record_sampled, logger
+from mypy_boto3_dynamodb import DynamoDBClient, DynamoDBServiceResource
+from rpi_cpu_metrics.batch_writer import write_items_concurrently
+from rpi_cpu_metrics.events import extract_messages
+from rpi_cpu_metrics.keys import TTL_ATTRIBUTE, expires_at, message_item_id, with_table_keys
+from rpi_cpu_metrics.quarantine import DECODE_STAGE, VALIDATE_STAGE, create_sink, quarantine, to_quarantine_record
+from rpi_cpu_metrics.rollups import update_rollups
 from rpi_cpu_metrics.schemas import CpuMetricMessageBody, SQSEvent
+from rpi_cpu_metrics.validation import validate_messages
+
+# one connection per writer thread so concurrent chunks never queue on the connection pool
+WRITE_MAX_WORKERS = int(os.environ.get("WRITE_MAX_WORKERS", "8"))
 
 try:
-    dynamo_db_client: DynamoDBServiceResource = boto3.resource("dynamodb")
+    dynamo_db_client: DynamoDBServiceResource = boto3.resource(
+        "dynamodb", config=Config(max_pool_connections=WRITE_MAX_WORKERS, retries={"mode": "standard"})
+    )
     CPU_METRIC_TABLE_NAME = os.environ["DB_TABLE_NAME"]
     cpu_metric_table = dynamo_db_client.Table(CPU_METRIC_TABLE_NAME)
 except KeyError:
     raise RuntimeError("DB_TABLE_NAME environment variable not set")
 
+# the low-level client is thread safe and shared by every writer thread, the pool is reused across warm invocations
+cpu_metric_client: DynamoDBClient = dynamo_db_client.meta.client
+write_executor = ThreadPoolExecutor(max_workers=WRITE_MAX_WORKERS, thread_name_prefix="dynamodb-writer")
+
+# rollups are optional so the function can still run against a single table locally
+ROLLUP_TABLE_NAME = os.environ.get("ROLLUP_TABLE_NAME")
+rollup_table = dynamo_db_client.Table(ROLLUP_TABLE_NAME) if ROLLUP_TABLE_NAME else None
+
+# raw samples expire from the table once archived to Parquet, unset keeps them forever
+RETENTION_DAYS = int(os.environ["RETENTION_DAYS"]) if os.environ.get("RETENTION_DAYS") else None
+
+# poison messages go to the quarantine table, or a local file when running without AWS
+QUARANTINE_TABLE_NAME = os.environ.get("QUARANTINE_TABLE_NAME")
+quarantine_sink = create_sink(
+    table=dynamo_db_client.Table(QUARANTINE_TABLE_NAME) if QUARANTINE_TABLE_NAME else None,
+    path=os.environ.get("QUARANTINE_FILE_PATH"),
+)
+
+
+class IngestResult(NamedTuple):
+    """
+    Outcome of putting the messages of an event into the table
+
+    failed_message_ids holds the SQS message ids to redeliver because their item or one of their rollup buckets could
+    not be written.
+    """
 
-def put_item(event: SQSEvent) -> CpuMetricMessageBody:
-    """put an item into the DynamoDB table
+    items: list[dict[str, Any]]
+    failed_message_ids: list[str]
+
+
+def put_items(event: SQSEvent | CpuMetricMessageBody) -> IngestResult:
+    """put every message in the event into the DynamoDB table and update the per-device rollups
+
+    Messages whose item or rollup update fails are reported rather than failing the batch, so only they are retried.
 
     Args:
-        event (SQSEvent): event data
+        event (SQSEvent | CpuMetricMessageBody): SQS event or direct IoT Rule event
+
+    Raises:
+        RuntimeError: raised if the event could not be written or a failed message cannot be reported on its own
+
+    Returns:
+        IngestResult: database items written and the message ids to redeliver
     """
     try:
-        database_item = __create_database_item(event)
+        database_items, sources = __create_database_items(event)
 
-        if not database_item:
-            raise ValueError("Issue parsing SQS event records")
+        if not database_items:
+            return IngestResult(items=[], failed_message_ids=[])
 
-        item = json.loads(
-            json.dumps(database_item), parse_float=Decimal
+        items = json.loads(
+            json.dumps(database_items), parse_float=Decimal
         )  # convert float to Decimal to avoid serialization issues
 
-        cpu_metric_table.put_item(Item=item)
-        print("Item successfully put into DynamoDB:", item)
-        return database_item
+        result = write_items_concurrently(cpu_metric_client, CPU_METRIC_TABLE_NAME, items, write_executor)
+        for error in result.errors:
+            logger.error("BatchWriteItem chunk failed", extra={"error": str(error)})
+
+        unwritten = set(result.failed)
+        written_items = [item for index, item in enumerate(database_items) if index not in unwritten]
+        failed_sources = [sources[index] for index in sorted(unwritten)]
+
+        for database_item in written_items:
+            log_record_sampled("Item put into DynamoDB", item=database_item)
+
+        # unwritten items are left out of the rollups, they are folded in when their message is redelivered
+        if rollup_table is not None:
+            rollup_failures = update_rollups(rollup_table, written_items)
+            failed_sources += [source for item, source in zip(database_items, sources) if item["id"] in rollup_failures]
     except ValueError as e:
-        print(f"ValueError: {e}")
+        logger.error("Invalid event records", extra={"error": str(e)})
         raise
     except ClientError as e:
-        print(f"DynamoDB ClientError: {e.response['Error']['Message']}")
+        logger.error("DynamoDB ClientError", extra={"error": e.response["Error"]["Message"]})
         raise RuntimeError("DynamoDB operation failed") from e
     except BotoCoreError as e:
-        print(f"BotoCoreError: {str(e)}")
+        logger.error("BotoCoreError", extra={"error": str(e)})
         raise RuntimeError(f"AWS SDK error occurred: {str(e)}") from e
     except Exception as e:
-        print(f"Unexpected Error: {str(e)}")
-        raise RuntimeError("Error putting item into DynamoDB")
+        logger.exception("Unexpected error putting items into DynamoDB")
+        raise RuntimeError("Error putting item into DynamoDB") from e
+
+    return IngestResult(items=written_items, failed_message_ids=_failed_message_ids(failed_sources))
+
+
+def _failed_message_ids(sources: list[dict[str, Any]]) -> list[str]:
+    """collect the SQS message ids of the records holding failed messages
+
+    Args:
+        sources (list[dict[str, Any]]): source records of the failed messages
+
+    Raises:
+        RuntimeError: raised if a failed message did not come from an SQS record, the whole event must then be retried
+
+    Returns:
+        list[str]: unique message ids in the order the records failed
+    """
+    if any("messageId" not in source for source in sources):
+        raise RuntimeError(f"{len(sources)} messages could not be written")
+
+    return list(dict.fromkeys(source["messageId"] for source in sources))
+
 
+def __create_database_items(
+    event: SQSEvent | CpuMetricMessageBody,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """parse through the event data and create the dictionaries to be inserted into the database
 
-def __create_database_item(event: SQSEvent) -> dict[str, Any] | None:
-    """parse through the event data and create a dictionary to be inserted into the database
+    Records that fail to decode or validate are quarantined rather than failing the batch. When RETENTION_DAYS is set
+    each item carries a TTL so DynamoDB removes it once it has been archived.
 
     Args:
-        event (SQSEvent): sqs event data
+        event (SQSEvent | CpuMetricMessageBody): SQS event or direct IoT Rule event
 
     Returns:
-        dict[str, Any]: database item
+        tuple[list[dict[str, Any]], list[dict[str, Any]]]: database items, one per valid message, and the record each
+            item came from
     """
-    for record in event["Records"]:
-        sns_message: dict = json.loads(record["body"])
-        if sns_message.get("Message"):
-            message_body: CpuMetricMessageBody = json.loads(sns_message["Message"])
-            cpu_usage = message_body.get("cpu_usage")
-            timestamp = message_body.get("timestamp")
-            device = message_body.get("device")
-            location = message_body.get("location")
-            unit = message_body.get("unit")
-            topic = message_body.get("topic")
-            loop_count = message_body.get("loop_count")
-            project = message_body.get("project")
-            version = message_body.get("version")
-            id = str(uuid.uuid4())
-
-            item = {
-                "device": device,
-                "timestamp": int(timestamp),
-                "cpu_usage": float(cpu_usage),
-                "id": id,
-                "location": location,
-                "unit": unit,
-                "topic": topic,
-                "loop_count": int(loop_count),
-                "project": project,
-                "version": version,
+    batch = extract_messages(event)
+    valid_messages, rejects = validate_messages(batch.messages)
+
+    quarantine(
+        quarantine_sink,
+        [to_quarantine_record(source, reason, DECODE_STAGE) for source, reason in batch.failures]
+        + [to_quarantine_record(batch.sources[reject.index], reject.reason, VALIDATE_STAGE) for reject in rejects],
+    )
+
+    rejected = {reject.index for reject in rejects}
+    sources = [source for index, source in enumerate(batch.sources) if index not in rejected]
+
+    database_items = [
+        with_table_keys(
+            {
+                "device": message_body["device"],
+                "timestamp": int(message_body["timestamp"]),
+                "cpu_usage": message_body["cpu_usage"],
+                "id": message_item_id(source),
+                "location": message_body["location"],
+                "unit": message_body["unit"],
+                "topic": message_body["topic"],
+                "loop_count": message_body["loop_count"],
+                "project": message_body["project"],
+                "version": message_body["version"],
             }
+        )
+        for message_body, source in zip(valid_messages, sources)
+    ]
+
+    if RETENTION_DAYS is not None:
+        for item in database_items:
+            item[TTL_ATTRIBUTE] = expires_at(item["timestamp"], RETENTION_DAYS)
 
-            print("Database item created within function:", item)
-            return item
+    return database_items, sources
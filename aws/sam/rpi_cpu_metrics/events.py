@@ -0,0 +1,107 @@
+"""
+module for decoding the ingest events into cpu metric messages
+
+The ingest function accepts three event shapes:
+    - SQS records whose body is an SNS envelope wrapping the message as a JSON string in "Message"
+    - SQS records whose body is the message itself (SNS raw message delivery)
+    - direct IoT Rule invocations where the event is the message itself
+
+The shape of an SQS body is detected per record, so a batch can mix envelopes still queued from before raw delivery was
+switched on with raw bodies. Raw delivery pays for a single json.loads per record instead of two and carries no
+envelope. Records that cannot be decoded are returned alongside the messages rather than failing the batch.
+
+Author: Tom Aston
+"""
+
+import json
+from enum import Enum
+from typing import Any, NamedTuple
+
+
+class EventFormat(Enum):
+    """
+    Ingest event shapes
+    """
+
+    SNS_ENVELOPE = "sns_envelope"
+    SQS_RAW = "sqs_raw"
+    IOT_RULE = "iot_rule"
+
+
+class DecodedBatch(NamedTuple):
+    """
+    Messages decoded from an ingest event
+
+    messages and sources are parallel lists, sources holding the SQS record (or IoT event) each message came from.
+    failures holds the source records that could not be decoded together with the reason. An SQS batch is reported as
+    SNS_ENVELOPE only if every decoded record was an envelope.
+    """
+
+    event_format: EventFormat
+    messages: list[Any]
+    sources: list[dict[str, Any]]
+    failures: list[tuple[dict[str, Any], str]]
+
+
+def is_iot_rule_event(event: dict[str, Any]) -> bool:
+    """check whether the event is a direct IoT Rule invocation carrying a single message
+
+    Args:
+        event (dict[str, Any]): lambda event
+
+    Returns:
+        bool: True if the event is a cpu metric message rather than an SQS batch
+    """
+    return "Records" not in event and "device" in event
+
+
+def extract_messages(event: dict[str, Any]) -> DecodedBatch:
+    """decode every message carried by the event
+
+    Records that cannot be decoded do not fail the batch, they are returned as failures with the reason so they can be
+    quarantined.
+
+    Args:
+        event (dict[str, Any]): SQS event or IoT Rule event
+
+    Returns:
+        DecodedBatch: detected format, decoded messages with their source records and the decode failures
+    """
+    if is_iot_rule_event(event):
+        return DecodedBatch(EventFormat.IOT_RULE, [event], [event], [])
+
+    records = event["Records"]
+    batch = DecodedBatch(EventFormat.SQS_RAW, [], [], [])
+    enveloped = 0
+
+    for record in records:
+        try:
+            body = json.loads(record["body"])
+            if _is_sns_envelope(body):
+                message = json.loads(body["Message"])
+                enveloped += 1
+            else:
+                message = body
+        except (ValueError, TypeError, KeyError) as e:
+            batch.failures.append((record, f"undecodable body: {e}"))
+            continue
+
+        batch.messages.append(message)
+        batch.sources.append(record)
+
+    if batch.messages and enveloped == len(batch.messages):
+        batch = batch._replace(event_format=EventFormat.SNS_ENVELOPE)
+
+    return batch
+
+
+def _is_sns_envelope(body: Any) -> bool:
+    """check whether a decoded SQS body is an SNS notification envelope
+
+    Args:
+        body (Any): decoded SQS body
+
+    Returns:
+        bool: True if the body wraps the message in "Message"
+    """
+    return isinstance(body, dict) and isinstance(body.get("Message"), str)
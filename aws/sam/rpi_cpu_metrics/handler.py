@@ -4,18 +4,25 @@ Author: Tom Aston
 """
 
 import os
+import time
 from http import HTTPStatus
 from typing import Any
 
 import rpi_cpu_metrics.dynamodb as CPU_METRICS_DB
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from common.logger import logger
 from common.schemas import LambdaInvokeResponse, create_response
-from rpi_cpu_metrics.schemas import SQSEvent
+from rpi_cpu_metrics.events import is_iot_rule_event
+from rpi_cpu_metrics.schemas import CpuMetricMessageBody, SQSEvent
 
 
-def handler(event: SQSEvent, context: LambdaContext) -> LambdaInvokeResponse:
+def handler(event: SQSEvent | CpuMetricMessageBody, context: LambdaContext) -> LambdaInvokeResponse:
     """lambda function handler for putting cpu metrics into a DynamoDB table
 
+    The event is either an SQS batch (SNS enveloped or raw message bodies) or a single message from a direct IoT Rule
+    invocation. Messages that could not be written are returned as batchItemFailures so SQS redelivers only them, any
+    other error is raised so the whole event is retried.
+
     Args:
         event (dict): dictionary containing the event data
         context (LambdaContext): lambda context object
@@ -29,21 +36,39 @@ def handler(event: SQSEvent, context: LambdaContext) -> LambdaInvokeResponse:
             message={"error": "missing required attributes"},
         )
 
+    started = time.perf_counter()
+    records = event.get("Records", [])
+    count = len(records) if "Records" in event else 1  # an IoT Rule event is a single message
+    written = 0
+
     try:
-        item = CPU_METRICS_DB.put_item(event=event)
+        result = CPU_METRICS_DB.put_items(event=event)
+        written = len(result.items)
 
         return create_response(
             status_code=HTTPStatus.OK,
-            message=item,
+            message={"processed": written, "failed": len(result.failed_message_ids)},
+            failed_message_ids=result.failed_message_ids,
         )
-    except Exception as e:
-        return create_response(
-            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
-            message={"error": str(e)},
+    except Exception:
+        logger.exception("Ingest batch failed")
+        raise
+    finally:
+        # one summary line per invocation instead of one line per record
+        logger.info(
+            "Ingest batch processed",
+            extra={
+                "request_id": getattr(context, "aws_request_id", None),
+                "count": count,
+                "written": written,
+                "failures": count - written,
+                "bytes": sum(len(record.get("body", "")) for record in records),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            },
         )
 
 
-def _check_all_attributes_present(event: SQSEvent) -> bool:
+def _check_all_attributes_present(event: SQSEvent | CpuMetricMessageBody) -> bool:
     """check all required attributes are present in the event
 
     Args:
@@ -52,4 +77,4 @@ def _check_all_attributes_present(event: SQSEvent) -> bool:
     Returns:
         bool: True if all attributes are present, False otherwise
     """
-    return event.get("Records") is not None
+    return event.get("Records") is not None or is_iot_rule_event(event)
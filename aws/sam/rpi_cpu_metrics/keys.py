@@ -0,0 +1,95 @@
+"""
+module for the time-bucketed cpu metric table keys
+
+Items are partitioned on device#day (UTC) with a sort key of the zero padded epoch seconds followed by the item id.
+A per-device time-range read is therefore a single-partition Query per day, and the id suffix keeps two samples from
+the same device in the same second from overwriting each other.
+
+Ids are derived from the SQS message id (or the IoT Rule event itself) rather than drawn at random, so a redelivered
+message overwrites the item written by its first delivery instead of duplicating it.
+
+Author: Tom Aston
+"""
+
+import json
+import time
+import uuid
+from typing import Any
+
+PARTITION_KEY = "device_day"
+SORT_KEY = "timestamp_id"
+ID_INDEX_NAME = "IdIndex"
+TTL_ATTRIBUTE = "expires_at"
+
+SECONDS_PER_DAY = 86400
+
+# namespace of the uuid5 item ids, fixed so the same message always maps to the same id
+ITEM_ID_NAMESPACE = uuid.UUID("6f1c2b8e-3d4a-5e6f-8a9b-0c1d2e3f4a5b")
+
+
+def device_day_key(device: str, timestamp: int) -> str:
+    """build the partition key for a sample
+
+    Args:
+        device (str): device name
+        timestamp (int): epoch seconds
+
+    Returns:
+        str: device#YYYY-MM-DD partition key
+    """
+    return f"{device}#{time.strftime('%Y-%m-%d', time.gmtime(timestamp))}"
+
+
+def timestamp_id_key(timestamp: int, id: str) -> str:
+    """build the sort key for a sample
+
+    Args:
+        timestamp (int): epoch seconds
+        id (str): item id
+
+    Returns:
+        str: zero padded timestamp#id sort key that orders lexicographically by time
+    """
+    return f"{timestamp:010d}#{id}"
+
+
+def message_item_id(source: dict[str, Any], position: int = 0) -> str:
+    """build the item id of a message from the record it was delivered in
+
+    Args:
+        source (dict[str, Any]): SQS record, or the IoT Rule event for a direct invocation
+        position (int): position of the message within its record
+
+    Returns:
+        str: uuid5 id that is the same on every delivery of the message
+    """
+    name = source.get("messageId") or json.dumps(source, sort_keys=True, default=str)
+    return str(uuid.uuid5(ITEM_ID_NAMESPACE, f"{name}#{position}"))
+
+
+def with_table_keys(item: dict[str, Any]) -> dict[str, Any]:
+    """add the partition and sort keys to an item holding device, timestamp and id
+
+    Args:
+        item (dict[str, Any]): database item
+
+    Returns:
+        dict[str, Any]: the same item with the table keys set
+    """
+    timestamp = int(item["timestamp"])
+    item[PARTITION_KEY] = device_day_key(item["device"], timestamp)
+    item[SORT_KEY] = timestamp_id_key(timestamp, item["id"])
+    return item
+
+
+def expires_at(timestamp: int, retention_days: int) -> int:
+    """build the TTL attribute value for a sample
+
+    Args:
+        timestamp (int): epoch seconds the sample was taken
+        retention_days (int): days the raw sample is kept in the table
+
+    Returns:
+        int: epoch seconds after which DynamoDB may delete the item
+    """
+    return int(timestamp) + retention_days * SECONDS_PER_DAY
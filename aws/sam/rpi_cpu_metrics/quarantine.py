@@ -0,0 +1,185 @@
+"""
+module for quarantining poison messages
+
+Records that cannot be decoded or fail validation are written to a quarantine sink with the reason and the raw body
+instead of only being logged, so they can be inspected and replayed with tools/replay_quarantine.py once the device or
+the schema is fixed.
+
+The sink is chosen from the environment:
+    - QUARANTINE_TABLE_NAME: DynamoDB table keyed on id
+    - QUARANTINE_FILE_PATH: local JSON lines file, a stand-in for running without AWS
+    - neither: rejects are only logged
+
+Author: Tom Aston
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Any, Iterator, Protocol
+
+from common.logger import logger
+from mypy_boto3_dynamodb.service_resource import Table
+from rpi_cpu_metrics.schemas import QuarantineRecord
+
+DECODE_STAGE = "decode"
+VALIDATE_STAGE = "validate"
+
+
+class QuarantineSink(Protocol):
+    """
+    Destination for records that could not be ingested
+    """
+
+    def put(self, records: list[QuarantineRecord]) -> None: ...
+
+    def scan(self) -> Iterator[QuarantineRecord]: ...
+
+    def delete(self, ids: list[str]) -> None: ...
+
+
+class DynamoDBQuarantineSink:
+    """
+    Quarantine sink backed by a DynamoDB table keyed on id
+    """
+
+    def __init__(self, table: Table) -> None:
+        self.table = table
+
+    def put(self, records: list[QuarantineRecord]) -> None:
+        """write the records to the quarantine table
+
+        Args:
+            records (list[QuarantineRecord]): records to quarantine
+        """
+        with self.table.batch_writer() as batch:
+            for record in records:
+                batch.put_item(Item=record)
+
+    def scan(self) -> Iterator[QuarantineRecord]:
+        """read every quarantined record
+
+        Yields:
+            QuarantineRecord: quarantined record
+        """
+        scan_kwargs: dict[str, Any] = {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            yield from response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def delete(self, ids: list[str]) -> None:
+        """remove replayed records from the quarantine table
+
+        Args:
+            ids (list[str]): ids of the records to remove
+        """
+        with self.table.batch_writer() as batch:
+            for record_id in ids:
+                batch.delete_item(Key={"id": record_id})
+
+
+class FileQuarantineSink:
+    """
+    Quarantine sink backed by a local JSON lines file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def put(self, records: list[QuarantineRecord]) -> None:
+        """append the records to the quarantine file
+
+        Args:
+            records (list[QuarantineRecord]): records to quarantine
+        """
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def scan(self) -> Iterator[QuarantineRecord]:
+        """read every quarantined record
+
+        Yields:
+            QuarantineRecord: quarantined record
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def delete(self, ids: list[str]) -> None:
+        """rewrite the quarantine file without the replayed records
+
+        Args:
+            ids (list[str]): ids of the records to remove
+        """
+        removed = set(ids)
+        remaining = [record for record in self.scan() if record["id"] not in removed]
+        with open(self.path, "w", encoding="utf-8") as f:
+            for record in remaining:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+def create_sink(table: Table | None = None, path: str | None = None) -> QuarantineSink | None:
+    """create the quarantine sink configured for this environment
+
+    Args:
+        table (Table | None): quarantine table, takes precedence over the file
+        path (str | None): quarantine file path
+
+    Returns:
+        QuarantineSink | None: sink, or None if quarantining is not configured
+    """
+    if table is not None:
+        return DynamoDBQuarantineSink(table)
+    if path:
+        return FileQuarantineSink(path)
+    return None
+
+
+def to_quarantine_record(source: dict[str, Any], reason: str, stage: str) -> QuarantineRecord:
+    """build the quarantine record for an SQS record or IoT Rule event
+
+    Args:
+        source (dict[str, Any]): SQS record, or the IoT Rule event itself
+        reason (str): why the record was rejected
+        stage (str): pipeline stage that rejected the record
+
+    Returns:
+        QuarantineRecord: record to quarantine
+    """
+    is_sqs_record = "body" in source and "messageId" in source
+    return {
+        "id": str(uuid.uuid4()),
+        "message_id": source["messageId"] if is_sqs_record else "",
+        "raw_body": source["body"] if is_sqs_record else json.dumps(source, default=str),
+        "reason": reason,
+        "stage": stage,
+        "event_source_arn": source.get("eventSourceARN", "") if is_sqs_record else "iot_rule",
+        "quarantined_at": int(time.time()),
+    }
+
+
+def quarantine(sink: QuarantineSink | None, records: list[QuarantineRecord]) -> None:
+    """log the rejected records and write them to the sink
+
+    A failure to write to the sink is raised rather than swallowed so the records are never silently dropped.
+
+    Args:
+        sink (QuarantineSink | None): quarantine sink, records are only logged if None
+        records (list[QuarantineRecord]): records to quarantine
+    """
+    for record in records:
+        logger.warning(
+            "Quarantined message",
+            extra={"message_id": record["message_id"], "stage": record["stage"], "reason": record["reason"]},
+        )
+
+    if sink is not None and records:
+        sink.put(records)
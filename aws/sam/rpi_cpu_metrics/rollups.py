@@ -0,0 +1,251 @@
+"""
+module for maintaining per-device cpu usage rollups
+
+Every sample written by the ingest function is also folded into per-minute and per-hour rollup items holding the
+count, sum, min and max of the cpu usage seen in that bucket. Samples are coalesced per bucket before writing so a
+batch of samples for one device costs one update per bucket rather than one per sample. Dashboards can then read
+O(buckets) items for long time ranges instead of every raw sample.
+
+SQS delivers at least once and failed messages are redelivered, so each bucket update carries a token derived from the
+ids of the samples it folds in. The token is added to the bucket's applied set in the same update, which is conditional
+on the token not being there yet, so redelivering the same samples does not count them twice. Ids are deterministic
+per SQS message, which makes a redelivered group produce the same token. A message is only redelivered on its own if
+one of its buckets failed; if it is then batched with different samples the buckets that had succeeded see a new token
+and count it again. That needs a partial rollup failure followed by a different batching and only skews those buckets.
+
+The applied set would otherwise grow with every batch a hot bucket sees, towards the 400 KB item limit and making each
+conditional update more expensive. Once it holds more than ROLLUP_MAX_APPLIED_TOKENS tokens it is rotated into a
+previous-generation set, replacing the older generation, so a bucket keeps at most twice that many tokens. Both sets
+are checked, so a redelivery is still recognised as long as fewer than ROLLUP_MAX_APPLIED_TOKENS updates reached the
+bucket since it was first applied, far more than happen within an SQS visibility timeout.
+
+Author: Tom Aston
+"""
+
+import hashlib
+from decimal import Decimal
+from typing import Any, Iterable
+
+from botocore.exceptions import BotoCoreError, ClientError
+from common.logger import logger
+from mypy_boto3_dynamodb.service_resource import Table
+from rpi_cpu_metrics.schemas import RollupAggregate
+
+# rollup granularity name -> bucket width in seconds
+ROLLUP_GRANULARITIES: dict[str, int] = {
+    "minute": 60,
+    "hour": 3600,
+}
+
+ROLLUP_PARTITION_KEY = "device_granularity"
+ROLLUP_SORT_KEY = "bucket_start"
+
+# tokens kept in the applied set before it is rotated into the previous generation
+ROLLUP_MAX_APPLIED_TOKENS = 64
+
+# count and sum are accumulated atomically; min and max are only seeded if the bucket is new
+ROLLUP_UPDATE_EXPRESSION = (
+    "ADD #count :count, #sum :sum, #applied :tokens "
+    "SET #min = if_not_exists(#min, :min), #max = if_not_exists(#max, :max)"
+)
+# the update is skipped if the same samples were already folded into the bucket
+ROLLUP_CONDITION_EXPRESSION = (
+    "(attribute_not_exists(#applied) OR NOT contains(#applied, :token)) "
+    "AND (attribute_not_exists(#applied_previous) OR NOT contains(#applied_previous, :token))"
+)
+ROLLUP_ATTRIBUTE_NAMES = {
+    "#count": "count",
+    "#sum": "sum",
+    "#min": "min",
+    "#max": "max",
+    "#applied": "applied",
+    "#applied_previous": "applied_previous",
+}
+# the applied set becomes the previous generation, the condition stops concurrent writers rotating it twice
+ROLLUP_ROTATE_EXPRESSION = "SET #applied_previous = #applied REMOVE #applied"
+ROLLUP_ROTATE_CONDITION_EXPRESSION = "size(#applied) > :max_tokens"
+
+
+def aggregate_rollups(items: Iterable[dict[str, Any]]) -> dict[tuple[str, int], RollupAggregate]:
+    """coalesce database items into one aggregate per device, granularity and bucket
+
+    Args:
+        items (Iterable[dict[str, Any]]): database items with id, device, timestamp and cpu_usage
+
+    Returns:
+        dict[tuple[str, int], RollupAggregate]: aggregates keyed on (device#granularity, bucket start)
+    """
+    aggregates: dict[tuple[str, int], RollupAggregate] = {}
+
+    for item in items:
+        cpu_usage = float(item["cpu_usage"])
+        timestamp = int(item["timestamp"])
+
+        for granularity, width in ROLLUP_GRANULARITIES.items():
+            key = (f"{item['device']}#{granularity}", timestamp - timestamp % width)
+            aggregate = aggregates.get(key)
+
+            if aggregate is None:
+                aggregates[key] = RollupAggregate(
+                    count=1, sum=cpu_usage, min=cpu_usage, max=cpu_usage, ids=[item["id"]]
+                )
+            else:
+                aggregate["count"] += 1
+                aggregate["sum"] += cpu_usage
+                aggregate["min"] = min(aggregate["min"], cpu_usage)
+                aggregate["max"] = max(aggregate["max"], cpu_usage)
+                aggregate["ids"].append(item["id"])
+
+    return aggregates
+
+
+def update_rollups(rollup_table: Table, items: Iterable[dict[str, Any]]) -> set[str]:
+    """fold the database items into the rollup table
+
+    A bucket that cannot be updated does not stop the others, the ids of its items are returned so their messages can
+    be redelivered.
+
+    Args:
+        rollup_table (Table): rollup table
+        items (Iterable[dict[str, Any]]): database items written in this batch
+
+    Returns:
+        set[str]: ids of the items whose buckets could not be updated
+    """
+    failed_ids: set[str] = set()
+
+    for (partition_key, bucket_start), aggregate in aggregate_rollups(items).items():
+        try:
+            _write_rollup(rollup_table, partition_key, bucket_start, aggregate)
+        except (ClientError, BotoCoreError) as e:
+            logger.warning(
+                "Rollup update failed", extra={"rollup": partition_key, "bucket_start": bucket_start, "error": str(e)}
+            )
+            failed_ids.update(aggregate["ids"])
+
+    return failed_ids
+
+
+def _write_rollup(rollup_table: Table, partition_key: str, bucket_start: int, aggregate: RollupAggregate) -> None:
+    """apply an aggregate to a single rollup bucket
+
+    The first update adds the count and sum and seeds min/max for a new bucket, unless the bucket already holds the
+    aggregate's token. DynamoDB has no atomic min/max so if the bucket already existed with a wider range than this
+    batch a conditional update tightens the bound, the condition making it safe against concurrent writers. A full
+    applied set is then rotated so the bucket's tokens stay bounded.
+
+    The token is recorded before the bounds are tightened, so if tightening fails the redelivered samples find their
+    token already applied. Both bounds are then tightened again, which is idempotent, instead of skipping the bucket.
+
+    Args:
+        rollup_table (Table): rollup table
+        partition_key (str): device#granularity partition key
+        bucket_start (int): bucket start epoch seconds
+        aggregate (RollupAggregate): aggregate for the bucket
+    """
+    key = {ROLLUP_PARTITION_KEY: partition_key, ROLLUP_SORT_KEY: bucket_start}
+    batch_min = _to_decimal(aggregate["min"])
+    batch_max = _to_decimal(aggregate["max"])
+    token = rollup_token(aggregate["ids"])
+
+    try:
+        response = rollup_table.update_item(
+            Key=key,
+            UpdateExpression=ROLLUP_UPDATE_EXPRESSION,
+            ConditionExpression=ROLLUP_CONDITION_EXPRESSION,
+            ExpressionAttributeNames=ROLLUP_ATTRIBUTE_NAMES,
+            ExpressionAttributeValues={
+                ":count": aggregate["count"],
+                ":sum": _to_decimal(aggregate["sum"]),
+                ":min": batch_min,
+                ":max": batch_max,
+                ":tokens": {token},
+                ":token": token,
+            },
+            ReturnValues="UPDATED_NEW",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        # a redelivery of samples already counted, the first delivery may have failed before tightening the bounds
+        _tighten_bound(rollup_table, key, "min", batch_min, ">")
+        _tighten_bound(rollup_table, key, "max", batch_max, "<")
+        return
+
+    stored = response.get("Attributes", {})
+
+    if stored.get("min", batch_min) > batch_min:
+        _tighten_bound(rollup_table, key, "min", batch_min, ">")
+    if stored.get("max", batch_max) < batch_max:
+        _tighten_bound(rollup_table, key, "max", batch_max, "<")
+    if len(stored.get("applied", ())) > ROLLUP_MAX_APPLIED_TOKENS:
+        _rotate_applied(rollup_table, key)
+
+
+def rollup_token(ids: Iterable[str]) -> str:
+    """build the idempotency token of the samples folded into a bucket by one update
+
+    Args:
+        ids (Iterable[str]): ids of the samples
+
+    Returns:
+        str: digest of the sorted ids, independent of the order the samples arrived in
+    """
+    return hashlib.blake2b("\n".join(sorted(ids)).encode(), digest_size=8).hexdigest()
+
+
+def _tighten_bound(rollup_table: Table, key: dict[str, Any], attribute: str, value: Decimal, comparison: str) -> None:
+    """conditionally replace a min/max bound if the stored value is still looser than the new one
+
+    Args:
+        rollup_table (Table): rollup table
+        key (dict[str, Any]): rollup item key
+        attribute (str): min or max
+        value (Decimal): new bound
+        comparison (str): comparison the stored value must satisfy against the new bound to be replaced
+    """
+    try:
+        rollup_table.update_item(
+            Key=key,
+            UpdateExpression="SET #bound = :value",
+            ConditionExpression=f"#bound {comparison} :value",
+            ExpressionAttributeNames={"#bound": attribute},
+            ExpressionAttributeValues={":value": value},
+        )
+    except ClientError as e:
+        # another writer already stored a tighter bound
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def _rotate_applied(rollup_table: Table, key: dict[str, Any]) -> None:
+    """move a full applied set to the previous generation, dropping the tokens of the generation before
+
+    Args:
+        rollup_table (Table): rollup table
+        key (dict[str, Any]): rollup item key
+    """
+    try:
+        rollup_table.update_item(
+            Key=key,
+            UpdateExpression=ROLLUP_ROTATE_EXPRESSION,
+            ConditionExpression=ROLLUP_ROTATE_CONDITION_EXPRESSION,
+            ExpressionAttributeNames={"#applied": "applied", "#applied_previous": "applied_previous"},
+            ExpressionAttributeValues={":max_tokens": ROLLUP_MAX_APPLIED_TOKENS},
+        )
+    except ClientError as e:
+        # another writer already rotated the set
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def _to_decimal(value: float) -> Decimal:
+    """convert a float to a Decimal for DynamoDB without binary float noise
+
+    Args:
+        value (float): value to convert
+
+    Returns:
+        Decimal: decimal value
+    """
+    return Decimal(str(value))
@@ -3,7 +3,15 @@ This module contains the dataclasses that represent the structure of the SQS eve
 Author: Tom Aston
 """
 
-from typing import Dict, List, TypedDict
+from typing import Dict, List, Literal
+
+from pydantic import FiniteFloat
+
+# pydantic can only validate TypedDicts from typing_extensions on Python < 3.12
+from typing_extensions import TypedDict
+
+# the API reads locations by fanning out over this set, so messages from any other location are quarantined
+Location = Literal["Home", "Office", "Factory"]
 
 
 class SQSEventRecord(TypedDict):
@@ -45,11 +53,14 @@ class SQSEvent(TypedDict):
 class CpuMetricMessageBody(TypedDict):
     """cpu metric message body
 
+    Validated in batches by rpi_cpu_metrics.validation, lax mode coerces numeric strings. NaN and infinity are rejected
+    so they are quarantined rather than failing the batch when the item is keyed or serialised.
+
     Keys:
-        cpu_usage: int
-        timestamp: float
+        cpu_usage: FiniteFloat
+        timestamp: FiniteFloat
         device: str
-        location: str
+        location: Location  # Home, Office or Factory
         unit: str
         topic: str
         loop_count: int
@@ -57,12 +68,52 @@ class CpuMetricMessageBody(TypedDict):
         version: str
     """
 
-    cpu_usage: int
-    timestamp: float
+    cpu_usage: FiniteFloat
+    timestamp: FiniteFloat
     device: str
-    location: str
+    location: Location
     unit: str
     topic: str
     loop_count: int
     project: str
     version: str
+
+
+class RollupAggregate(TypedDict):
+    """aggregate of the cpu usage samples that fall into a single rollup bucket
+
+    Keys:
+        count: int
+        sum: float
+        min: float
+        max: float
+        ids: list[str]  # ids of the samples folded in, used for the idempotency token
+    """
+
+    count: int
+    sum: float
+    min: float
+    max: float
+    ids: List[str]
+
+
+class QuarantineRecord(TypedDict):
+    """record that could not be ingested, kept with its raw body so it can be replayed once the cause is fixed
+
+    Keys:
+        id: str
+        message_id: str  # SQS message id, empty for IoT Rule events
+        raw_body: str  # body exactly as received
+        reason: str
+        stage: str  # "decode" or "validate"
+        event_source_arn: str
+        quarantined_at: int
+    """
+
+    id: str
+    message_id: str
+    raw_body: str
+    reason: str
+    stage: str
+    event_source_arn: str
+    quarantined_at: int
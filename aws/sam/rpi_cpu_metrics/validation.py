@@ -0,0 +1,51 @@
+"""
+module for validating batches of cpu metric messages
+
+A pydantic TypeAdapter over a list of CpuMetricMessageBody is compiled once at import (cold start) and validates and
+coerces a whole batch in a single call. Only when the batch fails is the error list used to split the batch into valid
+messages and rejects, so one bad message from a misconfigured device does not fail the whole invocation.
+
+Author: Tom Aston
+"""
+
+from typing import Any, NamedTuple
+
+from pydantic import TypeAdapter, ValidationError
+from rpi_cpu_metrics.schemas import CpuMetricMessageBody
+
+_message_batch_adapter = TypeAdapter(list[CpuMetricMessageBody])
+
+
+class RejectedMessage(NamedTuple):
+    """
+    Message that failed validation together with its position in the batch and the reason
+    """
+
+    index: int
+    message: Any
+    reason: str
+
+
+def validate_messages(messages: list[Any]) -> tuple[list[CpuMetricMessageBody], list[RejectedMessage]]:
+    """validate and coerce a batch of decoded messages
+
+    Args:
+        messages (list[Any]): decoded messages
+
+    Returns:
+        tuple[list[CpuMetricMessageBody], list[RejectedMessage]]: valid messages in batch order and the rejects
+    """
+    try:
+        return _message_batch_adapter.validate_python(messages), []
+    except ValidationError as e:
+        reasons: dict[int, list[str]] = {}
+        for error in e.errors(include_url=False):
+            index, *field = error["loc"]
+            reasons.setdefault(index, []).append(f"{'.'.join(map(str, field)) or 'message'}: {error['msg']}")
+
+    rejects = [RejectedMessage(index, messages[index], "; ".join(reasons[index])) for index in sorted(reasons)]
+    valid = _message_batch_adapter.validate_python(
+        [message for index, message in enumerate(messages) if index not in reasons]
+    )
+
+    return valid, rejects
@@ -0,0 +1,46 @@
+"""
+Global fixtures for the ingest lambda tests
+Author: Tom Aston
+"""
+
+import os
+from typing import Any
+from unittest.mock import Mock
+
+import pytest
+
+# rpi_cpu_metrics.dynamodb builds its table resources on import, so the environment has to be set before collection
+os.environ.setdefault("DB_TABLE_NAME", "TestTable")
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+
+
+@pytest.fixture
+def rollup_table() -> Mock:
+    """stubbed rollup table fixture
+
+    Returns:
+        Mock: table whose update_item returns no stored attributes
+    """
+    table = Mock()
+    table.update_item.return_value = {"Attributes": {}}
+    return table
+
+
+@pytest.fixture
+def message_body() -> dict[str, Any]:
+    """valid cpu metric message fixture
+
+    Returns:
+        dict[str, Any]: message body as published by the Raspberry Pi
+    """
+    return {
+        "cpu_usage": 12.5,
+        "timestamp": 1741046400,
+        "device": "raspberrypi",
+        "location": "Home",
+        "unit": "percent",
+        "topic": "rpi/cpu",
+        "loop_count": 1,
+        "project": "raspi-streamer",
+        "version": "1.0",
+    }
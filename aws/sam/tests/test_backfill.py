@@ -0,0 +1,37 @@
+"""
+Unit tests for the device#day backfill migration.
+Author: Tom Aston
+"""
+
+from migrations.backfill_device_day import to_time_series_item
+
+ITEM = {
+    "id": {"S": "abc"},
+    "device": {"S": "raspberrypi"},
+    "timestamp": {"N": "1741046400"},
+    "cpu_usage": {"N": "12.5"},
+}
+
+
+class TestUnitBackfill:
+    """
+    Unit tests for the device#day backfill migration
+    """
+
+    def test_item_is_keyed_by_device_day(self) -> None:
+        """test a legacy item gets the time-bucketed keys and no TTL without a retention"""
+        converted = to_time_series_item(ITEM)
+
+        assert converted["device_day"] == {"S": "raspberrypi#2025-03-04"}
+        assert converted["timestamp_id"] == {"S": "1741046400#abc"}
+        assert "expires_at" not in converted
+
+    def test_item_expires_from_its_timestamp(self) -> None:
+        """test a backfilled item expires a retention after its own timestamp, like an ingested sample"""
+        converted = to_time_series_item(ITEM, retention_days=30)
+
+        assert converted["expires_at"] == {"N": str(1741046400 + 30 * 86400)}
+
+    def test_item_without_a_timestamp_is_skipped(self) -> None:
+        """test an item that cannot be keyed is skipped"""
+        assert to_time_series_item({key: value for key, value in ITEM.items() if key != "timestamp"}, 30) is None
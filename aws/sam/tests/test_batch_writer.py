@@ -0,0 +1,158 @@
+"""
+Unit tests for the batch writer module.
+Author: Tom Aston
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Generator
+from unittest.mock import Mock, patch
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from rpi_cpu_metrics.batch_writer import (
+    MAX_CHUNK_ATTEMPTS,
+    UnprocessedItemsError,
+    write_items_concurrently,
+    write_put_requests,
+)
+
+
+def _items(count: int) -> list[dict[str, Any]]:
+    return [
+        {"device_day": "pi#2025-03-04", "timestamp_id": f"{index:05d}", "cpu_usage": index} for index in range(count)
+    ]
+
+
+class TestUnitBatchWriter:
+    """
+    Unit tests for the batch writer module in the ingest lambda
+    """
+
+    @pytest.fixture
+    def executor(self) -> Generator[ThreadPoolExecutor, None, None]:
+        """executor fixture
+
+        Yields:
+            ThreadPoolExecutor: executor for the chunks
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            yield executor
+
+    @pytest.fixture(autouse=True)
+    def no_sleep(self) -> Generator[None, None, None]:
+        """skip the backoff sleeps between retries
+
+        Yields:
+            None: sleep patched out for the test
+        """
+        with patch("rpi_cpu_metrics.batch_writer.time.sleep"):
+            yield
+
+    def test_items_split_into_chunks_of_25(self, executor: ThreadPoolExecutor) -> None:
+        """test the items are serialized and written in chunks of at most 25
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+        """
+        chunk_sizes: list[int] = []
+        lock = Lock()
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            with lock:
+                chunk_sizes.append(len(RequestItems["TestTable"]))
+            return {"UnprocessedItems": {}}
+
+        client = Mock()
+        client.batch_write_item.side_effect = batch_write_item
+
+        result = write_items_concurrently(client, "TestTable", _items(60), executor)
+
+        assert result.calls == 3
+        assert result.failed == []
+        assert sorted(chunk_sizes) == [10, 25, 25]
+        first_request = client.batch_write_item.call_args_list[0].kwargs["RequestItems"]["TestTable"][0]
+        assert first_request["PutRequest"]["Item"]["cpu_usage"] == {"N": "0"}
+
+    def test_unprocessed_items_retried(self) -> None:
+        """test only the unprocessed items of a chunk are retried"""
+        put_requests = [{"PutRequest": {"Item": {"timestamp_id": {"S": str(index)}}}} for index in range(3)]
+        client = Mock()
+        client.batch_write_item.side_effect = [{"UnprocessedItems": {"TestTable": put_requests[1:]}}, {}]
+
+        calls = write_put_requests(client, "TestTable", put_requests)
+
+        assert calls == 2
+        assert client.batch_write_item.call_args_list[1].kwargs == {"RequestItems": {"TestTable": put_requests[1:]}}
+
+    def test_chunk_fails_after_max_attempts(self, executor: ThreadPoolExecutor) -> None:
+        """test only the items of a chunk still unprocessed after the last attempt are reported as failed
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+        """
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            requests = RequestItems["TestTable"]
+            if requests[0]["PutRequest"]["Item"]["timestamp_id"] == {"S": "00000"}:
+                return {"UnprocessedItems": {"TestTable": requests}}
+            return {"UnprocessedItems": {}}
+
+        client = Mock()
+        client.batch_write_item.side_effect = batch_write_item
+
+        result = write_items_concurrently(client, "TestTable", _items(30), executor)
+
+        assert result.failed == list(range(25))
+        assert isinstance(result.errors[0], UnprocessedItemsError)
+        assert client.batch_write_item.call_count == MAX_CHUNK_ATTEMPTS + 1
+
+    def test_sdk_error_fails_only_its_chunk(self, executor: ThreadPoolExecutor) -> None:
+        """test a chunk that cannot be sent fails its own items while the other chunks are written
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+        """
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            if RequestItems["TestTable"][0]["PutRequest"]["Item"]["timestamp_id"] == {"S": "00025"}:
+                raise EndpointConnectionError(endpoint_url="https://dynamodb.eu-west-2.amazonaws.com")
+            return {"UnprocessedItems": {}}
+
+        client = Mock()
+        client.batch_write_item.side_effect = batch_write_item
+
+        result = write_items_concurrently(client, "TestTable", _items(60), executor)
+
+        assert result.failed == list(range(25, 50))
+        assert isinstance(result.errors[0], EndpointConnectionError)
+        assert result.calls == 3  # the failed call is counted
+
+    def test_sdk_error_after_retry_counts_every_call(self, executor: ThreadPoolExecutor) -> None:
+        """test a chunk rejected on a retry counts the call that left items unprocessed and the rejected call
+
+        Args:
+            executor (ThreadPoolExecutor): executor for the chunks
+        """
+
+        def batch_write_item(RequestItems: dict[str, Any]) -> dict[str, Any]:
+            if client.batch_write_item.call_count == 1:
+                return {"UnprocessedItems": {"TestTable": RequestItems["TestTable"][1:]}}
+            raise ClientError({"Error": {"Code": "InternalServerError", "Message": "error"}}, "BatchWriteItem")
+
+        client = Mock()
+        client.batch_write_item.side_effect = batch_write_item
+
+        result = write_items_concurrently(client, "TestTable", _items(3), executor)
+
+        assert result.calls == 2
+        assert result.failed == [0, 1, 2]
+        assert isinstance(result.errors[0], ClientError)
+
+    def test_put_requests_raise_on_failure(self) -> None:
+        """test write_put_requests raises the chunk error for callers that need every item written"""
+        client = Mock()
+        client.batch_write_item.return_value = {"UnprocessedItems": {"TestTable": [{"PutRequest": {"Item": {}}}]}}
+
+        with pytest.raises(UnprocessedItemsError):
+            write_put_requests(client, "TestTable", [{"PutRequest": {"Item": {}}}])
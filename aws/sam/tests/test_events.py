@@ -0,0 +1,99 @@
+"""
+Unit tests for the events module.
+Author: Tom Aston
+"""
+
+import json
+from typing import Any
+
+from rpi_cpu_metrics.events import EventFormat, extract_messages, is_iot_rule_event
+
+
+def _record(body: str, message_id: str = "m0") -> dict[str, Any]:
+    return {"messageId": message_id, "body": body}
+
+
+def _envelope(message: dict[str, Any]) -> str:
+    return json.dumps({"Type": "Notification", "Message": json.dumps(message)})
+
+
+class TestUnitEvents:
+    """
+    Unit tests for the events module in the ingest lambda
+    """
+
+    def test_iot_rule_event_is_its_own_message(self, message_body: dict[str, Any]) -> None:
+        """test a direct IoT Rule invocation is decoded as a single message sourced from the event
+
+        Args:
+            message_body (dict[str, Any]): IoT Rule event
+        """
+        batch = extract_messages(message_body)
+
+        assert is_iot_rule_event(message_body)
+        assert batch.event_format is EventFormat.IOT_RULE
+        assert batch.messages == [message_body]
+        assert batch.sources == [message_body]
+
+    def test_sns_envelopes_are_unwrapped(self, message_body: dict[str, Any]) -> None:
+        """test SNS enveloped bodies are unwrapped into their messages
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        records = [_record(_envelope(message_body), "m0"), _record(_envelope(message_body), "m1")]
+
+        batch = extract_messages({"Records": records})
+
+        assert batch.event_format is EventFormat.SNS_ENVELOPE
+        assert batch.messages == [message_body, message_body]
+        assert batch.sources == records
+
+    def test_raw_bodies_are_decoded(self, message_body: dict[str, Any]) -> None:
+        """test raw message delivery bodies are the messages themselves
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        batch = extract_messages({"Records": [_record(json.dumps(message_body))]})
+
+        assert batch.event_format is EventFormat.SQS_RAW
+        assert batch.messages == [message_body]
+
+    def test_mixed_batch_is_detected_per_record(self, message_body: dict[str, Any]) -> None:
+        """test a raw body after an envelope is decoded as raw rather than unwrapped to nothing
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        records = [_record(_envelope(message_body), "m0"), _record(json.dumps(message_body), "m1")]
+
+        batch = extract_messages({"Records": records})
+
+        assert batch.event_format is EventFormat.SQS_RAW
+        assert batch.messages == [message_body, message_body]
+        assert batch.failures == []
+
+    def test_undecodable_records_are_failures(self, message_body: dict[str, Any]) -> None:
+        """test records that are not JSON, or whose envelope does not wrap JSON, are returned as failures
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        bad_body = _record("not json", "m0")
+        bad_envelope = _record(json.dumps({"Message": "not json"}), "m1")
+        good = _record(json.dumps(message_body), "m2")
+
+        batch = extract_messages({"Records": [bad_body, bad_envelope, good]})
+
+        assert batch.messages == [message_body]
+        assert batch.sources == [good]
+        assert [source for source, _ in batch.failures] == [bad_body, bad_envelope]
+        assert all(reason.startswith("undecodable body") for _, reason in batch.failures)
+
+    def test_empty_batch(self) -> None:
+        """test an empty SQS batch decodes to nothing"""
+        batch = extract_messages({"Records": []})
+
+        assert batch.messages == []
+        assert batch.failures == []
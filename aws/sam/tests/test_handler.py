@@ -0,0 +1,85 @@
+"""
+Unit tests for the handler module.
+Author: Tom Aston
+"""
+
+from typing import Any, Generator
+from unittest.mock import Mock, patch
+
+import pytest
+from rpi_cpu_metrics import handler
+from rpi_cpu_metrics.dynamodb import IngestResult
+
+
+class TestUnitHandler:
+    """
+    Unit tests for the handler module in the ingest lambda
+    """
+
+    @pytest.fixture
+    def summary(self) -> Generator[Mock, None, None]:
+        """patched logger fixture
+
+        Yields:
+            Mock: logger whose info calls hold the batch summary
+        """
+        with patch.object(handler, "logger") as logger:
+            yield logger
+
+    @pytest.mark.parametrize(
+        "event, count",
+        [
+            ({"Records": []}, 0),
+            ({"Records": [{"body": "{}"}, {"body": "{}"}]}, 2),
+        ],
+    )
+    def test_summary_counts_records(self, summary: Mock, event: dict[str, Any], count: int) -> None:
+        """test the batch summary counts the records of an SQS event, including an empty one
+
+        Args:
+            summary (Mock): patched logger
+            event (dict[str, Any]): SQS event
+            count (int): expected record count
+        """
+        with patch.object(handler.CPU_METRICS_DB, "put_items", return_value=IngestResult([], [])):
+            handler.handler(event, None)
+
+        assert summary.info.call_args.kwargs["extra"]["count"] == count
+
+    def test_summary_counts_iot_rule_event_as_one(self, summary: Mock, message_body: dict[str, Any]) -> None:
+        """test a direct IoT Rule event counts as a single record
+
+        Args:
+            summary (Mock): patched logger
+            message_body (dict[str, Any]): IoT Rule event
+        """
+        with patch.object(handler.CPU_METRICS_DB, "put_items", return_value=IngestResult([message_body], [])):
+            handler.handler(message_body, None)
+
+        assert summary.info.call_args.kwargs["extra"]["count"] == 1
+        assert summary.info.call_args.kwargs["extra"]["failures"] == 0
+
+    def test_failed_messages_reported_as_batch_item_failures(self, summary: Mock) -> None:
+        """test messages that could not be written are returned for SQS to redeliver
+
+        Args:
+            summary (Mock): patched logger
+        """
+        event = {"Records": [{"messageId": "a", "body": "{}"}, {"messageId": "b", "body": "{}"}]}
+
+        with patch.object(handler.CPU_METRICS_DB, "put_items", return_value=IngestResult([{}], ["b"])):
+            response = handler.handler(event, None)
+
+        assert response["batchItemFailures"] == [{"itemIdentifier": "b"}]
+
+    def test_unexpected_error_is_raised(self, summary: Mock) -> None:
+        """test an error writing the batch is raised so the whole event is retried rather than deleted
+
+        Args:
+            summary (Mock): patched logger
+        """
+        with patch.object(handler.CPU_METRICS_DB, "put_items", side_effect=RuntimeError("DynamoDB operation failed")):
+            with pytest.raises(RuntimeError):
+                handler.handler({"Records": [{"messageId": "a", "body": "{}"}]}, None)
+
+        summary.exception.assert_called_once()
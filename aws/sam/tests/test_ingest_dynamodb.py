@@ -0,0 +1,121 @@
+"""
+Unit tests for the dynamodb module of the ingest lambda.
+Author: Tom Aston
+"""
+
+import json
+from typing import Any, Generator
+from unittest.mock import Mock, patch
+
+import pytest
+from rpi_cpu_metrics import dynamodb
+from rpi_cpu_metrics.batch_writer import UnprocessedItemsError, WriteResult
+
+
+def _event(messages: list[dict[str, Any]]) -> dict[str, Any]:
+    return {"Records": [{"messageId": f"m{index}", "body": json.dumps(m)} for index, m in enumerate(messages)]}
+
+
+class TestUnitIngestDynamoDB:
+    """
+    Unit tests for the dynamodb module in the ingest lambda
+    """
+
+    @pytest.fixture
+    def write(self) -> Generator[Mock, None, None]:
+        """patched batch writer fixture
+
+        Yields:
+            Mock: write_items_concurrently stand-in, every item written unless configured otherwise
+        """
+        with (
+            patch.object(dynamodb, "write_items_concurrently", return_value=WriteResult(1, [], [])) as write,
+            patch.object(dynamodb, "quarantine_sink"),
+        ):
+            yield write
+
+    def test_item_ids_are_stable_across_deliveries(self, write: Mock, message_body: dict[str, Any]) -> None:
+        """test a redelivered message is written with the id of its first delivery
+
+        Args:
+            write (Mock): patched batch writer
+            message_body (dict[str, Any]): valid message
+        """
+        event = _event([message_body, {**message_body, "timestamp": message_body["timestamp"] + 1}])
+
+        first = dynamodb.put_items(event)
+        second = dynamodb.put_items(event)
+
+        assert [item["id"] for item in first.items] == [item["id"] for item in second.items]
+        assert first.items[0]["id"] != first.items[1]["id"]
+
+    def test_unwritten_messages_are_reported(self, write: Mock, message_body: dict[str, Any]) -> None:
+        """test messages whose chunk failed are returned for redelivery and left out of the rollups
+
+        Args:
+            write (Mock): patched batch writer
+            message_body (dict[str, Any]): valid message
+        """
+        write.return_value = WriteResult(1, [1], [UnprocessedItemsError("1 items still unprocessed")])
+        rollup_table = Mock()
+
+        with (
+            patch.object(dynamodb, "rollup_table", rollup_table),
+            patch.object(dynamodb, "update_rollups", return_value=set()) as update_rollups,
+        ):
+            result = dynamodb.put_items(_event([message_body, message_body, message_body]))
+
+        assert result.failed_message_ids == ["m1"]
+        assert len(result.items) == 2
+        assert update_rollups.call_args.args[1] == result.items
+
+    def test_failed_rollups_are_reported(self, write: Mock, message_body: dict[str, Any]) -> None:
+        """test messages whose rollup buckets failed are returned for redelivery
+
+        Args:
+            write (Mock): patched batch writer
+            message_body (dict[str, Any]): valid message
+        """
+        with patch.object(dynamodb, "rollup_table", Mock()), patch.object(dynamodb, "update_rollups") as update_rollups:
+            update_rollups.side_effect = lambda table, items: {items[0]["id"]}
+            result = dynamodb.put_items(_event([message_body, message_body]))
+
+        assert result.failed_message_ids == ["m0"]
+
+    def test_failed_iot_rule_event_is_raised(self, write: Mock, message_body: dict[str, Any]) -> None:
+        """test a failed IoT Rule event raises as it cannot be reported as a batch item failure
+
+        Args:
+            write (Mock): patched batch writer
+            message_body (dict[str, Any]): IoT Rule event
+        """
+        write.return_value = WriteResult(1, [0], [UnprocessedItemsError("1 items still unprocessed")])
+
+        with pytest.raises(RuntimeError):
+            dynamodb.put_items(message_body)
+
+    def test_non_finite_messages_are_quarantined(self, write: Mock, message_body: dict[str, Any]) -> None:
+        """test a message with an infinite timestamp or NaN cpu usage is quarantined while the batch is written
+
+        Args:
+            write (Mock): patched batch writer
+            message_body (dict[str, Any]): valid message
+        """
+        body = json.dumps(message_body)
+        event = {
+            "Records": [
+                {"messageId": "m0", "body": body.replace(str(message_body["timestamp"]), "Infinity")},
+                {"messageId": "m1", "body": body.replace(str(message_body["cpu_usage"]), "NaN")},
+                {"messageId": "m2", "body": body},
+            ]
+        }
+
+        with patch.object(dynamodb, "quarantine") as quarantine:
+            result = dynamodb.put_items(event)
+
+        records = quarantine.call_args.args[1]
+        assert [record["message_id"] for record in records] == ["m0", "m1"]
+        assert records[0]["reason"].startswith("timestamp:")
+        assert records[1]["reason"].startswith("cpu_usage:")
+        assert len(result.items) == 1
+        assert result.failed_message_ids == []
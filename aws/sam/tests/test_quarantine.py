@@ -0,0 +1,114 @@
+"""
+Unit tests for the quarantine module.
+Author: Tom Aston
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock, Mock
+
+from rpi_cpu_metrics.quarantine import (
+    DECODE_STAGE,
+    VALIDATE_STAGE,
+    DynamoDBQuarantineSink,
+    FileQuarantineSink,
+    create_sink,
+    quarantine,
+    to_quarantine_record,
+)
+
+
+def _sqs_record(body: str = "not json") -> dict[str, Any]:
+    return {"messageId": "m0", "body": body, "eventSourceARN": "arn:aws:sqs:eu-west-2:000000000000:RpiCpuMetrics"}
+
+
+class TestUnitQuarantine:
+    """
+    Unit tests for the quarantine module in the ingest lambda
+    """
+
+    def test_sqs_record_keeps_raw_body(self) -> None:
+        """test an SQS record is quarantined with its message id, raw body and source"""
+        record = to_quarantine_record(_sqs_record(), "undecodable body", DECODE_STAGE)
+
+        assert record["message_id"] == "m0"
+        assert record["raw_body"] == "not json"
+        assert record["stage"] == DECODE_STAGE
+        assert record["event_source_arn"].endswith(":RpiCpuMetrics")
+
+    def test_iot_rule_event_is_serialized(self, message_body: dict[str, Any]) -> None:
+        """test an IoT Rule event is quarantined with the event itself as the raw body
+
+        Args:
+            message_body (dict[str, Any]): IoT Rule event
+        """
+        record = to_quarantine_record(message_body, "cpu_usage: invalid", VALIDATE_STAGE)
+
+        assert record["message_id"] == ""
+        assert json.loads(record["raw_body"]) == message_body
+        assert record["event_source_arn"] == "iot_rule"
+
+    def test_file_sink_round_trip(self, tmp_path: Path) -> None:
+        """test the file sink appends records, reads them back and removes replayed ones
+
+        Args:
+            tmp_path (Path): temporary directory
+        """
+        sink = FileQuarantineSink(str(tmp_path / "quarantine.jsonl"))
+        records = [to_quarantine_record(_sqs_record(), "bad", DECODE_STAGE) for _ in range(3)]
+
+        assert list(sink.scan()) == []
+        sink.put(records[:2])
+        sink.put(records[2:])
+        sink.delete([records[1]["id"]])
+
+        assert list(sink.scan()) == [records[0], records[2]]
+
+    def test_dynamodb_sink_scans_every_page(self) -> None:
+        """test the table sink follows LastEvaluatedKey until the scan is complete"""
+        table = Mock()
+        table.scan.side_effect = [{"Items": [{"id": "a"}], "LastEvaluatedKey": {"id": "a"}}, {"Items": [{"id": "b"}]}]
+
+        records = list(DynamoDBQuarantineSink(table).scan())
+
+        assert records == [{"id": "a"}, {"id": "b"}]
+        assert table.scan.call_args_list[1].kwargs == {"ExclusiveStartKey": {"id": "a"}}
+
+    def test_dynamodb_sink_writes_and_deletes_in_batches(self) -> None:
+        """test the table sink puts and deletes through the table batch writer"""
+        table = MagicMock()
+        batch = Mock()
+        table.batch_writer.return_value.__enter__.return_value = batch
+        record = to_quarantine_record(_sqs_record(), "bad", DECODE_STAGE)
+        sink = DynamoDBQuarantineSink(table)
+
+        sink.put([record])
+        sink.delete([record["id"]])
+
+        batch.put_item.assert_called_once_with(Item=record)
+        batch.delete_item.assert_called_once_with(Key={"id": record["id"]})
+
+    def test_create_sink_prefers_table(self, tmp_path: Path) -> None:
+        """test the table takes precedence over the file and neither disables the sink
+
+        Args:
+            tmp_path (Path): temporary directory
+        """
+        path = str(tmp_path / "quarantine.jsonl")
+
+        assert isinstance(create_sink(table=Mock(), path=path), DynamoDBQuarantineSink)
+        assert isinstance(create_sink(path=path), FileQuarantineSink)
+        assert create_sink() is None
+
+    def test_quarantine_without_sink_only_logs(self) -> None:
+        """test rejects are still accepted when no sink is configured"""
+        quarantine(None, [to_quarantine_record(_sqs_record(), "bad", DECODE_STAGE)])
+
+    def test_quarantine_skips_empty_put(self) -> None:
+        """test the sink is not called when the batch had no rejects"""
+        sink = Mock()
+
+        quarantine(sink, [])
+
+        sink.put.assert_not_called()
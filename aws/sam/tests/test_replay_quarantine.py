@@ -0,0 +1,113 @@
+"""
+Unit tests for the replay quarantine tool.
+Author: Tom Aston
+"""
+
+import importlib.util
+from pathlib import Path
+from typing import Any
+from unittest.mock import Mock, patch
+
+import pytest
+from rpi_cpu_metrics.quarantine import DECODE_STAGE, VALIDATE_STAGE, FileQuarantineSink, to_quarantine_record
+from rpi_cpu_metrics.schemas import QuarantineRecord
+
+# aws/ecs/tools shadows aws/sam/tools once both test trees are collected, so the tool is loaded from its path
+_spec = importlib.util.spec_from_file_location(
+    "sam_replay_quarantine", Path(__file__).resolve().parents[1] / "tools" / "replay_quarantine.py"
+)
+replay_quarantine = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(replay_quarantine)
+in_process_submitter, replay = replay_quarantine.in_process_submitter, replay_quarantine.replay
+
+
+class TestUnitReplayQuarantine:
+    """
+    Unit tests for the replay quarantine tool
+    """
+
+    @pytest.fixture
+    def sink(self, tmp_path: Path) -> FileQuarantineSink:
+        """file sink holding two decode and one validate reject
+
+        Args:
+            tmp_path (Path): temporary directory
+
+        Returns:
+            FileQuarantineSink: populated quarantine sink
+        """
+        sink = FileQuarantineSink(str(tmp_path / "quarantine.jsonl"))
+        sink.put(
+            [
+                to_quarantine_record({"messageId": f"m{index}", "body": "{}"}, reason, stage)
+                for index, (reason, stage) in enumerate(
+                    [
+                        ("undecodable body", DECODE_STAGE),
+                        ("undecodable body", DECODE_STAGE),
+                        ("cpu_usage: invalid", VALIDATE_STAGE),
+                    ]
+                )
+            ]
+        )
+        return sink
+
+    def test_dry_run_counts_by_stage(self, sink: FileQuarantineSink) -> None:
+        """test a dry run only counts the matching records
+
+        Args:
+            sink (FileQuarantineSink): populated quarantine sink
+        """
+        results = replay(sink, None, dry_run=True)
+
+        assert results == {DECODE_STAGE: 2, VALIDATE_STAGE: 1}
+        assert len(list(sink.scan())) == 3
+
+    def test_accepted_records_are_removed(self, sink: FileQuarantineSink) -> None:
+        """test only the records the submitter accepted are removed from the quarantine
+
+        Args:
+            sink (FileQuarantineSink): populated quarantine sink
+        """
+
+        def submit(records: list[QuarantineRecord]) -> list[str]:
+            return [records[0]["id"]]
+
+        results = replay(sink, submit, reason="undecodable", batch_size=1)
+
+        assert results == {"replayed": 2, "failed": 0}
+        assert [record["stage"] for record in sink.scan()] == [VALIDATE_STAGE]
+
+    def test_rejected_batches_are_kept(self, sink: FileQuarantineSink) -> None:
+        """test records the submitter did not accept stay quarantined
+
+        Args:
+            sink (FileQuarantineSink): populated quarantine sink
+        """
+        results = replay(sink, lambda records: [], batch_size=2)
+
+        assert results == {"replayed": 0, "failed": 3}
+        assert len(list(sink.scan())) == 3
+
+    def test_in_process_submitter_skips_batch_item_failures(self, sink: FileQuarantineSink) -> None:
+        """test records the handler reported as failed are not accepted
+
+        Args:
+            sink (FileQuarantineSink): populated quarantine sink
+        """
+        records = list(sink.scan())
+        response: dict[str, Any] = {"status_code": 200, "batchItemFailures": [{"itemIdentifier": "m1"}]}
+
+        with patch("rpi_cpu_metrics.handler.handler", Mock(return_value=response)) as handler:
+            accepted = in_process_submitter()(records)
+
+        assert accepted == [records[0]["id"], records[2]["id"]]
+        assert [record["messageId"] for record in handler.call_args.args[0]["Records"]] == ["m0", "m1", "m2"]
+
+    def test_in_process_submitter_accepts_nothing_on_error(self, sink: FileQuarantineSink) -> None:
+        """test no record is accepted if the handler raised
+
+        Args:
+            sink (FileQuarantineSink): populated quarantine sink
+        """
+        with patch("rpi_cpu_metrics.handler.handler", Mock(side_effect=RuntimeError("DynamoDB operation failed"))):
+            assert in_process_submitter()(list(sink.scan())) == []
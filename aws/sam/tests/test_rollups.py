@@ -0,0 +1,260 @@
+"""
+Unit tests for the rollups module.
+Author: Tom Aston
+"""
+
+from decimal import Decimal
+from typing import Any
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+from rpi_cpu_metrics.rollups import (
+    ROLLUP_CONDITION_EXPRESSION,
+    ROLLUP_MAX_APPLIED_TOKENS,
+    ROLLUP_ROTATE_EXPRESSION,
+    ROLLUP_UPDATE_EXPRESSION,
+    aggregate_rollups,
+    rollup_token,
+    update_rollups,
+)
+
+
+def _item(device: str, timestamp: int, cpu_usage: float) -> dict[str, Any]:
+    return {"id": f"{device}-{timestamp}", "device": device, "timestamp": timestamp, "cpu_usage": cpu_usage}
+
+
+def _client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "UpdateItem")
+
+
+class TestUnitRollups:
+    """
+    Unit tests for the rollups module in the ingest lambda
+    """
+
+    def test_aggregate_coalesces_samples_per_bucket(self) -> None:
+        """test samples of a device in the same bucket are folded into one aggregate per granularity"""
+        items = [_item("pi", 3600, 10.0), _item("pi", 3630, 30.0), _item("pi", 3660, 20.0), _item("other", 3600, 5.0)]
+
+        aggregates = aggregate_rollups(items)
+
+        assert aggregates[("pi#minute", 3600)] == {
+            "count": 2,
+            "sum": 40.0,
+            "min": 10.0,
+            "max": 30.0,
+            "ids": ["pi-3600", "pi-3630"],
+        }
+        assert aggregates[("pi#minute", 3660)]["count"] == 1
+        assert aggregates[("pi#hour", 3600)] == {
+            "count": 3,
+            "sum": 60.0,
+            "min": 10.0,
+            "max": 30.0,
+            "ids": ["pi-3600", "pi-3630", "pi-3660"],
+        }
+        assert aggregates[("other#hour", 3600)]["sum"] == 5.0
+        assert len(aggregates) == 5
+
+    def test_update_issues_one_update_per_bucket(self, rollup_table: Mock) -> None:
+        """test each bucket is written with a single update carrying the batch aggregate
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        failed = update_rollups(rollup_table, [_item("pi", 3600, 10.5), _item("pi", 3601, 20.5)])
+
+        token = rollup_token(["pi-3600", "pi-3601"])
+        assert failed == set()
+        assert rollup_table.update_item.call_count == 2
+        minute_update = rollup_table.update_item.call_args_list[0].kwargs
+        assert minute_update["Key"] == {"device_granularity": "pi#minute", "bucket_start": 3600}
+        assert minute_update["UpdateExpression"] == ROLLUP_UPDATE_EXPRESSION
+        assert minute_update["ConditionExpression"] == ROLLUP_CONDITION_EXPRESSION
+        assert minute_update["ExpressionAttributeValues"] == {
+            ":count": 2,
+            ":sum": Decimal("31.0"),
+            ":min": Decimal("10.5"),
+            ":max": Decimal("20.5"),
+            ":tokens": {token},
+            ":token": token,
+        }
+
+    def test_token_ignores_sample_order(self) -> None:
+        """test a redelivered group produces the same token whatever order its samples arrive in"""
+        assert rollup_token(["b", "a", "c"]) == rollup_token(["c", "b", "a"])
+        assert rollup_token(["a", "b"]) != rollup_token(["a", "b", "c"])
+
+    def test_already_applied_bucket_is_skipped(self, rollup_table: Mock) -> None:
+        """test a redelivery whose token is already in the bucket is neither counted nor reported as failed
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        rollup_table.update_item.side_effect = _client_error("ConditionalCheckFailedException")
+
+        failed = update_rollups(rollup_table, [_item("pi", 0, 20.0)])
+
+        assert failed == set()
+        updates = [call.kwargs["UpdateExpression"] for call in rollup_table.update_item.call_args_list]
+        # count and sum are not added again, min and max are tightened again for the minute and hour buckets
+        assert updates.count(ROLLUP_UPDATE_EXPRESSION) == 2
+        assert updates.count("SET #bound = :value") == 4
+
+    def test_redelivery_tightens_bounds_after_failed_tightening(self, rollup_table: Mock) -> None:
+        """test a bound left loose by a failed tightening is tightened when the message is redelivered
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        item = _item("pi", 0, 20.0)
+        rollup_table.update_item.side_effect = [
+            {"Attributes": {"min": Decimal("50"), "max": Decimal("50"), "applied": {"token"}}},
+            _client_error("ProvisionedThroughputExceededException"),
+            {"Attributes": {"min": Decimal("20"), "max": Decimal("20")}},
+        ]
+        assert update_rollups(rollup_table, [item]) == {"pi-0"}
+
+        rollup_table.update_item.reset_mock()
+        rollup_table.update_item.side_effect = [
+            _client_error("ConditionalCheckFailedException"),
+            None,
+            _client_error("ConditionalCheckFailedException"),
+            _client_error("ConditionalCheckFailedException"),
+            None,
+            _client_error("ConditionalCheckFailedException"),
+        ]
+
+        assert update_rollups(rollup_table, [item]) == set()
+        minute_min = rollup_table.update_item.call_args_list[1].kwargs
+        assert minute_min["Key"] == {"device_granularity": "pi#minute", "bucket_start": 0}
+        assert minute_min["ExpressionAttributeNames"] == {"#bound": "min"}
+        assert minute_min["ConditionExpression"] == "#bound > :value"
+        assert minute_min["ExpressionAttributeValues"] == {":value": Decimal("20.0")}
+
+    def test_failed_bucket_reports_its_items(self, rollup_table: Mock) -> None:
+        """test the items of a bucket that could not be updated are returned while the other buckets are written
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+
+        def update_item(Key: dict[str, Any], **kwargs: Any) -> dict[str, Any]:
+            if Key["device_granularity"] == "pi#hour":
+                raise _client_error("ProvisionedThroughputExceededException")
+            return {"Attributes": {}}
+
+        rollup_table.update_item.side_effect = update_item
+
+        failed = update_rollups(rollup_table, [_item("pi", 0, 20.0), _item("pi", 60, 30.0), _item("other", 0, 5.0)])
+
+        assert failed == {"pi-0", "pi-60"}
+        assert rollup_table.update_item.call_count == 5
+
+    @pytest.mark.parametrize(
+        "stored, attribute, comparison",
+        [
+            ({"min": Decimal("5"), "max": Decimal("10")}, "max", "<"),
+            ({"min": Decimal("30"), "max": Decimal("50")}, "min", ">"),
+        ],
+    )
+    def test_looser_stored_bound_is_tightened(
+        self, rollup_table: Mock, stored: dict[str, Decimal], attribute: str, comparison: str
+    ) -> None:
+        """test a stored min/max looser than the batch is replaced with a conditional update
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+            stored (dict[str, Decimal]): bounds already stored in the bucket
+            attribute (str): bound expected to be tightened
+            comparison (str): condition expected on the tightening update
+        """
+        rollup_table.update_item.return_value = {"Attributes": stored}
+
+        update_rollups(rollup_table, [_item("pi", 0, 20.0)])
+
+        tightened = [
+            call.kwargs
+            for call in rollup_table.update_item.call_args_list
+            if "#bound" in call.kwargs["ExpressionAttributeNames"]
+        ]
+        assert len(tightened) == 2  # once for the minute and once for the hour bucket
+        assert tightened[0]["ExpressionAttributeNames"] == {"#bound": attribute}
+        assert tightened[0]["ConditionExpression"] == f"#bound {comparison} :value"
+        assert tightened[0]["ExpressionAttributeValues"] == {":value": Decimal("20.0")}
+
+    def test_failed_tightening_condition_is_ignored(self, rollup_table: Mock) -> None:
+        """test a concurrent writer having stored a tighter bound does not fail the update
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        rollup_table.update_item.side_effect = [
+            {"Attributes": {"min": Decimal("50"), "max": Decimal("50")}},
+            _client_error("ConditionalCheckFailedException"),
+            {"Attributes": {"min": Decimal("20"), "max": Decimal("20")}},
+        ]
+
+        update_rollups(rollup_table, [_item("pi", 0, 20.0)])
+
+        assert rollup_table.update_item.call_count == 3
+
+    def test_other_tightening_errors_fail_the_bucket(self, rollup_table: Mock) -> None:
+        """test errors other than a failed condition on the tightening update fail the bucket
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        rollup_table.update_item.side_effect = [
+            {"Attributes": {"min": Decimal("50"), "max": Decimal("50")}},
+            _client_error("ProvisionedThroughputExceededException"),
+            {"Attributes": {}},
+        ]
+
+        assert update_rollups(rollup_table, [_item("pi", 0, 20.0)]) == {"pi-0"}
+
+    def test_full_applied_set_is_rotated(self, rollup_table: Mock) -> None:
+        """test an applied set over the token limit is moved to the previous generation so it stays bounded
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        tokens = {f"token-{index}" for index in range(ROLLUP_MAX_APPLIED_TOKENS + 1)}
+        rollup_table.update_item.side_effect = [{"Attributes": {"applied": tokens}}, {}, {"Attributes": {}}]
+
+        assert update_rollups(rollup_table, [_item("pi", 0, 20.0)]) == set()
+
+        rotate = rollup_table.update_item.call_args_list[1].kwargs
+        assert rotate["Key"] == {"device_granularity": "pi#minute", "bucket_start": 0}
+        assert rotate["UpdateExpression"] == ROLLUP_ROTATE_EXPRESSION
+        assert rotate["ExpressionAttributeValues"] == {":max_tokens": ROLLUP_MAX_APPLIED_TOKENS}
+        assert rollup_table.update_item.call_count == 3
+
+    def test_applied_set_under_the_limit_is_not_rotated(self, rollup_table: Mock) -> None:
+        """test an applied set within the token limit is left in place
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        tokens = {f"token-{index}" for index in range(ROLLUP_MAX_APPLIED_TOKENS)}
+        rollup_table.update_item.return_value = {"Attributes": {"applied": tokens}}
+
+        update_rollups(rollup_table, [_item("pi", 0, 20.0)])
+
+        assert rollup_table.update_item.call_count == 2
+
+    def test_concurrent_rotation_is_ignored(self, rollup_table: Mock) -> None:
+        """test a set already rotated by another writer does not fail the bucket
+
+        Args:
+            rollup_table (Mock): stubbed rollup table
+        """
+        tokens = {f"token-{index}" for index in range(ROLLUP_MAX_APPLIED_TOKENS + 1)}
+        rollup_table.update_item.side_effect = [
+            {"Attributes": {"applied": tokens}},
+            _client_error("ConditionalCheckFailedException"),
+            {"Attributes": {}},
+        ]
+
+        assert update_rollups(rollup_table, [_item("pi", 0, 20.0)]) == set()
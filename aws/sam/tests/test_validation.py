@@ -0,0 +1,98 @@
+"""
+Unit tests for the validation module.
+Author: Tom Aston
+"""
+
+from typing import Any
+
+import pytest
+from rpi_cpu_metrics.validation import RejectedMessage, validate_messages
+
+
+class TestUnitValidation:
+    """
+    Unit tests for the validation module in the ingest lambda
+    """
+
+    def test_valid_batch_is_coerced(self, message_body: dict[str, Any]) -> None:
+        """test a valid batch passes in one call with numeric strings coerced
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        coerced = {**message_body, "cpu_usage": "42.5", "loop_count": "3"}
+
+        valid, rejects = validate_messages([message_body, coerced])
+
+        assert rejects == []
+        assert valid[1]["cpu_usage"] == 42.5
+        assert valid[1]["loop_count"] == 3
+
+    def test_invalid_messages_are_split_out(self, message_body: dict[str, Any]) -> None:
+        """test invalid messages are rejected with their position and reason while the rest stay in order
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        missing_device = {key: value for key, value in message_body.items() if key != "device"}
+        bad_usage = {**message_body, "cpu_usage": "high"}
+        second = {**message_body, "timestamp": message_body["timestamp"] + 1}
+
+        valid, rejects = validate_messages([message_body, missing_device, second, bad_usage])
+
+        assert valid == [message_body, second]
+        assert [reject.index for reject in rejects] == [1, 3]
+        assert rejects[0].message == missing_device
+        assert rejects[0].reason == "device: Field required"
+        assert rejects[1].reason.startswith("cpu_usage:")
+
+    def test_non_object_message_is_rejected(self, message_body: dict[str, Any]) -> None:
+        """test a message that is not an object is rejected as a whole
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        valid, rejects = validate_messages([[1, 2], message_body])
+
+        assert valid == [message_body]
+        assert rejects == [RejectedMessage(0, [1, 2], rejects[0].reason)]
+        assert rejects[0].reason.startswith("message:")
+
+    def test_every_error_of_a_message_is_reported(self, message_body: dict[str, Any]) -> None:
+        """test a message with several invalid fields is rejected once with every reason
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        _, rejects = validate_messages([{**message_body, "cpu_usage": "high", "loop_count": "many"}])
+
+        assert len(rejects) == 1
+        assert "cpu_usage:" in rejects[0].reason
+        assert "; loop_count:" in rejects[0].reason
+
+    @pytest.mark.parametrize("field", ["cpu_usage", "timestamp"])
+    @pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf"), "NaN", "Infinity"])
+    def test_non_finite_numbers_are_rejected(self, message_body: dict[str, Any], field: str, value: Any) -> None:
+        """test NaN and infinity are rejected instead of failing the batch when the item is keyed or serialised
+
+        Args:
+            message_body (dict[str, Any]): valid message
+            field (str): numeric field set to a non-finite value
+            value (Any): non-finite value, as a float or a string coerced in lax mode
+        """
+        valid, rejects = validate_messages([{**message_body, field: value}, message_body])
+
+        assert valid == [message_body]
+        assert [reject.index for reject in rejects] == [0]
+        assert rejects[0].reason.startswith(f"{field}:")
+
+    def test_unknown_location_is_rejected(self, message_body: dict[str, Any]) -> None:
+        """test a message from a location the API cannot read by location is rejected
+
+        Args:
+            message_body (dict[str, Any]): valid message
+        """
+        valid, rejects = validate_messages([{**message_body, "location": "Garage"}])
+
+        assert valid == []
+        assert rejects[0].reason.startswith("location:")
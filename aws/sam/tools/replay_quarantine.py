@@ -0,0 +1,145 @@
+"""
+Replay quarantined ingest records
+
+Reads the records held in the quarantine sink (DynamoDB table or local JSON lines file) and re-submits their raw bodies,
+either to the ingest queue with SendMessageBatch or in-process through the ingest handler. Records are removed from the
+quarantine once they have been re-submitted; a record that is still invalid is quarantined again by the handler with a
+fresh reason.
+
+Usage (from aws/sam):
+    python -m tools.replay_quarantine --table RpiCpuMetricQuarantine --queue-url <url> [--reason cpu_usage] [--dry-run]
+    python -m tools.replay_quarantine --file quarantine.jsonl --in-process
+
+Author: Tom Aston
+"""
+
+import argparse
+from collections import Counter
+from typing import Callable
+
+import boto3
+from rpi_cpu_metrics.quarantine import QuarantineSink, create_sink
+from rpi_cpu_metrics.schemas import QuarantineRecord
+
+SQS_SEND_BATCH_MAX = 10
+
+
+def replay(
+    sink: QuarantineSink,
+    submit: Callable[[list[QuarantineRecord]], list[str]] | None,
+    reason: str | None = None,
+    batch_size: int = SQS_SEND_BATCH_MAX,
+    dry_run: bool = False,
+) -> Counter[str]:
+    """re-submit quarantined records and remove the ones that were accepted
+
+    Args:
+        sink (QuarantineSink): quarantine sink to read from
+        submit (Callable[[list[QuarantineRecord]], list[str]] | None): re-submits a batch and returns the accepted ids,
+            not needed on a dry run
+        reason (str | None): only replay records whose reason contains this text
+        batch_size (int): records per submit call
+        dry_run (bool): only count the matching records by stage
+
+    Returns:
+        Counter[str]: number of records replayed, failed (or matched on a dry run) per outcome
+    """
+    records = [record for record in sink.scan() if reason is None or reason in record["reason"]]
+    results: Counter[str] = Counter()
+
+    if dry_run or submit is None:
+        results.update(record["stage"] for record in records)
+        return results
+
+    for start in range(0, len(records), batch_size):
+        batch = records[start : start + batch_size]
+        accepted = submit(batch)
+        if accepted:
+            sink.delete(accepted)
+        results["replayed"] += len(accepted)
+        results["failed"] += len(batch) - len(accepted)
+
+    return results
+
+
+def sqs_submitter(queue_url: str, endpoint: str | None = None) -> Callable[[list[QuarantineRecord]], list[str]]:
+    """create a submitter that sends the raw bodies back to the ingest queue
+
+    Args:
+        queue_url (str): ingest queue url
+        endpoint (str | None): SQS endpoint override
+
+    Returns:
+        Callable[[list[QuarantineRecord]], list[str]]: submitter returning the ids SQS accepted
+    """
+    client = boto3.client("sqs", endpoint_url=endpoint)
+
+    def submit(records: list[QuarantineRecord]) -> list[str]:
+        response = client.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[{"Id": str(index), "MessageBody": record["raw_body"]} for index, record in enumerate(records)],
+        )
+        return [records[int(entry["Id"])]["id"] for entry in response.get("Successful", [])]
+
+    return submit
+
+
+def in_process_submitter() -> Callable[[list[QuarantineRecord]], list[str]]:
+    """create a submitter that runs the raw bodies through the ingest handler in this process
+
+    DB_TABLE_NAME (and optionally ROLLUP_TABLE_NAME / QUARANTINE_TABLE_NAME) must be set as for the function.
+
+    Returns:
+        Callable[[list[QuarantineRecord]], list[str]]: submitter returning the ids the handler did not report as failed
+    """
+    from rpi_cpu_metrics.handler import handler
+
+    def submit(records: list[QuarantineRecord]) -> list[str]:
+        message_ids = [record["message_id"] or record["id"] for record in records]
+        event = {"Records": [{"messageId": id, "body": record["raw_body"]} for id, record in zip(message_ids, records)]}
+        try:
+            response = handler(event, None)
+        except Exception:
+            return []
+
+        failed = {failure["itemIdentifier"] for failure in response.get("batchItemFailures", [])}
+        return [record["id"] for id, record in zip(message_ids, records) if id not in failed]
+
+    return submit
+
+
+def main() -> None:
+    """
+    Replay entry point
+    """
+    parser = argparse.ArgumentParser(description="Re-submit quarantined ingest records")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--table", help="quarantine DynamoDB table")
+    source.add_argument("--file", help="quarantine JSON lines file")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--queue-url", help="ingest queue to send the raw bodies to")
+    target.add_argument("--in-process", action="store_true", help="run the raw bodies through the handler locally")
+    parser.add_argument("--reason", default=None, help="only replay records whose reason contains this text")
+    parser.add_argument("--dry-run", action="store_true", help="count the matching records without replaying them")
+    parser.add_argument("--endpoint", default=None, help="AWS endpoint override e.g. http://localhost:4566")
+    args = parser.parse_args()
+
+    if not args.dry_run and not (args.queue_url or args.in_process):
+        parser.error("one of --queue-url or --in-process is required unless --dry-run is set")
+
+    table = boto3.resource("dynamodb", endpoint_url=args.endpoint).Table(args.table) if args.table else None
+    sink = create_sink(table=table, path=args.file)
+
+    if args.dry_run:
+        submit = None
+    elif args.queue_url:
+        submit = sqs_submitter(args.queue_url, args.endpoint)
+    else:
+        submit = in_process_submitter()
+
+    results = replay(sink, submit, reason=args.reason, dry_run=args.dry_run)
+    print(f"replay {'dry run' if args.dry_run else 'complete'}: " + " ".join(f"{k}={v}" for k, v in results.items()))
+
+
+if __name__ == "__main__":
+    main()